@@ -0,0 +1,238 @@
+"""
+Admission control for CPU-heavy routes.
+
+Each policy (extraction, upload, auth) limits, per worker process:
+
+    concurrency    requests running at once, across all users
+    per_user       requests running at once for one user
+    rate, burst    a token bucket per user: sustained requests/second and burst
+
+Routes opt in with dependencies=[Depends(extraction_admission)]. A request
+over a limit waits up to ADMISSION_MAX_WAIT seconds for a token or a slot,
+then gets 429 (its own rate or concurrency) or 503 (the worker is full) with
+Retry-After. Free slots go to the longest-waiting request whose user is under
+their own limit, so one user's backlog never holds up anyone else.
+
+Users are the bearer token's email, or the client address on routes that
+run before login. Behind a reverse proxy, list it in WEB_FORWARDED_ALLOW_IPS
+so the address comes from X-Forwarded-For; otherwise every client shares the
+proxy's limits. State is in memory only, so with N workers the effective
+limits are N times these.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Callable, Deque, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from .auth import email_from_token
+from .config import settings
+from .metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+MAX_TRACKED_USERS = 10000  # token buckets kept per policy; the least recently seen are dropped
+
+REJECTIONS = {
+    "rate": (status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests, slow down"),
+    "user": (status.HTTP_429_TOO_MANY_REQUESTS, "Too many of your requests are already running"),
+    "capacity": (status.HTTP_503_SERVICE_UNAVAILABLE, "Server is busy, try again shortly"),
+}
+
+
+def client_key(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def user_key(request: Request) -> str:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    email = email_from_token(token.strip()) if scheme.lower() == "bearer" else None
+    return email or client_key(request)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, max_delay: float) -> Tuple[bool, float]:
+        """Take a token, or one that accrues within max_delay; returns (granted, seconds until it is available)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        delay = max(0.0, (1 - self.tokens) / self.rate)
+        if delay > max_delay:
+            return False, delay
+        self.tokens -= 1
+        return True, delay
+
+
+class _Waiter:
+    __slots__ = ("key", "future", "granted")
+
+    def __init__(self, key: str, future: asyncio.Future):
+        self.key = key
+        self.future = future
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionPolicy:
+    """Concurrency and rate limits for one class of routes; use as a FastAPI dependency."""
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        per_user: int,
+        rate: float,
+        burst: int,
+        max_wait: float,
+        key: Callable[[Request], str] = user_key
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.per_user = per_user
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.key = key
+        self._active = 0
+        self._active_by_key: Counter = Counter()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._waiters: Deque[_Waiter] = deque()
+        self._hold_seconds = 1.0  # Moving average of how long a request keeps its slot, for Retry-After
+        self._lock = threading.Lock()
+
+    async def __call__(self, request: Request):
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+        key = self.key(request)
+        started = time.monotonic()
+        await self._take_token(key)
+        await self._acquire(key, started + self.max_wait)
+        admitted = time.monotonic()
+        ADMISSION_WAIT_SECONDS.labels(self.name).observe(admitted - started)
+        try:
+            yield
+        finally:
+            self._release(key, time.monotonic() - admitted)
+
+    def _reject(self, reason: str, retry_after: float):
+        ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        status_code, detail = REJECTIONS[reason]
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def _take_token(self, key: str):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > MAX_TRACKED_USERS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            granted, delay = bucket.reserve(self.max_wait)
+        if not granted:
+            self._reject("rate", delay)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _can_run(self, key: str) -> bool:
+        return self._active < self.concurrency and self._active_by_key[key] < self.per_user
+
+    def _grant(self, key: str):
+        self._active += 1
+        self._active_by_key[key] += 1
+
+    async def _acquire(self, key: str, deadline: float):
+        with self._lock:
+            # Waiters left over while slots are free are all held back by their own per-user limit
+            if self._can_run(key):
+                self._grant(key)
+                return
+            waiter = _Waiter(key, asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+
+        try:
+            timeout = deadline - time.monotonic()
+            if timeout > 0:
+                await asyncio.wait((waiter.future,), timeout=timeout)
+        except BaseException:
+            # Client disconnected while queued
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self._release(key, None)
+            raise
+
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            if self._active_by_key[key] >= self.per_user:
+                reason, retry_after = "user", self._hold_seconds
+            else:
+                reason, retry_after = "capacity", self._hold_seconds * (len(self._waiters) + 1) / self.concurrency
+        self._reject(reason, retry_after)
+
+    def _release(self, key: str, held: Optional[float]):
+        with self._lock:
+            self._active -= 1
+            self._active_by_key[key] -= 1
+            if not self._active_by_key[key]:
+                del self._active_by_key[key]
+            if held is not None:
+                self._hold_seconds += 0.2 * (held - self._hold_seconds)
+            for waiter in list(self._waiters):
+                if self._active >= self.concurrency:
+                    break
+                if self._active_by_key[waiter.key] < self.per_user:
+                    self._waiters.remove(waiter)
+                    self._grant(waiter.key)
+                    waiter.granted = True
+                    waiter.future.get_loop().call_soon_threadsafe(_wake, waiter.future)
+
+
+extraction_admission = AdmissionPolicy(
+    "extraction",
+    concurrency=settings.ADMISSION_EXTRACTION_CONCURRENCY,
+    per_user=settings.ADMISSION_EXTRACTION_PER_USER,
+    rate=settings.ADMISSION_EXTRACTION_RATE,
+    burst=settings.ADMISSION_EXTRACTION_BURST,
+    max_wait=settings.ADMISSION_MAX_WAIT
+)
+upload_admission = AdmissionPolicy(
+    "upload",
+    concurrency=settings.ADMISSION_UPLOAD_CONCURRENCY,
+    per_user=settings.ADMISSION_UPLOAD_PER_USER,
+    rate=settings.ADMISSION_UPLOAD_RATE,
+    burst=settings.ADMISSION_UPLOAD_BURST,
+    max_wait=settings.ADMISSION_MAX_WAIT
+)
+auth_admission = AdmissionPolicy(
+    "auth",
+    concurrency=settings.ADMISSION_AUTH_CONCURRENCY,
+    per_user=settings.ADMISSION_AUTH_PER_USER,
+    rate=settings.ADMISSION_AUTH_RATE,
+    burst=settings.ADMISSION_AUTH_BURST,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    key=client_key
+)
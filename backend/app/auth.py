@@ -55,6 +55,26 @@ def get_current_user(token_data: TokenData = Depends(verify_token), db: Session
         )
     return user
 
+def is_admin(email: Optional[str]) -> bool:
+    return bool(email) and email.lower() in settings.ADMIN_EMAILS
+
+def email_from_token(token: str) -> Optional[str]:
+    """The token's email if it is valid, without a database lookup."""
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+def admin_email_from_token(token: str) -> Optional[str]:
+    """The token's email if it is valid and belongs to an admin, without a database lookup."""
+    email = email_from_token(token)
+    return email if is_admin(email) else None
+
+def get_admin_user(current_user: User = Depends(get_current_user)):
+    if not is_admin(current_user.email):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
 def authenticate_user(db: Session, email: str, password: str):
     user = db.query(User).filter(User.email == email).first()
     if not user:
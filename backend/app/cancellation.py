@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Optional
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+
+class ExtractionCancelled(Exception):
+    """Raised at a checkpoint once extraction has been cancelled."""
+
+
+class ExtractionTimeout(ExtractionCancelled):
+    """Raised at a checkpoint once the extraction deadline has passed."""
+
+
+class CancellationToken:
+    """Cooperative cancellation flag with an optional deadline.
+
+    Long-running loops call check() between units of work (pages), which
+    raises once the token is cancelled or the deadline has passed.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise ExtractionCancelled("Extraction cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ExtractionTimeout("Extraction deadline exceeded")
+
+
+async def run_cancellable(
+    request: Request,
+    fn: Callable[[CancellationToken], Any],
+    timeout: Optional[float] = None,
+    poll_interval: float = 0.25
+) -> Any:
+    """Run fn(token) in the threadpool, cancelling the token if the client disconnects."""
+    token = CancellationToken(timeout)
+    task = asyncio.ensure_future(run_in_threadpool(fn, token))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if not token.cancelled and await request.is_disconnected():
+                token.cancel()
+    finally:
+        # Also covers this coroutine being cancelled by the server
+        token.cancel()
@@ -0,0 +1,285 @@
+"""
+Negotiated response compression and compressed-at-rest storage.
+
+CompressionMiddleware compresses JSON, NDJSON, XML and text responses of at
+least COMPRESSION_MIN_BYTES with the client's preferred encoding among zstd,
+br and gzip (zstd and br need the optional zstandard and brotli packages).
+Streamed bodies are compressed chunk by chunk and flushed, so NDJSON lines
+still arrive as they are produced. Responses that already have a
+Content-Encoding pass through untouched.
+
+With STORAGE_COMPRESSION=zstd, uploads of AT_REST_TYPES are stored as
+<name>.zst when that saves at least a tenth of their size, and the row's
+File.storage_encoding says so; the suffix is only for people browsing
+UPLOAD_DIR, since users can upload files named .zst too. Downloads send the
+stored bytes with "Content-Encoding: zstd" to clients that accept it and
+decompress on the fly for the rest. Formats that are compressed already
+(images, video, audio, zip and the zip-based Office documents) are left alone.
+"""
+
+import os
+import re
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+from .utils import content_disposition
+
+COMPRESSIBLE_RESPONSE_TYPES = {"application/json", "application/x-ndjson", "application/xml"}
+AT_REST_TYPES = {"text/plain", "text/csv"}
+STORED_SUFFIX = ".zst"
+MIN_SAVING = 0.1  # Keep the compressed copy only if it is at least this much smaller
+CHUNK_SIZE = 64 * 1024
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = _brotli().Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        zstandard = _zstandard()
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> Dict[str, Callable]:
+    """Encoders this process can use, most preferred first."""
+    encoders = {}
+    if _zstandard() is not None:
+        encoders["zstd"] = _ZstdEncoder
+    if _brotli() is not None:
+        encoders["br"] = _BrotliEncoder
+    encoders["gzip"] = _GzipEncoder
+    return encoders
+
+
+def negotiate(accept_encoding: str, offered: List[str]) -> Optional[str]:
+    """The offered encoding the client weights highest; ties go to the earlier offer."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().lower().partition(";")
+        match = re.search(r"q=([0-9.]+)", params)
+        try:
+            weights[name.strip()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    best, best_weight = None, 0.0
+    for encoding in offered:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def accepts(request: Request, encoding: str) -> bool:
+    return negotiate(request.headers.get("accept-encoding", ""), [encoding]) == encoding
+
+
+def _compressible(message) -> bool:
+    if message["status"] < 200 or message["status"] in (204, 206, 304):
+        return False
+    headers = Headers(raw=message.get("headers", []))
+    if "content-encoding" in headers:
+        return False
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_RESPONSE_TYPES
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text-like responses with a negotiated encoding."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), list(self.encoders))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                if _compressible(message):
+                    start = message  # Held until the first body chunk shows whether compressing pays
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = self.encoders[encoding]()
+                headers = MutableHeaders(raw=list(start["headers"]))
+                headers["Content-Encoding"] = encoding
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await send({**start, "headers": headers.raw})
+
+            data = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def ensure_storage_encoding_column(engine: Engine):
+    """Add files.storage_encoding to databases created before it, marking the files already stored compressed.
+
+    Those were recognised by their name alone: the upload's unique filename plus STORED_SUFFIX.
+    """
+    if "storage_encoding" in {column["name"] for column in inspect(engine).get_columns("files")}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE files ADD COLUMN storage_encoding VARCHAR(16)"))
+        rows = conn.execute(text("SELECT file_path, filename FROM files WHERE file_path LIKE :pattern"),
+                            {"pattern": "%" + STORED_SUFFIX})
+        # Deduplicated rows share the uploader's path, so one matching row marks the path
+        compressed = {path for path, filename in rows if os.path.basename(path) == filename + STORED_SUFFIX}
+        for path in compressed:
+            conn.execute(text("UPDATE files SET storage_encoding = 'zstd' WHERE file_path = :path"), {"path": path})
+
+
+def compress_at_rest(path: str, content_type: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Store an upload zstd-compressed if its type benefits; returns the path it now lives at and its encoding."""
+    if settings.STORAGE_COMPRESSION != "zstd" or content_type not in AT_REST_TYPES:
+        return path, None
+    zstandard = _zstandard()
+    if zstandard is None:
+        return path, None
+    size = os.path.getsize(path)
+    target = path + STORED_SUFFIX
+    tmp_path = target + ".tmp"
+    try:
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            zstandard.ZstdCompressor(level=settings.STORAGE_COMPRESSION_LEVEL).copy_stream(src, dst, size=size)
+        if os.path.getsize(tmp_path) > size * (1 - MIN_SAVING):
+            os.remove(tmp_path)
+            return path, None
+        os.replace(tmp_path, target)
+    except Exception:
+        # e.g. disk full; the caller removes the upload itself
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(path)
+    return target, "zstd"
+
+
+def open_stored(path: str, encoding: Optional[str]):
+    """A binary stream of an upload's original bytes, decompressing if it is stored compressed."""
+    f = open(path, "rb")
+    if encoding is None:
+        return f
+    return _zstandard().ZstdDecompressor().stream_reader(f, closefd=True)
+
+
+def decompress_stored(data: bytes) -> bytes:
+    return _zstandard().ZstdDecompressor().decompressobj().decompress(data)
+
+
+def iter_stored(path: str, encoding: Optional[str]) -> Iterator[bytes]:
+    with open_stored(path, encoding) as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def stored_file_response(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: Optional[str],
+    encoding: Optional[str],
+    stat_result=None
+):
+    """Serve a stored upload, passing zstd storage through to clients that accept it."""
+    if encoding is None:
+        return FileResponse(path=path, filename=filename, media_type=media_type, stat_result=stat_result)
+    if accepts(request, encoding):
+        return FileResponse(
+            path=path,
+            filename=filename,
+            media_type=media_type,
+            stat_result=stat_result,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        )
+    return StreamingResponse(
+        iter_stored(path, encoding),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename), "Vary": "Accept-Encoding"}
+    )
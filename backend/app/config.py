@@ -1,5 +1,6 @@
 from decouple import config
 import os
+import tempfile
 
 class Settings:
     SECRET_KEY: str = config("SECRET_KEY")
@@ -20,6 +21,124 @@ class Settings:
 
     UPLOAD_DIR: str = config("UPLOAD_DIR", default="./uploads")
     MAX_FILE_SIZE: int = config("MAX_FILE_SIZE", default=104857600, cast=int)
+    # Store identical uploads once and let clients skip sending bytes the server already has
+    UPLOAD_DEDUP: bool = config("UPLOAD_DEDUP", default=True, cast=bool)
+    # Proof-of-possession challenges for hash pre-checked uploads: lifetime in seconds and bytes hashed
+    UPLOAD_CHALLENGE_TTL: int = config("UPLOAD_CHALLENGE_TTL", default=300, cast=int)
+    UPLOAD_PROOF_BYTES: int = config("UPLOAD_PROOF_BYTES", default=65536, cast=int)
+
+    # Compress JSON and text responses of at least this many bytes with zstd, br or gzip
+    COMPRESSION_ENABLED: bool = config("COMPRESSION_ENABLED", default=True, cast=bool)
+    COMPRESSION_MIN_BYTES: int = config("COMPRESSION_MIN_BYTES", default=1024, cast=int)
+    # "zstd" stores plain-text and CSV uploads compressed (needs the zstandard package); "none" stores them raw
+    STORAGE_COMPRESSION: str = config("STORAGE_COMPRESSION", default="none")
+    STORAGE_COMPRESSION_LEVEL: int = config("STORAGE_COMPRESSION_LEVEL", default=9, cast=int)
+
+    # Image metadata extraction (header-only parser)
+    IMAGE_METADATA_BINARY_TAGS: str = config("IMAGE_METADATA_BINARY_TAGS", default="truncate")
+    IMAGE_METADATA_MAX_BINARY_BYTES: int = config("IMAGE_METADATA_MAX_BINARY_BYTES", default=64, cast=int)
+    IMAGE_METADATA_MAX_HEADER_BYTES: int = config("IMAGE_METADATA_MAX_HEADER_BYTES", default=1048576, cast=int)
+
+    # Extraction worker pool
+    EXTRACTION_WORKERS: int = config("EXTRACTION_WORKERS", default=os.cpu_count() or 1, cast=int)
+    BATCH_EXTRACTION_MAX_FILES: int = config("BATCH_EXTRACTION_MAX_FILES", default=2000, cast=int)
+    # Run extraction in the background right after upload and store the result
+    EAGER_EXTRACTION: bool = config("EAGER_EXTRACTION", default=False, cast=bool)
+    # Per-request deadline for highlight extraction in seconds; 0 disables
+    EXTRACTION_TIMEOUT: float = config("EXTRACTION_TIMEOUT", default=120, cast=float)
+    # Import PDF/image extraction libraries at startup instead of on first extraction
+    EXTRACTION_PRELOAD: bool = config("EXTRACTION_PRELOAD", default=False, cast=bool)
+    # Page renders (about 6 MB per Letter page) and text layouts kept for re-runs with other colour settings; 0 disables
+    PAGE_CACHE_MAX_BYTES: int = config("PAGE_CACHE_MAX_BYTES", default=268435456, cast=int)
+    # Pages rendered larger than this many pixels are processed in tiles; 0 disables tiling
+    EXTRACTION_MAX_RENDER_PIXELS: int = config("EXTRACTION_MAX_RENDER_PIXELS", default=25000000, cast=int)
+    # Worker RSS in bytes above which extraction tiles harder and skips render caching; 0 disables
+    EXTRACTION_RSS_CEILING: int = config("EXTRACTION_RSS_CEILING", default=0, cast=int)
+    # Coalescing of identical concurrent extractions across worker processes
+    SINGLEFLIGHT_DIR: str = config("SINGLEFLIGHT_DIR", default=os.path.join(UPLOAD_DIR, ".singleflight"))
+    # Seconds a coalesced result stays readable for the workers that waited on it
+    SINGLEFLIGHT_RESULT_TTL: float = config("SINGLEFLIGHT_RESULT_TTL", default=30, cast=float)
+
+    # Production server (python -m app.server)
+    WEB_BIND: str = config("WEB_BIND", default="0.0.0.0:8000")
+    WEB_WORKERS: int = config("WEB_WORKERS", default=os.cpu_count() or 1, cast=int)
+    # Import the app once in the master and fork workers from it
+    WEB_PRELOAD: bool = config("WEB_PRELOAD", default=True, cast=bool)
+    # Replace a worker after this many requests (plus up to the jitter); 0 disables
+    WEB_MAX_REQUESTS: int = config("WEB_MAX_REQUESTS", default=10000, cast=int)
+    WEB_MAX_REQUESTS_JITTER: int = config("WEB_MAX_REQUESTS_JITTER", default=1000, cast=int)
+    # Replace a worker once its RSS exceeds this many bytes; 0 disables
+    WEB_MAX_RSS: int = config("WEB_MAX_RSS", default=1073741824, cast=int)
+    WEB_GRACEFUL_TIMEOUT: int = config("WEB_GRACEFUL_TIMEOUT", default=30, cast=int)
+    # Worker heartbeat timeout in seconds; the RSS check runs on each heartbeat
+    WEB_TIMEOUT: int = config("WEB_TIMEOUT", default=30, cast=int)
+    WEB_KEEPALIVE: int = config("WEB_KEEPALIVE", default=5, cast=int)
+    WEB_PIDFILE: str = config("WEB_PIDFILE", default="")
+    # Addresses of reverse proxies whose X-Forwarded-For/-Proto are trusted, comma-separated or "*";
+    # admission control keys logins by client address, so set this to the proxy's address behind one
+    WEB_FORWARDED_ALLOW_IPS: str = config("WEB_FORWARDED_ALLOW_IPS", default="127.0.0.1")
+
+    # Public share links: resolved tokens are cached per worker for this many seconds; 0 disables
+    SHARE_CACHE_TTL: float = config("SHARE_CACHE_TTL", default=60, cast=float)
+    SHARE_CACHE_MAX_ENTRIES: int = config("SHARE_CACHE_MAX_ENTRIES", default=10000, cast=int)
+    # Shared files up to this size are served from a per-worker LRU of SHARE_CACHE_MAX_BYTES
+    SHARE_CACHE_MAX_FILE_BYTES: int = config("SHARE_CACHE_MAX_FILE_BYTES", default=262144, cast=int)
+    SHARE_CACHE_MAX_BYTES: int = config("SHARE_CACHE_MAX_BYTES", default=67108864, cast=int)
+    # Touched on delete and rename of a shared file, and on link revocation, so every worker drops its cached state
+    SHARE_CACHE_GENERATION_FILE: str = config("SHARE_CACHE_GENERATION_FILE", default=os.path.join(tempfile.gettempdir(), "sharedrop-share-cache.gen"))
+
+    # Issue HMAC-signed, expiring share links instead of stored random tokens
+    SHARE_SIGNED_LINKS: bool = config("SHARE_SIGNED_LINKS", default=False, cast=bool)
+    # Default lifetime of a signed link in seconds
+    SHARE_LINK_TTL: int = config("SHARE_LINK_TTL", default=604800, cast=int)
+    # Longest lifetime a signed link may be issued with; a deleted file's links stay revoked this long
+    SHARE_LINK_MAX_TTL: int = config("SHARE_LINK_MAX_TTL", default=2592000, cast=int)
+    # Increment to revoke every signed link issued so far
+    SHARE_KEY_VERSION: int = config("SHARE_KEY_VERSION", default=1, cast=int)
+    # How often each worker adds its download counts for limited links to the database
+    SHARE_DOWNLOAD_FLUSH_SECONDS: float = config("SHARE_DOWNLOAD_FLUSH_SECONDS", default=5, cast=float)
+
+    # Admission control for CPU-heavy routes, per worker process. Each policy has a total
+    # concurrency limit, a per-user one, and a per-user token bucket (requests/second, burst)
+    ADMISSION_ENABLED: bool = config("ADMISSION_ENABLED", default=True, cast=bool)
+    # Over-limit requests wait up to this many seconds for a slot before 429 (user) or 503 (server)
+    ADMISSION_MAX_WAIT: float = config("ADMISSION_MAX_WAIT", default=2.0, cast=float)
+    ADMISSION_EXTRACTION_CONCURRENCY: int = config("ADMISSION_EXTRACTION_CONCURRENCY", default=(os.cpu_count() or 1) * 2, cast=int)
+    ADMISSION_EXTRACTION_PER_USER: int = config("ADMISSION_EXTRACTION_PER_USER", default=2, cast=int)
+    ADMISSION_EXTRACTION_RATE: float = config("ADMISSION_EXTRACTION_RATE", default=2.0, cast=float)
+    ADMISSION_EXTRACTION_BURST: int = config("ADMISSION_EXTRACTION_BURST", default=20, cast=int)
+    ADMISSION_UPLOAD_CONCURRENCY: int = config("ADMISSION_UPLOAD_CONCURRENCY", default=32, cast=int)
+    ADMISSION_UPLOAD_PER_USER: int = config("ADMISSION_UPLOAD_PER_USER", default=4, cast=int)
+    ADMISSION_UPLOAD_RATE: float = config("ADMISSION_UPLOAD_RATE", default=5.0, cast=float)
+    ADMISSION_UPLOAD_BURST: int = config("ADMISSION_UPLOAD_BURST", default=30, cast=int)
+    # Login and registration hash passwords with bcrypt; limited per client address
+    ADMISSION_AUTH_CONCURRENCY: int = config("ADMISSION_AUTH_CONCURRENCY", default=os.cpu_count() or 1, cast=int)
+    ADMISSION_AUTH_PER_USER: int = config("ADMISSION_AUTH_PER_USER", default=4, cast=int)
+    ADMISSION_AUTH_RATE: float = config("ADMISSION_AUTH_RATE", default=1.0, cast=float)
+    ADMISSION_AUTH_BURST: int = config("ADMISSION_AUTH_BURST", default=20, cast=int)
+
+    # SQL statements slower than this many seconds are logged with their parameters; 0 disables
+    DB_SLOW_QUERY_SECONDS: float = config("DB_SLOW_QUERY_SECONDS", default=0.2, cast=float)
+    # Report each request's query count and database time in a Server-Timing header
+    DB_QUERY_TIMING_HEADER: bool = config("DB_QUERY_TIMING_HEADER", default=True, cast=bool)
+
+    # Prometheus metrics at /metrics (admin accounts only)
+    METRICS_ENABLED: bool = config("METRICS_ENABLED", default=True, cast=bool)
+    # host:port where the production server also serves /metrics without auth, for scrapers; keep it private
+    METRICS_BIND: str = config("METRICS_BIND", default="")
+    # Per-worker sample files for the multi-process server; emptied when it starts
+    METRICS_MULTIPROC_DIR: str = config("METRICS_MULTIPROC_DIR", default=os.path.join(tempfile.gettempdir(), "sharedrop-metrics"))
+
+    # Accounts allowed to use admin endpoints and request profiling, comma-separated
+    ADMIN_EMAILS: frozenset = config("ADMIN_EMAILS", default="", cast=lambda v: frozenset(e.strip().lower() for e in v.split(",") if e.strip()))
+
+    # Request profiling: admins send "X-Profile: 1" or ?profile=1; artifacts go to PROFILING_DIR
+    PROFILING_DIR: str = config("PROFILING_DIR", default=os.path.join(tempfile.gettempdir(), "sharedrop-profiles"))
+    PROFILING_INTERVAL: float = config("PROFILING_INTERVAL", default=0.005, cast=float)
+    # Fraction of all requests profiled in the background, e.g. 0.001; 0 disables
+    PROFILING_SAMPLE_RATE: float = config("PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+    # Oldest artifacts are deleted beyond this count
+    PROFILING_MAX_ARTIFACTS: int = config("PROFILING_MAX_ARTIFACTS", default=200, cast=int)
 
     def __init__(self):
         os.makedirs(self.UPLOAD_DIR, exist_ok=True)
@@ -0,0 +1,175 @@
+"""
+Content-addressed upload deduplication.
+
+Uploads record the SHA-256 of their bytes; an upload whose content is
+already stored (same hash and size) points at the existing file instead of
+keeping a second copy, and the bytes are removed with the last File row that
+uses them. Reusing bytes locks the row they were found through
+(reference_stored) and deleting checks for other rows in the same
+transaction as the delete (delete_file_row), so the database serialises the
+two: a reuse is either seen by the delete or finds the row gone and keeps
+its own copy.
+
+Clients that hash a file before sending it can skip the transfer:
+
+    POST /files/upload/check  {sha256, size, filename, content_type}
+        -> {"exists": false}                              upload as usual
+        -> {"exists": true, challenge, nonce, offset, length}
+    POST /files/upload/claim  {challenge, proof}
+        proof = hex sha256(bytes.fromhex(nonce) + file[offset:offset + length])
+
+The challenge names a random range of the stored bytes, so knowing a file's
+hash is not enough to get a copy of it. Challenges are HMAC-signed, bound to
+the user and expire after UPLOAD_CHALLENGE_TTL seconds, so nothing is stored
+between the two calls. A positive check does tell the caller that someone
+has uploaded that content; set UPLOAD_DEDUP=false where that matters.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .compression import open_stored
+from .config import settings
+from .models import File
+
+SIGNATURE_BYTES = 16
+
+
+class InvalidChallenge(Exception):
+    """The challenge is malformed, forged, expired or issued to another user."""
+
+
+@dataclass(frozen=True)
+class Challenge:
+    user_id: int
+    source_file_id: int
+    sha256: str
+    size: int
+    filename: str
+    content_type: str
+    nonce: bytes
+    offset: int
+    length: int
+    expires_at: int  # Unix time
+
+
+def ensure_content_hash_column(engine: Engine):
+    """Add files.content_sha256 to databases created before deduplication."""
+    if "content_sha256" in {column["name"] for column in inspect(engine).get_columns("files")}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE files ADD COLUMN content_sha256 VARCHAR(64)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_files_content_sha256 ON files (content_sha256)"))
+
+
+def find_stored(db: Session, sha256: str, size: int) -> Optional[File]:
+    """A File whose bytes on disk have this hash and size, if there is one."""
+    for file in db.query(File).filter(File.content_sha256 == sha256.lower(), File.file_size == size).limit(5):
+        if os.path.exists(file.file_path):
+            return file
+    return None
+
+
+def reference_stored(db: Session, source: File) -> bool:
+    """Lock source's row until the caller commits the row that reuses its bytes.
+
+    Returns False, with the transaction rolled back, when source was deleted
+    since it was looked up; its bytes may be gone, so they must not be reused.
+    """
+    locked = db.query(File).filter(File.id == source.id, File.file_path == source.file_path).update(
+        {File.file_path: File.file_path}, synchronize_session=False
+    )
+    if not locked:
+        db.rollback()
+    return bool(locked)
+
+
+def delete_file_row(db: Session, file: File):
+    """Delete a File row and commit, then remove its bytes if no other row refers to them."""
+    file_path, sha256 = file.file_path, file.content_sha256
+    db.delete(file)
+    db.flush()
+    # Rows without a hash were never deduplicated, so their bytes are theirs alone
+    in_use = sha256 is not None and db.query(File.id).filter(
+        File.content_sha256 == sha256, File.file_path == file_path
+    ).first() is not None
+    db.commit()
+    if not in_use and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload: str) -> bytes:
+    key = hmac.new(settings.SECRET_KEY.encode(), b"upload-challenge", hashlib.sha256).digest()
+    return hmac.new(key, payload.encode("ascii"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def issue_challenge(user_id: int, source: File, filename: str, content_type: str) -> Tuple[str, Challenge]:
+    """Pick a random range of source's bytes for the client to hash; returns the signed token and the challenge."""
+    length = min(source.file_size, settings.UPLOAD_PROOF_BYTES)
+    challenge = Challenge(
+        user_id=user_id,
+        source_file_id=source.id,
+        sha256=source.content_sha256,
+        size=source.file_size,
+        filename=filename,
+        content_type=content_type,
+        nonce=secrets.token_bytes(16),
+        offset=secrets.randbelow(source.file_size - length + 1),
+        length=length,
+        expires_at=int(time.time()) + settings.UPLOAD_CHALLENGE_TTL
+    )
+    fields = [challenge.user_id, challenge.source_file_id, challenge.sha256, challenge.size, challenge.filename,
+              challenge.content_type, challenge.nonce.hex(), challenge.offset, challenge.length, challenge.expires_at]
+    payload = _b64encode(json.dumps(fields, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_signature(payload))}", challenge
+
+
+def verify_challenge(token: str, user_id: int) -> Challenge:
+    """Check a challenge's signature, owner and expiry; raises InvalidChallenge."""
+    payload, _, signature = token.partition(".")
+    try:
+        given = _b64decode(signature)
+        if not hmac.compare_digest(given, _signature(payload)):
+            raise InvalidChallenge("Invalid upload challenge")
+        fields = json.loads(_b64decode(payload))
+        challenge = Challenge(*fields[:6], bytes.fromhex(fields[6]), *fields[7:])
+    except (ValueError, TypeError):
+        raise InvalidChallenge("Malformed upload challenge")
+    if challenge.user_id != user_id:
+        raise InvalidChallenge("Invalid upload challenge")
+    if time.time() > challenge.expires_at:
+        raise InvalidChallenge("Upload challenge has expired")
+    return challenge
+
+
+def proof_matches(source: File, challenge: Challenge, proof: str) -> bool:
+    """Hash the challenged range of the stored bytes and compare it with the client's proof."""
+    try:
+        with open_stored(source.file_path, source.storage_encoding) as f:
+            f.seek(challenge.offset)
+            chunk = f.read(challenge.length)
+    except OSError:
+        return False
+    if len(chunk) != challenge.length:
+        return False
+    expected = hashlib.sha256(challenge.nonce + chunk).hexdigest()
+    return hmac.compare_digest(expected, proof.strip().lower())
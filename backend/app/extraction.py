@@ -1,17 +1,45 @@
 import os
-import magic
-from typing import Dict, Any, List
-from PIL import Image
-from PIL.ExifTags import TAGS
-from PyPDF2 import PdfReader
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 import re
 from datetime import datetime
-from .pdf_extractor import PDFHighlightExtractor
+from .cancellation import CancellationToken, ExtractionCancelled
+from .config import settings
+from .metrics import EXTRACTIONS_IN_PROGRESS, extraction_stage, observe_extraction_stage
+from .page_cache import PageCache
+from .singleflight import file_identity
+
+# Extraction backends (libmagic, Pillow, PyPDF2, PyMuPDF, pdfium, NumPy,
+# OpenCV) are imported inside the functions that use them, so API workers
+# that never extract do not pay their import time or memory.
+EXTRACTION_BACKENDS = ('magic', 'PIL.Image', 'PyPDF2', '.image_metadata', '.pdf_extractor')
+
+_executor: Optional[ThreadPoolExecutor] = None
+page_cache = PageCache(settings.PAGE_CACHE_MAX_BYTES) if settings.PAGE_CACHE_MAX_BYTES > 0 else None
+
+
+def preload_extraction_backends():
+    """Import every extraction backend now rather than on first use."""
+    for module in EXTRACTION_BACKENDS:
+        importlib.import_module(module, __package__)
+
+
+def get_extraction_executor() -> ThreadPoolExecutor:
+    """Return the process-wide bounded worker pool used for extraction."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.EXTRACTION_WORKERS,
+            thread_name_prefix="extraction"
+        )
+    return _executor
 
 
 def get_file_type(file_path: str) -> str:
     """Get the MIME type of a file (only supports image/* and application/pdf)."""
     try:
+        import magic
         mime = magic.Magic(mime=True)
         return mime.from_file(file_path)
     except Exception:
@@ -28,8 +56,36 @@ def get_file_type(file_path: str) -> str:
         return ext_to_mime.get(ext, 'application/octet-stream')
 
 
-def extract_image_metadata(file_path: str) -> Dict[str, Any]:
-    """Extract metadata from image files."""
+@EXTRACTIONS_IN_PROGRESS.labels('metadata').track_inprogress()
+@extraction_stage('image_metadata')
+def extract_image_metadata(
+    file_path: str,
+    binary_tags: str = None,
+    max_binary_bytes: int = None
+) -> Dict[str, Any]:
+    """Extract metadata from image files.
+
+    Uses the header-only parser when the container is recognised and falls back
+    to Pillow otherwise.
+    """
+    from PIL import Image
+    from .image_metadata import extract_image_metadata_fast, decode_exif, HeaderParseError
+
+    binary_tags = binary_tags or settings.IMAGE_METADATA_BINARY_TAGS
+    if max_binary_bytes is None:
+        max_binary_bytes = settings.IMAGE_METADATA_MAX_BINARY_BYTES
+    try:
+        return extract_image_metadata_fast(
+            file_path,
+            binary_tags=binary_tags,
+            max_binary_bytes=max_binary_bytes,
+            max_header_bytes=settings.IMAGE_METADATA_MAX_HEADER_BYTES
+        )
+    except HeaderParseError:
+        pass
+    except Exception as e:
+        raise ValueError(f"Failed to extract image metadata: {str(e)}")
+
     try:
         with Image.open(file_path) as image:
             metadata = {
@@ -44,29 +100,28 @@ def extract_image_metadata(file_path: str) -> Dict[str, Any]:
                 'file_size_bytes': os.path.getsize(file_path),
                 'extracted_at': datetime.utcnow().isoformat() + 'Z'
             }
-            exif_data = {}
-            if hasattr(image, '_getexif') and image._getexif() is not None:
-                for tag_id, value in image._getexif().items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    if isinstance(value, (bytes, tuple)):
-                        value = str(value)
-                    exif_data[tag] = value
-            metadata['exif'] = exif_data
+            exif = image.info.get('exif')
+            metadata['exif'] = decode_exif(exif, binary_tags, max_binary_bytes) if exif else {}
             info = {k: (v if isinstance(v, (str, int, float, bool)) else str(v))
-                    for k, v in image.info.items()}
+                    for k, v in image.info.items() if k not in ('exif', 'icc_profile')}
             metadata['info'] = info
             return metadata
     except Exception as e:
         raise ValueError(f"Failed to extract image metadata: {str(e)}")
 
 
-def extract_text_from_pdf(file_path: str) -> str:
+@extraction_stage('pdf_text')
+def extract_text_from_pdf(file_path: str, cancel_token: Optional[CancellationToken] = None) -> str:
     """Extract plain text from a PDF file."""
+    from PyPDF2 import PdfReader
+
     try:
         text = ""
         with open(file_path, 'rb') as file:
             pdf_reader = PdfReader(file)
             for page in pdf_reader.pages:
+                if cancel_token is not None:
+                    cancel_token.check()
                 try:
                     page_text = page.extract_text()
                     if page_text:
@@ -74,10 +129,13 @@ def extract_text_from_pdf(file_path: str) -> str:
                 except Exception:
                     continue
         return text.strip()
+    except ExtractionCancelled:
+        raise
     except Exception as e:
         raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
 
+@extraction_stage('keywords')
 def extract_keywords_and_highlights(
     text: str,
     sample_highlights: List[str] = None,
@@ -120,33 +178,69 @@ def extract_keywords_and_highlights(
     }
 
 
-def extract_highlights_from_file(file_path: str) -> Dict[str, Any]:
-    """Extract highlights and keywords from PDF, or metadata from images."""
+def parse_hex_color(value: str) -> Tuple[int, int, int]:
+    """Parse '#rrggbb' or 'rrggbb' into an RGB tuple."""
+    match = re.fullmatch(r'#?([0-9a-fA-F]{6})', value.strip())
+    if not match:
+        raise ValueError(f"Invalid colour '{value}', expected #rrggbb")
+    digits = match.group(1)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def extract_highlights_from_file(
+    file_path: str,
+    include_text: bool = False,
+    highlight_color: Optional[Tuple[int, int, int]] = None,
+    tolerance: Optional[int] = None,
+    cancel_token: Optional[CancellationToken] = None
+) -> Dict[str, Any]:
+    """Extract highlights and keywords from PDF, or metadata from images.
+
+    With include_text, the full PDF text is returned under 'text' for indexing.
+    highlight_color and tolerance override the extractor defaults.
+    cancel_token is checked between pages and raises ExtractionCancelled.
+    """
+    from .pdf_extractor import PDFHighlightExtractor
+
     file_type = get_file_type(file_path)
 
     if file_type.startswith('image/'):
         return extract_image_metadata(file_path)
 
     elif file_type == 'application/pdf':
-        text = extract_text_from_pdf(file_path)
-        sample_highlights = []
-        try:
-            extractor = PDFHighlightExtractor(file_path)
-            formatted_text = extractor.extract_and_format(output_path="output.md", output_format="markdown")
-            if isinstance(formatted_text, str):
+        with EXTRACTIONS_IN_PROGRESS.labels('highlights').track_inprogress():
+            text = extract_text_from_pdf(file_path, cancel_token)
+            sample_highlights = []
+            highlights = []
+            try:
+                options = {
+                    'page_cache': page_cache,
+                    'cancel_token': cancel_token,
+                    'max_render_pixels': settings.EXTRACTION_MAX_RENDER_PIXELS or None,
+                    'rss_ceiling': settings.EXTRACTION_RSS_CEILING or None,
+                    'stage_observer': observe_extraction_stage,
+                }
+                if highlight_color is not None:
+                    options['highlight_color'] = highlight_color
+                if tolerance is not None:
+                    options['tolerance'] = tolerance
+                with PDFHighlightExtractor(file_path, **options) as extractor:
+                    highlights = [highlight.to_dict() for highlight in extractor.extract()]
+                    formatted_text = extractor.format_output("markdown")
                 sample_highlights = [line.strip() for line in formatted_text.splitlines() if line.strip()]
-            elif isinstance(formatted_text, list):
-                sample_highlights = [str(item) for item in formatted_text]
-            else:
-                sample_highlights = [str(formatted_text)]
-        except Exception:
-            pass
-
-        result = extract_keywords_and_highlights(text, sample_highlights)
-        result['filename'] = os.path.basename(file_path)
-        result['file_type'] = file_type
-        result['file_size_bytes'] = os.path.getsize(file_path)
-        return result
+            except ExtractionCancelled:
+                raise
+            except Exception:
+                pass
+
+            result = extract_keywords_and_highlights(text, sample_highlights)
+            result['highlights'] = highlights
+            result['filename'] = os.path.basename(file_path)
+            result['file_type'] = file_type
+            result['file_size_bytes'] = os.path.getsize(file_path)
+            if include_text:
+                result['text'] = text
+            return result
 
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
@@ -158,3 +252,52 @@ def is_image_file(file_path: str) -> bool:
 
 def is_pdf_file(file_path: str) -> bool:
     return get_file_type(file_path) == 'application/pdf'
+
+
+def extraction_type_for(content_type: Optional[str]) -> Optional[str]:
+    """Pick the extraction a file supports from its stored content type."""
+    if content_type == 'application/pdf':
+        return 'highlights'
+    if content_type and content_type.startswith('image/'):
+        return 'metadata'
+    return None
+
+
+def run_extraction(
+    file_path: str,
+    extraction_type: str,
+    include_text: bool = False,
+    cancel_token: Optional[CancellationToken] = None
+) -> Dict[str, Any]:
+    """Run a single extraction by type name."""
+    if extraction_type == 'metadata':
+        return extract_image_metadata(file_path)
+    if extraction_type == 'highlights':
+        return extract_highlights_from_file(file_path, include_text=include_text, cancel_token=cancel_token)
+    raise ValueError(f"Unsupported extraction type: {extraction_type}")
+
+
+def summarize_highlights(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the structured highlight list from a result, keeping its count.
+
+    The full list is served page by page from the highlights endpoint.
+    """
+    if 'highlights' not in data:
+        return data
+    summary = {k: v for k, v in data.items() if k != 'highlights'}
+    summary['highlight_count'] = len(data['highlights'])
+    return summary
+
+
+def render_highlights(highlights: List[Dict[str, Any]], output_format: str = "markdown") -> str:
+    """Render structured highlights as markdown or HTML in memory."""
+    from .pdf_extractor import PDFHighlightExtractor, Highlight
+
+    extractor = PDFHighlightExtractor(None)
+    extractor.highlights = [Highlight.from_dict(item) for item in highlights]
+    return extractor.format_output(output_format)
+
+
+def extraction_key(file_path: str, extraction_type: str, **params) -> tuple:
+    """Single-flight key: file content identity, extraction type and parameters."""
+    return (file_identity(file_path), extraction_type, tuple(sorted(params.items())))
@@ -0,0 +1,91 @@
+import json
+from typing import Dict, Any, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import ExtractionResult
+from .extraction import extraction_type_for, get_extraction_executor, run_extraction
+from .search import index_file
+
+
+def get_stored_result(db: Session, file_id: int, extraction_type: str) -> Optional[ExtractionResult]:
+    """Return the stored extraction row for a file, if any."""
+    return db.query(ExtractionResult).filter(
+        ExtractionResult.file_id == file_id,
+        ExtractionResult.extraction_type == extraction_type
+    ).first()
+
+
+def get_extraction_status(db: Session, file_id: int) -> Dict[str, str]:
+    """Map extraction type to stored status (pending, ready or failed)."""
+    rows = db.query(ExtractionResult.extraction_type, ExtractionResult.status).filter(
+        ExtractionResult.file_id == file_id
+    ).all()
+    return {extraction_type: status for extraction_type, status in rows}
+
+
+def store_result(
+    db: Session,
+    file_id: int,
+    extraction_type: str,
+    data: Dict[str, Any] = None,
+    error: str = None
+) -> ExtractionResult:
+    """Insert or update the stored result for a file and extraction type.
+
+    A 'text' key in highlight data is moved into the full-text index rather
+    than stored with the result.
+    """
+    if data is not None and 'text' in data:
+        data = dict(data)
+        index_file(db, file_id, data.pop('text'), data.get('sample_highlights'))
+
+    row = get_stored_result(db, file_id, extraction_type)
+    if row is None:
+        row = ExtractionResult(file_id=file_id, extraction_type=extraction_type)
+        db.add(row)
+    if error is None:
+        # Round-trip through JSON so non-native values (datetimes, rationals) are stored as text
+        row.data = json.loads(json.dumps(data, default=str))
+        row.status = "ready"
+        row.error = None
+    else:
+        row.data = None
+        row.status = "failed"
+        row.error = error
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent writer created the row first; theirs is equivalent
+        db.rollback()
+        row = get_stored_result(db, file_id, extraction_type)
+    return row
+
+
+def _run_eager_extraction(file_id: int, file_path: str, extraction_type: str):
+    """Worker body: run one extraction and persist its outcome."""
+    db = SessionLocal()
+    try:
+        try:
+            data = run_extraction(file_path, extraction_type, include_text=True)
+        except Exception as e:
+            store_result(db, file_id, extraction_type, error=str(e) or f"Failed to extract {extraction_type}")
+        else:
+            store_result(db, file_id, extraction_type, data=data)
+    finally:
+        db.close()
+
+
+def enqueue_extraction(db: Session, file_id: int, file_path: str, content_type: str) -> Optional[str]:
+    """Mark a file's extraction as pending and schedule it on the extraction pool.
+
+    Returns the scheduled extraction type, or None if the file type has none.
+    """
+    extraction_type = extraction_type_for(content_type)
+    if extraction_type is None:
+        return None
+
+    db.add(ExtractionResult(file_id=file_id, extraction_type=extraction_type, status="pending"))
+    db.commit()
+    get_extraction_executor().submit(_run_eager_extraction, file_id, file_path, extraction_type)
+    return extraction_type
@@ -0,0 +1,373 @@
+import math
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+from PIL import Image
+from PIL.ExifTags import TAGS, GPSTAGS, IFD
+
+
+# Binary EXIF values (MakerNote, PrintIM, thumbnails...) can be tens of KB.
+BINARY_TAG_MODES = ("skip", "truncate", "full")
+
+JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+PNG_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+BMP_MODES = {1: '1', 4: 'P', 8: 'P', 16: 'RGB', 24: 'RGB', 32: 'RGB'}
+
+XMP_JPEG_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+ICC_JPEG_HEADER = b"ICC_PROFILE\x00"
+
+
+class HeaderParseError(ValueError):
+    """Raised when a file's container headers cannot be parsed."""
+
+
+class _Reader:
+    """File reader that refuses to read past a fixed byte budget."""
+
+    def __init__(self, fp, max_bytes: int):
+        self.fp = fp
+        self.remaining = max_bytes
+
+    def read(self, size: int) -> bytes:
+        if size > self.remaining:
+            raise HeaderParseError("Metadata exceeds header read budget")
+        data = self.fp.read(size)
+        self.remaining -= len(data)
+        if len(data) != size:
+            raise HeaderParseError("Unexpected end of file")
+        return data
+
+    def skip(self, size: int):
+        self.fp.seek(size, os.SEEK_CUR)
+
+
+def _parse_jpeg(reader: _Reader) -> Dict[str, Any]:
+    parsed = {'format': 'JPEG', 'info': {}}
+    icc_chunks = {}
+
+    while True:
+        byte = reader.read(1)
+        if byte != b"\xff":
+            raise HeaderParseError("Invalid JPEG marker")
+        marker = reader.read(1)[0]
+        while marker == 0xFF:
+            marker = reader.read(1)[0]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+
+        length = struct.unpack(">H", reader.read(2))[0] - 2
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            segment = reader.read(length)
+            height, width = struct.unpack(">HH", segment[1:5])
+            parsed['size'] = (width, height)
+            parsed['mode'] = JPEG_MODES.get(segment[5], 'RGB')
+            if marker in (0xC2, 0xC6, 0xCA, 0xCE):
+                parsed['info']['progressive'] = 1
+            continue
+        if marker not in (0xE0, 0xE1, 0xE2, 0xEE):
+            reader.skip(length)
+            continue
+
+        segment = reader.read(length)
+        if marker == 0xE0 and segment[:5] == b"JFIF\x00":
+            version, unit, x_density, y_density = struct.unpack(">HBHH", segment[5:12])
+            parsed['info']['jfif'] = version
+            parsed['info']['jfif_version'] = (version >> 8, version & 0xFF)
+            parsed['info']['jfif_unit'] = unit
+            parsed['info']['jfif_density'] = (x_density, y_density)
+            if unit == 1:
+                parsed['info']['dpi'] = (x_density, y_density)
+        elif marker == 0xE1 and segment[:6] == b"Exif\x00\x00" and 'exif' not in parsed:
+            parsed['exif'] = segment[6:]
+        elif marker == 0xE1 and segment.startswith(XMP_JPEG_HEADER):
+            parsed['xmp'] = segment[len(XMP_JPEG_HEADER):]
+        elif marker == 0xE2 and segment.startswith(ICC_JPEG_HEADER):
+            icc_chunks[segment[12]] = segment[14:]
+        elif marker == 0xEE and segment[:5] == b"Adobe":
+            parsed['info']['adobe'] = 1
+            parsed['info']['adobe_transform'] = segment[11] if len(segment) > 11 else 0
+
+    if icc_chunks:
+        parsed['icc'] = b"".join(icc_chunks[i] for i in sorted(icc_chunks))
+    return parsed
+
+
+def _parse_png(reader: _Reader) -> Dict[str, Any]:
+    parsed = {'format': 'PNG', 'info': {}}
+    reader.read(8)
+
+    while True:
+        length, chunk_type = struct.unpack(">I4s", reader.read(8))
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+        if chunk_type not in (b"IHDR", b"tRNS", b"iCCP", b"eXIf", b"iTXt", b"tEXt", b"pHYs", b"gAMA"):
+            reader.skip(length + 4)
+            continue
+
+        data = reader.read(length)
+        reader.skip(4)  # CRC
+        if chunk_type == b"IHDR":
+            width, height, _depth, color_type = struct.unpack(">IIBB", data[:10])
+            parsed['size'] = (width, height)
+            parsed['mode'] = PNG_MODES.get(color_type, 'RGB')
+        elif chunk_type == b"tRNS":
+            parsed['info']['transparency'] = True
+        elif chunk_type == b"iCCP":
+            _name, _, rest = data.partition(b"\x00")
+            parsed['icc'] = zlib.decompress(rest[1:])
+        elif chunk_type == b"eXIf":
+            parsed['exif'] = data
+        elif chunk_type == b"iTXt":
+            keyword, _, rest = data.partition(b"\x00")
+            compressed = rest[0] if rest else 0
+            _lang, _, rest = rest[2:].partition(b"\x00")
+            _translated, _, text = rest.partition(b"\x00")
+            if compressed:
+                text = zlib.decompress(text)
+            if keyword == b"XML:com.adobe.xmp":
+                parsed['xmp'] = text
+            else:
+                parsed['info'][keyword.decode('latin-1')] = text.decode('utf-8', 'replace')
+        elif chunk_type == b"tEXt":
+            keyword, _, text = data.partition(b"\x00")
+            parsed['info'][keyword.decode('latin-1')] = text.decode('latin-1')
+        elif chunk_type == b"pHYs":
+            px, py, unit = struct.unpack(">IIB", data)
+            if unit == 1:
+                parsed['info']['dpi'] = (round(px * 0.0254), round(py * 0.0254))
+        elif chunk_type == b"gAMA":
+            parsed['info']['gamma'] = struct.unpack(">I", data)[0] / 100000.0
+
+    return parsed
+
+
+def _parse_gif(reader: _Reader) -> Dict[str, Any]:
+    header = reader.read(13)
+    width, height, flags = struct.unpack("<HHB", header[6:11])
+    parsed = {
+        'format': 'GIF',
+        'size': (width, height),
+        'mode': 'P',
+        'info': {'version': header[:6].decode('ascii')},
+    }
+    if flags & 0x80:
+        reader.skip(3 << ((flags & 7) + 1))
+
+    # Walk extension blocks up to the first image descriptor
+    while True:
+        introducer = reader.read(1)
+        if introducer != b"!":
+            break
+        label = reader.read(1)[0]
+        while True:
+            block_size = reader.read(1)[0]
+            if not block_size:
+                break
+            block = reader.read(block_size)
+            if label == 0xF9 and block[0] & 1:
+                parsed['info']['transparency'] = block[3]
+    return parsed
+
+
+def _parse_webp(reader: _Reader) -> Dict[str, Any]:
+    parsed = {'format': 'WEBP', 'mode': 'RGB', 'info': {}}
+    riff_size = struct.unpack("<I", reader.read(12)[4:8])[0]
+    position = 4
+
+    while position + 8 <= riff_size:
+        chunk_type, length = struct.unpack("<4sI", reader.read(8))
+        padded = length + (length & 1)
+        position += 8 + padded
+        if chunk_type == b"VP8X":
+            data = reader.read(10)
+            reader.skip(padded - 10)
+            if data[0] & 0x10:
+                parsed['mode'] = 'RGBA'
+            width = int.from_bytes(data[4:7], 'little') + 1
+            height = int.from_bytes(data[7:10], 'little') + 1
+            parsed['size'] = (width, height)
+        elif chunk_type == b"VP8 " and 'size' not in parsed:
+            data = reader.read(10)
+            reader.skip(padded - 10)
+            width, height = struct.unpack("<HH", data[6:10])
+            parsed['size'] = (width & 0x3FFF, height & 0x3FFF)
+        elif chunk_type == b"VP8L" and 'size' not in parsed:
+            data = reader.read(5)
+            reader.skip(padded - 5)
+            bits = int.from_bytes(data[1:5], 'little')
+            parsed['size'] = ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+            if bits >> 28 & 1:
+                parsed['mode'] = 'RGBA'
+        elif chunk_type in (b"ICCP", b"EXIF", b"XMP "):
+            data = reader.read(length)
+            reader.skip(padded - length)
+            key = {b"ICCP": 'icc', b"EXIF": 'exif', b"XMP ": 'xmp'}[chunk_type]
+            if key == 'exif' and data.startswith(b"Exif\x00\x00"):
+                data = data[6:]
+            parsed[key] = data
+        else:
+            reader.skip(padded)
+    return parsed
+
+
+def _parse_bmp(reader: _Reader) -> Dict[str, Any]:
+    header = reader.read(30)
+    width, height, _planes, bit_count = struct.unpack("<iiHH", header[18:30])
+    return {
+        'format': 'BMP',
+        'size': (width, abs(height)),
+        'mode': BMP_MODES.get(bit_count, 'RGB'),
+        'info': {'compression': 0},
+    }
+
+
+def _detect_parser(signature: bytes):
+    if signature[:2] == b"\xff\xd8":
+        return _parse_jpeg
+    if signature[:8] == b"\x89PNG\r\n\x1a\n":
+        return _parse_png
+    if signature[:6] in (b"GIF87a", b"GIF89a"):
+        return _parse_gif
+    if signature[:4] == b"RIFF" and signature[8:12] == b"WEBP":
+        return _parse_webp
+    if signature[:2] == b"BM":
+        return _parse_bmp
+    return None
+
+
+def _jsonable(value, binary_tags: str, max_binary_bytes: int):
+    """Convert a decoded EXIF value to something JSON can carry; None means leave the tag out."""
+    if isinstance(value, bytes):
+        if binary_tags == "skip" and len(value) > max_binary_bytes:
+            return None
+        if binary_tags == "truncate" and len(value) > max_binary_bytes:
+            return f"{value[:max_binary_bytes]!r}... ({len(value)} bytes)"
+        return str(value)
+    if isinstance(value, tuple):
+        return [_jsonable(v, binary_tags, max_binary_bytes) for v in value]
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (str, int, bool)) or value is None:
+        return value
+    try:
+        number = float(value)  # IFDRational
+    except ZeroDivisionError:
+        return None
+    except (TypeError, ValueError):
+        return str(value)
+    # A 0/0 rational is NaN in some Pillow versions, which JSON responses refuse
+    return number if math.isfinite(number) else None
+
+
+def decode_exif(data: bytes, binary_tags: str = "truncate", max_binary_bytes: int = 64) -> Dict[str, Any]:
+    """Decode a raw EXIF (TIFF) block once into a flat tag-name dictionary.
+
+    Mirrors the layout of Pillow's ``_getexif``: IFD0 and the Exif sub-IFD are
+    merged, and GPS tags are nested under ``GPSInfo``.
+    """
+    if binary_tags not in BINARY_TAG_MODES:
+        raise ValueError(f"binary_tags must be one of {BINARY_TAG_MODES}")
+
+    exif = Image.Exif()
+    exif.load(data)
+
+    tags = dict(exif)
+    tags.update(exif.get_ifd(IFD.Exif))
+    gps = exif.get_ifd(IFD.GPSInfo)
+
+    exif_data = {}
+    for tag_id, value in tags.items():
+        if tag_id in (IFD.Exif, IFD.GPSInfo, IFD.Interop):
+            continue
+        value = _jsonable(value, binary_tags, max_binary_bytes)
+        if value is not None:
+            exif_data[TAGS.get(tag_id, tag_id)] = value
+    gps_data = {}
+    for tag_id, value in gps.items():
+        value = _jsonable(value, binary_tags, max_binary_bytes)
+        if value is not None:
+            gps_data[GPSTAGS.get(tag_id, tag_id)] = value
+    if gps_data:
+        exif_data['GPSInfo'] = gps_data
+    return exif_data
+
+
+def _describe_icc(icc: bytes) -> Dict[str, Any]:
+    """Summarise an ICC profile from its 128-byte header instead of dumping it."""
+    summary = {'size_bytes': len(icc)}
+    if len(icc) >= 128:
+        summary['device_class'] = icc[12:16].decode('ascii', 'replace').strip()
+        summary['color_space'] = icc[16:20].decode('ascii', 'replace').strip()
+        summary['version'] = f"{icc[8]}.{icc[9] >> 4}"
+    return summary
+
+
+def read_image_headers(file_path: str, max_header_bytes: int = 1048576) -> Dict[str, Any]:
+    """Parse container headers and raw EXIF/XMP/ICC segments without decoding pixels.
+
+    At most ``max_header_bytes`` are read from the file; pixel data is skipped
+    with seeks, so the cost does not grow with image dimensions.
+    """
+    with open(file_path, 'rb') as fp:
+        parser = _detect_parser(fp.read(16))
+        if parser is None:
+            raise HeaderParseError("Unsupported image container")
+        fp.seek(0)
+        try:
+            parsed = parser(_Reader(fp, max_header_bytes))
+        except (struct.error, IndexError, zlib.error) as e:
+            raise HeaderParseError(f"Malformed image header: {e}")
+
+    if 'size' not in parsed:
+        raise HeaderParseError("Image dimensions not found in header")
+    return parsed
+
+
+def extract_image_metadata_fast(
+    file_path: str,
+    binary_tags: str = "truncate",
+    max_binary_bytes: int = 64,
+    max_header_bytes: int = 1048576
+) -> Dict[str, Any]:
+    """Extract image metadata from headers only, in the same shape as ``extract_image_metadata``."""
+    parsed = read_image_headers(file_path, max_header_bytes)
+    width, height = parsed['size']
+    mode = parsed['mode']
+    info = parsed['info']
+
+    if 'icc' in parsed:
+        info['icc_profile'] = _describe_icc(parsed['icc'])
+    if 'xmp' in parsed:
+        info['xmp'] = parsed['xmp'].decode('utf-8', 'replace').rstrip(' \r\n\t\x00')
+
+    return {
+        'filename': os.path.basename(file_path),
+        'format': parsed['format'],
+        'mode': mode,
+        'size': {
+            'width': width,
+            'height': height
+        },
+        'has_transparency': mode in ('RGBA', 'LA') or 'transparency' in info,
+        'file_size_bytes': os.path.getsize(file_path),
+        'extracted_at': datetime.utcnow().isoformat() + 'Z',
+        'exif': decode_exif(parsed['exif'], binary_tags, max_binary_bytes) if parsed.get('exif') else {},
+        'info': {k: (v if isinstance(v, (str, int, float, bool, dict)) else str(v))
+                 for k, v in info.items()},
+    }
+
+
+def scan_image_metadata(
+    file_paths: Iterable[str],
+    **options
+) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Yield ``(path, metadata, error)`` for each path, for scanning whole libraries."""
+    for file_path in file_paths:
+        try:
+            yield file_path, extract_image_metadata_fast(file_path, **options), None
+        except (OSError, ValueError) as e:
+            yield file_path, None, str(e)
@@ -1,14 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from .auth import get_admin_user
 from .database import engine
-from .models import Base
-from .routes import auth, files, extraction, me
+from .routes import admin, auth, files, extraction, me, search
+from .search import check_search_index
+from .extraction import preload_extraction_backends
+from .compression import CompressionMiddleware
+from .metrics import PrometheusMiddleware, instrument_pool, render_metrics
+from .profiling import ProfilingMiddleware
+from .query_stats import QueryStatsMiddleware, instrument_engine
+from .signed_links import download_counter
 from .config import settings
 import os
 
-Base.metadata.create_all(bind=engine)
+# Tables are created by the migration step (create_db.py), not on import,
+# so worker processes start without touching the schema.
+
+if settings.EXTRACTION_PRELOAD:
+    preload_extraction_backends()
 
 app = FastAPI(
     title="ShareDrop API",
@@ -26,19 +37,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+
+app.add_middleware(ProfilingMiddleware)
+
+instrument_engine(engine)
+if settings.DB_QUERY_TIMING_HEADER:
+    app.add_middleware(QueryStatsMiddleware)
+
+if settings.METRICS_ENABLED:
+    # Outermost, so the timing covers CORS and error handling too
+    app.add_middleware(PrometheusMiddleware)
+    instrument_pool(engine)
+
 # Routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(files.router, prefix="/api")
 app.include_router(extraction.router, prefix="/api")
 app.include_router(me.router, prefix="/api")  # <-- Added
+app.include_router(search.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+
+@app.on_event("startup")
+def check_schema():
+    # Runs in each worker after fork, so no connection is shared with the master
+    check_search_index(engine)
+
+@app.on_event("shutdown")
+def flush_share_downloads():
+    download_counter.flush()
 
 @app.get("/api/health")
 def health_check():
     return {"status": "healthy", "message": "ShareDrop API is running"}
 
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(get_admin_user)])
+def metrics():
+    # Admins only on the public app; scrapers use the METRICS_BIND listener instead
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=getattr(exc, "headers", None))
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
@@ -46,4 +90,6 @@ async def general_exception_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
+    from create_db import create_database
+    create_database()
     uvicorn.run("app.main:app", host='localhost', port=8000, reload=True)
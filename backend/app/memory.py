@@ -0,0 +1,10 @@
+import os
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process in bytes, or 0 where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
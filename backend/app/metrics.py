@@ -0,0 +1,191 @@
+"""
+Prometheus metrics, served to admins at /metrics.
+
+Under the multi-process server the workers write their samples to
+PROMETHEUS_MULTIPROC_DIR (set up by app.server) and a scrape of any worker
+aggregates all of them. With METRICS_BIND set the server's master also serves
+them without auth on that private address, for Prometheus to scrape.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+REQUEST_LATENCY = Histogram(
+    "sharedrop_http_request_duration_seconds",
+    "Time from request start to the end of the response body.",
+    ["method", "route"]
+)
+REQUESTS = Counter(
+    "sharedrop_http_requests_total",
+    "Completed HTTP requests.",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "sharedrop_http_requests_in_progress",
+    "HTTP requests currently being served.",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+REQUEST_BYTES = Counter(
+    "sharedrop_http_request_body_bytes_total",
+    "Request body bytes received, e.g. uploads on POST /api/files/upload.",
+    ["route"]
+)
+RESPONSE_BYTES = Counter(
+    "sharedrop_http_response_body_bytes_total",
+    "Response body bytes sent, e.g. downloads on GET /api/files/{file_id}/download.",
+    ["route"]
+)
+
+EXTRACTION_STAGE_SECONDS = Histogram(
+    "sharedrop_extraction_stage_seconds",
+    "Time spent per extraction in each stage: render, mask, annotations, "
+    "text_layout and format (PDF highlights), pdf_text, keywords and image_metadata.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+EXTRACTIONS_IN_PROGRESS = Gauge(
+    "sharedrop_extractions_in_progress",
+    "Extractions currently running.",
+    ["extraction_type"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    "sharedrop_admission_wait_seconds",
+    "Time admitted requests spent queued for a rate or concurrency slot.",
+    ["policy"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+ADMISSION_REJECTIONS = Counter(
+    "sharedrop_admission_rejections_total",
+    "Requests turned away by admission control: rate, user (per-user concurrency) or capacity.",
+    ["policy", "reason"]
+)
+
+DB_POOL_SIZE = Gauge("sharedrop_db_pool_size", "Connections the pool keeps open.", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge(
+    "sharedrop_db_pool_checked_out", "Connections currently in use.", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "sharedrop_db_pool_overflow", "Connections open beyond the pool size.", multiprocess_mode="livesum"
+)
+
+
+def observe_extraction_stage(stage: str, seconds: float):
+    EXTRACTION_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def extraction_stage(stage: str):
+    """Time the enclosed block as one extraction stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_extraction_stage(stage, time.perf_counter() - started)
+
+
+def instrument_pool(engine):
+    """Track the engine's connection pool occupancy on every checkout and checkin."""
+    from sqlalchemy import event
+
+    pool = engine.pool
+    if not all(hasattr(pool, name) for name in ("size", "checkedout", "overflow")):
+        return  # NullPool and StaticPool keep no statistics
+
+    def update(*args):
+        # Read from the engine: post_fork replaces the pool in each worker
+        current = engine.pool
+        DB_POOL_SIZE.set(current.size())
+        DB_POOL_CHECKED_OUT.set(current.checkedout())
+        DB_POOL_OVERFLOW.set(max(0, current.overflow()))
+
+    event.listen(engine, "checkout", update)
+    event.listen(engine, "checkin", update)
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, so URLs with IDs share one series."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording latency, status and body sizes per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = 500
+        received = sent = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_progress.dec()
+            # The router records the matched route in the scope it was given
+            route = route_template(scope)
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            REQUESTS.labels(method, route, str(status)).inc()
+            if received:
+                REQUEST_BYTES.labels(route).inc(received)
+            if sent:
+                RESPONSE_BYTES.labels(route).inc(sent)
+
+
+def render_metrics():
+    """Body and content type of a scrape, merged across workers in multi-process mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(bind: str):
+    """Serve the aggregated metrics over plain HTTP on host:port from a background thread."""
+    from prometheus_client import multiprocess, start_http_server
+
+    host, _, port = bind.rpartition(":")
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(int(port), addr=host or "127.0.0.1", registry=registry)
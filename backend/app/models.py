@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -25,11 +25,43 @@ class File(Base):
     file_size = Column(BigInteger, nullable=False)
     content_type = Column(String, nullable=True)
     share_token = Column(String, unique=True, index=True, nullable=True)
+    content_sha256 = Column(String(64), index=True, nullable=True)  # Files with the same hash share file_path
+    storage_encoding = Column(String(16), nullable=True)  # "zstd" when file_path holds the bytes compressed
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="files")
+    extraction_results = relationship("ExtractionResult", back_populates="file", cascade="all, delete-orphan")
     
     def generate_share_token(self):
         self.share_token = str(uuid.uuid4())
         return self.share_token
+
+class ExtractionResult(Base):
+    __tablename__ = "extraction_results"
+    __table_args__ = (UniqueConstraint("file_id", "extraction_type"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False, index=True)
+    extraction_type = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, ready, failed
+    data = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    file = relationship("File", back_populates="extraction_results")
+
+class ShareRevocation(Base):
+    """A revoked signed share link, kept until the link would have expired anyway."""
+    __tablename__ = "share_revocations"
+
+    link_id = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ShareLinkDownloads(Base):
+    """Downloads counted against a signed share link's limit."""
+    __tablename__ = "share_link_downloads"
+
+    link_id = Column(String, primary_key=True)
+    downloads = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -3,15 +3,24 @@ import re
 import io
 import sys
 import argparse
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
 import html
-from typing import List, Dict, Tuple, Optional, Literal
+import json
+import math
+import time
+from typing import Callable, List, Dict, Tuple, Optional, Literal
 import fitz  # PyMuPDF
 import pypdfium2 as pdfium
-from PIL import Image
 import numpy as np
 import cv2
 from dataclasses import dataclass, field
 
+from .memory import current_rss_bytes
+
+
 @dataclass
 class TextBlock:
     """Class for storing text blocks with their formatting attributes."""
@@ -21,6 +30,15 @@ class TextBlock:
     is_italic: bool = False
     header_level: int = 0  # 0 means not a header, 1-6 for header levels
 
+    def to_dict(self) -> Dict:
+        return {
+            "text": self.text,
+            "is_header": self.is_header,
+            "is_bold": self.is_bold,
+            "is_italic": self.is_italic,
+            "header_level": self.header_level,
+        }
+
 @dataclass
 class Highlight:
     """Class for storing information about a highlight."""
@@ -28,33 +46,476 @@ class Highlight:
     rect: Tuple[float, float, float, float]  # x0, y0, x1, y1
     blocks: List[TextBlock] = field(default_factory=list)
     y_position: float = None  # Store y-position for sorting
+    color: Optional[str] = None  # HSV colour name when detected in HSV mode
     
     def __post_init__(self):
         # Extract y_position from rect if not explicitly provided
         if self.y_position is None:
             self.y_position = self.rect[1]  # y0 from rectangle
 
+    def to_dict(self) -> Dict:
+        """Structured form: 1-based page, bbox in PDF points and formatted spans."""
+        return {
+            "page": self.page_number + 1,
+            "bbox": [round(float(v), 2) for v in self.rect],
+            "color": self.color,
+            "spans": [block.to_dict() for block in self.blocks],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Highlight":
+        return cls(
+            page_number=data["page"] - 1,
+            rect=tuple(data["bbox"]),
+            blocks=[TextBlock(**span) for span in data["spans"]],
+            color=data.get("color"),
+        )
+
+
+# OpenCV HSV ranges (H in 0-179) for common highlighter colours
+HSV_HIGHLIGHT_RANGES = {
+    "yellow": ((20, 80, 150), (35, 255, 255)),
+    "green": ((40, 60, 150), (85, 255, 255)),
+    "blue": ((90, 60, 150), (110, 255, 255)),
+    "pink": ((140, 40, 150), (175, 255, 255)),
+    "orange": ((8, 100, 150), (19, 255, 255)),
+}
+
+
+def page_content_hash(doc, page_index: int) -> str:
+    """Hash everything that determines how a page renders and lays out.
+
+    Covers the page geometry, its content stream, the raw streams of images,
+    fonts and form XObjects it uses, and its annotations.
+    """
+    page = doc[page_index]
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.read_contents())
+    xrefs = {image[0] for image in page.get_images(full=True)}
+    xrefs |= {font[0] for font in page.get_fonts(full=True)}
+    xrefs |= {xobject[0] for xobject in page.get_xobjects()}
+    for xref in sorted(x for x in xrefs if x > 0):
+        digest.update(doc.xref_stream_raw(xref) or doc.xref_object(xref).encode())
+    for annot in page.annots():
+        digest.update(doc.xref_object(annot.xref).encode())
+    return digest.hexdigest()
+
+
+class SpanIndex:
+    """Grid of horizontal bands over a page's text spans for rectangle queries."""
+
+    def __init__(self, band_height: float = 24.0):
+        self.band_height = band_height
+        self.bands: Dict[int, List[tuple]] = {}
+
+    @classmethod
+    def from_page(cls, page, band_height: float = 24.0):
+        """Lay the page out once and index every span by the bands it covers."""
+        index = cls(band_height)
+        # Tight glyph boxes match how get_text(clip=...) decides which characters fall inside
+        flags = fitz.TEXTFLAGS_RAWDICT | fitz.TEXT_ACCURATE_BBOXES
+        blocks = page.get_text("rawdict", flags=flags)["blocks"]
+        for block_no, block in enumerate(blocks):
+            for line_no, line in enumerate(block.get("lines", [])):
+                for span in line.get("spans", []):
+                    index.add((block_no, line_no, span), span["bbox"][1], span["bbox"][3])
+        return index
+
+    def size_estimate(self) -> int:
+        """Rough memory footprint in bytes, for cache accounting."""
+        spans = {id(entry): entry[2] for band in self.bands.values() for entry in band}
+        return sum(256 + 160 * len(span["chars"]) for span in spans.values())
+
+    def add(self, entry, y0: float, y1: float):
+        for band in range(int(y0 // self.band_height), int(y1 // self.band_height) + 1):
+            self.bands.setdefault(band, []).append(entry)
+
+    def query(self, y0: float, y1: float):
+        """Return each entry whose bands overlap [y0, y1], without duplicates."""
+        seen = set()
+        matches = []
+        for band in range(int(y0 // self.band_height), int(y1 // self.band_height) + 1):
+            for entry in self.bands.get(band, ()):
+                if id(entry) not in seen:
+                    seen.add(id(entry))
+                    matches.append(entry)
+        return matches
+
 
 class PDFHighlightExtractor:
     """Class for extracting highlighted text from PDF files."""
     
-    def __init__(self, pdf_path: str, highlight_color: Tuple[int, int, int] = (255, 255, 0)):
+    def __init__(
+        self,
+        pdf_path: str,
+        highlight_color: Tuple[int, int, int] = (255, 255, 0),
+        tolerance: int = 50,
+        hsv_colors: Optional[List[str]] = None,
+        render_scale: float = 2.0,
+        coarse_scale: Optional[float] = 0.5,
+        min_highlight_area: float = 25.0,
+        page_cache=None,
+        cancel_token=None,
+        max_render_pixels: Optional[int] = 25_000_000,
+        rss_ceiling: Optional[int] = None,
+        stage_observer: Optional[Callable[[str, float], None]] = None
+    ):
         """Initialize the PDF highlight extractor.
         
         Args:
             pdf_path: Path to the PDF file
             highlight_color: RGB tuple of the highlight color (default: yellow)
+            tolerance: Per-channel tolerance around highlight_color
+            hsv_colors: Names from HSV_HIGHLIGHT_RANGES to match in HSV space
+                instead of highlight_color, e.g. ["yellow", "green", "pink"]
+            render_scale: Scale at which highlight bounds are measured
+            coarse_scale: Scale of the first pass that finds candidate regions
+                on pages not served from page_cache; None renders every page
+                fully at render_scale
+            min_highlight_area: Smallest highlight kept, in square PDF points
+            page_cache: Optional PageCache holding full page renders at
+                render_scale and text layouts by page content hash; cached
+                pages are only thresholded, so re-runs with other colours or
+                tolerances render nothing
+            cancel_token: Optional object whose check() raises to stop work;
+                it is called before each page is processed
+            max_render_pixels: Largest bitmap rendered in one piece; bigger
+                pages and regions are rendered as horizontal tiles. None
+                disables tiling
+            rss_ceiling: Process RSS in bytes above which the pixel budget is
+                quartered and page renders are not cached
+            stage_observer: Called on close() with (stage, seconds) for each
+                stage that ran: render, mask, annotations, text_layout, format
+        
+        Use the extractor as a context manager, or call close(), to release
+        the PyMuPDF document.
         """
         self.pdf_path = pdf_path
         self.highlight_color = highlight_color
-        self.tolerance = 50  # Color detection tolerance
+        self.tolerance = tolerance  # Color detection tolerance
         self.doc = fitz.open(pdf_path) if pdf_path else None
         self.highlights = []
+
+        unknown = set(hsv_colors or []) - set(HSV_HIGHLIGHT_RANGES)
+        if unknown:
+            raise ValueError(f"Unknown highlight colours: {', '.join(sorted(unknown))}")
+        self.hsv_ranges = [
+            (name, np.array(HSV_HIGHLIGHT_RANGES[name][0], dtype=np.uint8),
+             np.array(HSV_HIGHLIGHT_RANGES[name][1], dtype=np.uint8))
+            for name in hsv_colors or []
+        ]
+        self._bgr_bounds_cache = {}
+        self.render_scale = render_scale
+        self.coarse_scale = coarse_scale if coarse_scale and coarse_scale < render_scale else None
+        self.min_highlight_area = min_highlight_area
+        self.region_padding = 4.0  # PDF points added around coarse candidates
+        self.page_cache = page_cache
+        self._page_keys = {}
+        self.cancel_token = cancel_token
+        self.max_render_pixels = max_render_pixels
+        self.rss_ceiling = rss_ceiling
+        self.stage_observer = stage_observer
+        self.stage_seconds: Dict[str, float] = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
         
+    @contextlib.contextmanager
+    def _stage(self, name: str):
+        """Add the time spent in the block to stage_seconds[name]."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - started
+
     def _is_similar_color(self, color1, color2):
         """Check if two colors are similar within tolerance."""
         return sum(abs(c1 - c2) for c1, c2 in zip(color1, color2)) < self.tolerance
         
+    def _bgr_bounds(self, n_channels: int):
+        """Threshold bounds in pdfium's native BGR(x) order, computed once per channel count."""
+        bounds = self._bgr_bounds_cache.get(n_channels)
+        if bounds is None:
+            bgr = self.highlight_color[::-1]
+            padding = n_channels - 3  # ignore the X/alpha channel
+            lower = [max(0, c - self.tolerance) for c in bgr] + [0] * padding
+            upper = [min(255, c + self.tolerance) for c in bgr] + [255] * padding
+            bounds = (np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+            self._bgr_bounds_cache[n_channels] = bounds
+        return bounds
+
+    def _highlight_masks(self, image: np.ndarray):
+        """Yield (colour name, binary mask) pairs for a BGR(x) page image."""
+        if not self.hsv_ranges:
+            yield None, cv2.inRange(image, *self._bgr_bounds(image.shape[2]))
+            return
+
+        # One colour conversion per page, then a cheap range test per colour
+        if image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        for name, lower, upper in self.hsv_ranges:
+            yield name, cv2.inRange(hsv, lower, upper)
+
+    def _find_rects(self, image: np.ndarray, scale: float, origin=(0.0, 0.0), min_area: float = 0.0):
+        """Find highlight rectangles in a rendered image, mapped to PDF coordinates.
+        
+        Args:
+            image: BGR(x) rendering of the page or of a region of it
+            scale: Pixels per PDF point used for the rendering
+            origin: PDF coordinates of the image's top-left corner
+            min_area: Smallest contour kept, in square PDF points
+        
+        Returns:
+            List of (colour, (x0, y0, x1, y1)) tuples and the raw contour count
+        """
+        min_pixels = min_area * scale * scale
+        ox, oy = origin
+        rects = []
+        found = 0
+        with self._stage("mask"):
+            for color, mask in self._highlight_masks(image):
+                # Find contours in the mask
+                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                found += len(contours)
+                
+                for contour in contours:
+                    # Filter out small noise artifacts
+                    if cv2.contourArea(contour) < min_pixels:
+                        continue
+                    x, y, w, h = cv2.boundingRect(contour)
+                    rects.append((color, (ox + x / scale, oy + y / scale, ox + (x + w) / scale, oy + (y + h) / scale)))
+        return rects, found
+
+    def _under_memory_pressure(self) -> bool:
+        return bool(self.rss_ceiling) and current_rss_bytes() > self.rss_ceiling
+
+    def _pixel_budget(self) -> Optional[int]:
+        """Pixels allowed in one bitmap, reduced while RSS is above the ceiling."""
+        if self.max_render_pixels is None:
+            return None
+        if self._under_memory_pressure():
+            return max(1, self.max_render_pixels // 4)
+        return self.max_render_pixels
+
+    def _render_rects(self, page, scale: float, box=None, min_area: float = 0.0):
+        """Render a page, or the (x0, y0, x1, y1) box of it, and find highlight rectangles.
+        
+        Each bitmap is released as soon as it has been thresholded. When the
+        render would exceed the pixel budget it is done in horizontal tiles,
+        and rectangles cut by a tile seam are joined back together.
+        """
+        page_width, page_height = page.get_size()
+        x0, y0, x1, y1 = box or (0.0, 0.0, page_width, page_height)
+        width_px = max(1, int(round((x1 - x0) * scale)))
+        height_px = max(1, int(round((y1 - y0) * scale)))
+        budget = self._pixel_budget()
+        
+        if budget is None or width_px * height_px <= budget:
+            tiles = [(y0, y1)]
+        else:
+            rows = max(1, budget // width_px)
+            tiles = [
+                (y0 + top / scale, min(y1, y0 + (top + rows) / scale))
+                for top in range(0, height_px, rows)
+            ]
+        
+        rects, found = [], 0
+        for tile_y0, tile_y1 in tiles:
+            # crop is given as the amount to cut from the left, bottom, right and top edges
+            crop = (x0, page_height - tile_y1, page_width - x1, tile_y0)
+            with self._stage("render"):
+                bitmap = page.render(scale=scale, crop=crop) if any(crop) else page.render(scale=scale)
+            try:
+                # Zero-copy view of pdfium's buffer in its native BGR(x) channel order
+                tile_rects, tile_found = self._find_rects(
+                    bitmap.to_numpy(), scale, origin=(x0, tile_y0),
+                    min_area=min_area if len(tiles) == 1 else 0.0
+                )
+            finally:
+                bitmap.close()
+            rects.extend(tile_rects)
+            found += tile_found
+        
+        if len(tiles) > 1:
+            rects = self._join_tile_seams(rects, [tile_y1 for _, tile_y1 in tiles[:-1]], 1.5 / scale)
+            # Split contours lost their individual areas, so pieces are filtered by box area
+            rects = [r for r in rects if (r[1][2] - r[1][0]) * (r[1][3] - r[1][1]) >= min_area]
+        return rects, found
+
+    @staticmethod
+    def _join_tile_seams(rects, seams, tolerance: float):
+        """Merge rectangles cut apart by tile seams back into whole highlights.
+        
+        Pieces of one colour that touch a seam from either side and overlap
+        horizontally are joined into their common bounding box.
+        """
+        for seam in seams:
+            parent = list(range(len(rects)))
+            
+            def root(i):
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+            
+            above = [i for i, (_, r) in enumerate(rects) if abs(r[3] - seam) <= tolerance]
+            below = [i for i, (_, r) in enumerate(rects) if abs(r[1] - seam) <= tolerance]
+            for i in above:
+                for j in below:
+                    (color_a, a), (color_b, b) = rects[i], rects[j]
+                    if color_a == color_b and a[0] < b[2] and a[2] > b[0]:
+                        parent[root(j)] = root(i)
+            
+            groups = {}
+            for i, (color, r) in enumerate(rects):
+                box = groups.setdefault(root(i), [color, list(r)])[1]
+                box[:] = [min(box[0], r[0]), min(box[1], r[1]), max(box[2], r[2]), max(box[3], r[3])]
+            rects = [(color, tuple(box)) for color, box in groups.values()]
+        return rects
+
+    def _candidate_regions(self, rects, page_width: float, page_height: float):
+        """Pad and merge the rectangles found at coarse_scale into regions that may hold highlights."""
+        pad = self.region_padding
+        regions = [
+            [max(0.0, x0 - pad), max(0.0, y0 - pad), min(page_width, x1 + pad), min(page_height, y1 + pad)]
+            for _, (x0, y0, x1, y1) in rects
+        ]
+        
+        return self._merge_overlapping(regions)
+
+    @staticmethod
+    def _merge_overlapping(regions):
+        """Merge overlapping regions until none overlap, so no area is rendered twice.
+        
+        A region that grows in one pass can overlap one merged earlier, so
+        passes repeat until nothing changes.
+        """
+        merged = regions
+        changed = True
+        while changed:
+            changed = False
+            merged.sort(key=lambda r: (r[1], r[0]))
+            result = []
+            for region in merged:
+                for other in result:
+                    if region[0] < other[2] and region[2] > other[0] and region[1] < other[3] and region[3] > other[1]:
+                        other[:] = [min(region[0], other[0]), min(region[1], other[1]),
+                                    max(region[2], other[2]), max(region[3], other[3])]
+                        changed = True
+                        break
+                else:
+                    result.append(region)
+            merged = result
+        return merged
+
+    def _detect_page(self, page, page_index: int):
+        """Detect highlight rectangles on one pdfium page."""
+        image = self._cached_render(page, page_index) if self.page_cache is not None else None
+        full_page = self.coarse_scale is None or page.get_rotation()
+        if image is not None:
+            if full_page:
+                return self._find_rects(image, self.render_scale, min_area=self.min_highlight_area)
+            return self._detect_in_render(image, *page.get_size())
+        if full_page:
+            return self._render_rects(page, self.render_scale, min_area=self.min_highlight_area)
+        
+        page_width, page_height = page.get_size()
+        coarse_rects, _ = self._render_rects(page, self.coarse_scale)
+        rects, found = [], 0
+        for region in self._candidate_regions(coarse_rects, page_width, page_height):
+            region_rects, region_found = self._render_rects(
+                page, self.render_scale, region, min_area=self.min_highlight_area
+            )
+            rects.extend(region_rects)
+            found += region_found
+        return rects, found
+
+    def _detect_in_render(self, image: np.ndarray, page_width: float, page_height: float):
+        """Coarse-to-fine detection on a cached full-page render: threshold a
+        downsampled copy to find candidate regions, then only those slices."""
+        scale = self.render_scale
+        with self._stage("render"):
+            coarse_size = (max(1, round(page_width * self.coarse_scale)),
+                           max(1, round(page_height * self.coarse_scale)))
+            coarse = cv2.resize(image, coarse_size, interpolation=cv2.INTER_NEAREST)
+        coarse_rects, _ = self._find_rects(coarse, self.coarse_scale)
+        
+        rects, found = [], 0
+        for x0, y0, x1, y1 in self._candidate_regions(coarse_rects, page_width, page_height):
+            left, top = int(x0 * scale), int(y0 * scale)
+            region_rects, region_found = self._find_rects(
+                image[top:math.ceil(y1 * scale), left:math.ceil(x1 * scale)], scale,
+                origin=(left / scale, top / scale), min_area=self.min_highlight_area
+            )
+            rects.extend(region_rects)
+            found += region_found
+        return rects, found
+
+    def _page_key(self, page_index: int) -> str:
+        key = self._page_keys.get(page_index)
+        if key is None:
+            key = self._page_keys[page_index] = page_content_hash(self.doc, page_index)
+        return key
+
+    def _cached_render(self, page, page_index: int) -> Optional[np.ndarray]:
+        """Full-page render at render_scale, shared through the page cache.
+        
+        Detection on a cached page only thresholds, so a re-run with other
+        colour settings renders nothing. Returns None when the page is over
+        the pixel budget or memory is under pressure; the caller then detects
+        without caching.
+        """
+        key = ("render", self._page_key(page_index), self.render_scale)
+        image = self.page_cache.get(key)
+        if image is None:
+            width, height = page.get_size()
+            budget = self._pixel_budget()
+            if budget is not None and width * height * self.render_scale ** 2 > budget:
+                return None
+            if self._under_memory_pressure():
+                return None
+            with self._stage("render"):
+                bitmap = page.render(scale=self.render_scale)
+                try:
+                    # Copy out of pdfium's buffer so the cached array owns its memory; the X channel is unused
+                    image = bitmap.to_numpy()[:, :, :3].copy()
+                finally:
+                    bitmap.close()
+            self.page_cache.put(key, image, image.nbytes)
+        return image
+
+    def _page_layout(self, page_index: int) -> "SpanIndex":
+        """SpanIndex for a page, shared through the page cache when one is set."""
+        if self.page_cache is None:
+            return SpanIndex.from_page(self.doc[page_index])
+        key = ("layout", self._page_key(page_index))
+        index = self.page_cache.get(key)
+        if index is None:
+            index = SpanIndex.from_page(self.doc[page_index])
+            self.page_cache.put(key, index, index.size_estimate())
+        return index
+
+    def _checkpoint(self):
+        """Stop here if the caller cancelled or the deadline passed."""
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def close(self):
+        """Release the PyMuPDF document and report stage timings to the observer."""
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+        if self.stage_observer is not None:
+            for stage, seconds in self.stage_seconds.items():
+                self.stage_observer(stage, seconds)
+        self.stage_seconds = {}
+
     def detect_highlights(self):
         """Detect highlights in the PDF."""
         print(f"Scanning {self.pdf_path} for highlights...")
@@ -62,50 +523,28 @@ class PDFHighlightExtractor:
         # Use pdfium and OpenCV for highlight detection
         pdf = pdfium.PdfDocument(self.pdf_path)
         
-        for page_index in range(len(pdf)):
-            page = pdf.get_page(page_index)
-            bitmap = page.render(scale=2.0)
-            pil_image = bitmap.to_pil()
-            
-            # Convert PIL to OpenCV format
-            cv_image = np.array(pil_image)
-            cv_image = cv2.cvtColor(cv_image, cv2.COLOR_RGB2BGR)
-            
-            # Create mask for highlight color
-            lower_bound = np.array([max(0, c - self.tolerance) for c in self.highlight_color[::-1]])
-            upper_bound = np.array([min(255, c + self.tolerance) for c in self.highlight_color[::-1]])
-            mask = cv2.inRange(cv_image, lower_bound, upper_bound)
-            
-            # Find contours in the mask
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            # Get page dimensions for normalization
-            page_width, page_height = pil_image.size
-            
-            # Process each contour (highlight area)
-            for contour in contours:
-                # Filter out small noise artifacts
-                if cv2.contourArea(contour) < 100:
-                    continue
-                    
-                # Get bounding rectangle
-                x, y, w, h = cv2.boundingRect(contour)
+        try:
+            for page_index in range(len(pdf)):
+                self._checkpoint()
+                page = pdf.get_page(page_index)
+                try:
+                    rects, found = self._detect_page(page, page_index)
+                finally:
+                    page.close()
                 
-                # Normalize coordinates to PDF space
-                x0 = x / 2.0  # Divide by 2.0 because we rendered with scale=2.0
-                y0 = y / 2.0
-                x1 = (x + w) / 2.0
-                y1 = (y + h) / 2.0
+                for color, rect in rects:
+                    # Create highlight object with y_position
+                    highlight = Highlight(
+                        page_number=page_index,
+                        rect=rect,
+                        y_position=rect[1],  # Store y-position explicitly
+                        color=color
+                    )
+                    self.highlights.append(highlight)
                 
-                # Create highlight object with y_position
-                highlight = Highlight(
-                    page_number=page_index,
-                    rect=(x0, y0, x1, y1),
-                    y_position=y0  # Store y-position explicitly
-                )
-                self.highlights.append(highlight)
-            
-            print(f"  Page {page_index + 1}: Found {len(contours)} potential highlight areas")
+                print(f"  Page {page_index + 1}: Found {found} potential highlight areas")
+        finally:
+            pdf.close()
             
         # Validate with PyMuPDF annotations
         self._validate_with_annotations()
@@ -116,23 +555,68 @@ class PDFHighlightExtractor:
         """Validate highlights using PDF annotations if available."""
         highlight_annotations = []
         
-        for page_index, page in enumerate(self.doc):
-            for annot in page.annots():
-                if annot.type[0] == 8:  # Highlight annotation
-                    highlight = Highlight(
-                        page_number=page_index,
-                        rect=annot.rect,
-                        y_position=annot.rect[1]  # Store the y-position (top coordinate)
-                    )
-                    highlight_annotations.append(highlight)
+        with self._stage("annotations"):
+            for page_index, page in enumerate(self.doc):
+                self._checkpoint()
+                for annot in page.annots():
+                    if annot.type[0] == 8:  # Highlight annotation
+                        highlight = Highlight(
+                            page_number=page_index,
+                            rect=annot.rect,
+                            y_position=annot.rect[1]  # Store the y-position (top coordinate)
+                        )
+                        highlight_annotations.append(highlight)
         
         # If we found annotations, prefer these over image detection
         if highlight_annotations:
             print(f"Found {len(highlight_annotations)} highlight annotations in the PDF")
             self.highlights = highlight_annotations
             
-    def extract_text_from_highlights(self):
-        """Extract text from highlighted areas with formatting information."""
+    @staticmethod
+    def _make_text_block(span, text):
+        """Build a TextBlock from a PyMuPDF span's font attributes."""
+        # Extract formatting information
+        font_name = span.get("font", "").lower()
+        font_size = span.get("size", 0)
+        flags = span.get("flags", 0)
+        
+        # Detect text attributes
+        is_bold = "bold" in font_name or (flags & 2) != 0
+        is_italic = "italic" in font_name or "oblique" in font_name or (flags & 1) != 0
+        
+        # Check if this might be a header based on font size
+        is_header = False
+        header_level = 0
+        
+        # Basic heuristic: headers are usually larger text
+        # This may need adjustment based on your PDFs
+        base_size = 11.0  # Typical base font size
+        if font_size > base_size * 1.8:
+            is_header = True
+            header_level = 1
+        elif font_size > base_size * 1.5:
+            is_header = True
+            header_level = 2
+        elif font_size > base_size * 1.3:
+            is_header = True
+            header_level = 3
+            
+        return TextBlock(
+            text=text,
+            is_header=is_header,
+            is_bold=is_bold,
+            is_italic=is_italic,
+            header_level=header_level
+        )
+
+    def extract_text_from_highlights(self, layout: Literal["page", "clip"] = "page"):
+        """Extract text from highlighted areas with formatting information.
+        
+        Args:
+            layout: "page" lays out each page once and assigns spans to
+                highlights through a spatial index; "clip" re-runs layout for
+                every highlight rectangle
+        """
         if not self.highlights:
             print("No highlights detected. Run detect_highlights() first.")
             return []
@@ -142,7 +626,17 @@ class PDFHighlightExtractor:
         # Sort highlights by page number and then by y-position within each page
         self.highlights.sort(key=lambda h: (h.page_number, h.y_position))
         
+        with self._stage("text_layout"):
+            if layout == "page":
+                self._extract_with_page_layout()
+            else:
+                self._extract_with_clip_layout()
+        return self.highlights
+
+    def _extract_with_clip_layout(self):
+        """Assign text to highlights by laying out each highlight rectangle separately."""
         for highlight in self.highlights:
+            self._checkpoint()
             page = self.doc[highlight.page_number]
             rect = fitz.Rect(highlight.rect)
             
@@ -164,45 +658,52 @@ class PDFHighlightExtractor:
                         text = span.get("text", "").strip()
                         if not text:
                             continue
-                            
-                        # Extract formatting information
-                        font_name = span.get("font", "").lower()
-                        font_size = span.get("size", 0)
-                        flags = span.get("flags", 0)
-                        
-                        # Detect text attributes
-                        is_bold = "bold" in font_name or (flags & 2) != 0
-                        is_italic = "italic" in font_name or "oblique" in font_name or (flags & 1) != 0
-                        
-                        # Check if this might be a header based on font size
-                        is_header = False
-                        header_level = 0
-                        
-                        # Basic heuristic: headers are usually larger text
-                        # This may need adjustment based on your PDFs
-                        base_size = 11.0  # Typical base font size
-                        if font_size > base_size * 1.8:
-                            is_header = True
-                            header_level = 1
-                        elif font_size > base_size * 1.5:
-                            is_header = True
-                            header_level = 2
-                        elif font_size > base_size * 1.3:
-                            is_header = True
-                            header_level = 3
-                            
-                        # Create TextBlock object
-                        text_block = TextBlock(
-                            text=text,
-                            is_header=is_header,
-                            is_bold=is_bold,
-                            is_italic=is_italic,
-                            header_level=header_level
-                        )
-                        
-                        highlight.blocks.append(text_block)
+                        highlight.blocks.append(self._make_text_block(span, text))
+
+    def _extract_with_page_layout(self):
+        """Assign text to highlights using one rawdict layout pass per page."""
+        current_page, index = None, None
         
-        return self.highlights
+        for highlight in self.highlights:
+            if highlight.page_number != current_page:
+                self._checkpoint()
+                current_page = highlight.page_number
+                index = self._page_layout(current_page)
+            
+            x0, y0, x1, y1 = highlight.rect
+            
+            # Keep only characters intersecting the rectangle, as get_text(clip=...) does
+            lines = {}
+            for entry in index.query(y0, y1):
+                block_no, line_no, span = entry
+                sx0, sy0, sx1, sy1 = span["bbox"]
+                if sx1 <= x0 or sx0 >= x1:
+                    continue
+                # Whitespace has no glyph box, so it is tested against the span's height
+                chars = [
+                    c for c in span["chars"]
+                    if c["bbox"][0] < x1 and c["bbox"][2] > x0 and (
+                        (c["bbox"][1] < y1 and c["bbox"][3] > y0) or (c["c"].isspace() and sy0 < y1 and sy1 > y0)
+                    )
+                ]
+                if not chars:
+                    continue
+                top = min(c["bbox"][1] for c in chars)
+                line = lines.setdefault((block_no, line_no), {"top": top, "spans": []})
+                line["top"] = min(line["top"], top)
+                line["spans"].append((chars[0]["bbox"][0], span, "".join(c["c"] for c in chars)))
+            
+            # Order like the clipped layout: blocks top to bottom, lines top to bottom, spans left to right
+            block_tops = {}
+            for (block_no, _), line in lines.items():
+                block_tops[block_no] = min(block_tops.get(block_no, line["top"]), line["top"])
+            ordered = sorted(lines.items(), key=lambda item: (block_tops[item[0][0]], item[0][0], item[1]["top"]))
+            
+            for _, line in ordered:
+                for _, span, text in sorted(line["spans"], key=lambda s: s[0]):
+                    text = text.strip()
+                    if text:
+                        highlight.blocks.append(self._make_text_block(span, text))
                 
     def format_output(self, output_format: str = "markdown"):
         """ Format extracted highlights, 
@@ -220,32 +721,33 @@ class PDFHighlightExtractor:
             
         result = []
         
-        # Process highlights in the correct order (by page and then by position)
-        sorted_highlights = sorted(self.highlights, key=lambda h: (h.page_number, h.y_position))
+        with self._stage("format"):
+            # Process highlights in the correct order (by page and then by position)
+            sorted_highlights = sorted(self.highlights, key=lambda h: (h.page_number, h.y_position))
         
-        for highlight in sorted_highlights:
-            if not highlight.blocks:
-                continue
+            for highlight in sorted_highlights:
+                if not highlight.blocks:
+                    continue
                 
-            current_paragraph = []
-            current_format = None
+                current_paragraph = []
+                current_format = None
             
-            for block in highlight.blocks:
-                # If format changes or we hit a header, start a new paragraph
-                if current_format and (
-                    block.is_header != current_format.is_header or
-                    block.header_level != current_format.header_level
-                ):
-                    # Add the completed paragraph to results
-                    result.append(self._format_paragraph(current_paragraph, current_format, output_format))
-                    current_paragraph = []
+                for block in highlight.blocks:
+                    # If format changes or we hit a header, start a new paragraph
+                    if current_format and (
+                        block.is_header != current_format.is_header or
+                        block.header_level != current_format.header_level
+                    ):
+                        # Add the completed paragraph to results
+                        result.append(self._format_paragraph(current_paragraph, current_format, output_format))
+                        current_paragraph = []
                 
-                current_paragraph.append(block)
-                current_format = block
+                    current_paragraph.append(block)
+                    current_format = block
                 
-            # Add the last paragraph
-            if current_paragraph:
-                result.append(self._format_paragraph(current_paragraph, current_format, output_format))
+                # Add the last paragraph
+                if current_paragraph:
+                    result.append(self._format_paragraph(current_paragraph, current_format, output_format))
         
         if output_format == "html":
             # Wrap HTML content in basic structure
@@ -338,6 +840,12 @@ class PDFHighlightExtractor:
         else:
             return joined_text
     
+    def extract(self) -> List[Highlight]:
+        """Detect highlights and extract their text, returning those that contain text."""
+        self.detect_highlights()
+        self.extract_text_from_highlights()
+        return [h for h in self.highlights if h.blocks]
+
     def extract_and_format(self, output_path=None, output_format="markdown"):
         """Full pipeline: detect highlights, extract text, and format.
         
@@ -369,22 +877,315 @@ class PDFHighlightExtractor:
         return formatted_text
     
 
+BATCH_OUTPUT_EXTENSIONS = {"markdown": ".md", "html": ".html"}
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash used by the batch manifest to recognise processed files."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_pdfs(patterns: List[str]) -> List[Tuple[str, str]]:
+    """Expand files, directories (recursively) and globs into (path, output name) pairs.
+    
+    Files found under a directory or glob keep their path relative to it as
+    output name, so same-named PDFs in different folders do not collide.
+    """
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                for name in names:
+                    if name.lower().endswith(".pdf"):
+                        path = os.path.join(root, name)
+                        found.setdefault(os.path.abspath(path), os.path.relpath(path, pattern))
+        elif glob.has_magic(pattern):
+            # Name matches relative to the part of the pattern before the first wildcard
+            parts = pattern.split(os.sep)
+            fixed = next(i for i, part in enumerate(parts) if glob.has_magic(part))
+            root = os.sep.join(parts[:fixed]) or "."
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    found.setdefault(os.path.abspath(path), os.path.relpath(path, root))
+        elif os.path.isfile(pattern):
+            found.setdefault(os.path.abspath(pattern), os.path.basename(pattern))
+        else:
+            print(f"Warning: no such file or directory: {pattern}", file=sys.stderr)
+    return sorted(found.items())
+
+
+def load_manifest(path: str) -> Dict[Tuple[str, str], Dict]:
+    """Map (path, sha256) to the manifest entry of every file processed or recorded as a duplicate."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if entry.get("status") in ("ok", "duplicate"):
+                done[entry["path"], entry["sha256"]] = entry
+    return done
+
+
+def _drop_unrecorded_lines(jsonl_path: str, done: Dict[Tuple[str, str], Dict]):
+    """Remove highlights.jsonl lines that never got their manifest entry.
+    
+    Each result is written before its manifest line, so a crash between the
+    two leaves a line for a file the next run processes again.
+    """
+    if not os.path.exists(jsonl_path):
+        return
+    kept, dropped = [], 0
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = {}
+            if line.endswith("\n") and (entry.get("path"), entry.get("sha256")) in done:
+                kept.append(line)
+            else:
+                dropped += 1
+    if dropped:
+        _write_atomic(jsonl_path, "".join(kept))
+
+
+def _init_batch_worker():
+    # Parallelism comes from the process pool; keep OpenCV to one thread per worker
+    cv2.setNumThreads(1)
+
+
+def _process_batch_file(path: str, digest: str, options: Dict, output_format: str) -> Dict:
+    """Extract one PDF in a worker process and return a JSON-compatible record."""
+    started = time.perf_counter()
+    record = {"path": path, "sha256": digest}
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            with PDFHighlightExtractor(path, **options) as extractor:
+                highlights = extractor.extract()
+                record["pages"] = len(extractor.doc)
+                if output_format in BATCH_OUTPUT_EXTENSIONS:
+                    record["text"] = extractor.format_output(output_format)
+        record["status"] = "ok"
+        record["highlights"] = [highlight.to_dict() for highlight in highlights]
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+class BatchProgress:
+    """Single-line progress bar with throughput, written to stderr."""
+
+    def __init__(self, total: int, stream=sys.stderr, width: int = 30):
+        self.total = total
+        self.stream = stream
+        self.width = width
+        self.done = self.failed = self.pages = 0
+        self.started = time.perf_counter()
+        self._last_draw = 0.0
+        self._interactive = stream.isatty()
+
+    def update(self, record: Dict):
+        self.done += 1
+        self.failed += record["status"] != "ok"
+        self.pages += record.get("pages", 0)
+        now = time.perf_counter()
+        # Redraw at most ten times a second, or every ten seconds when logging to a file
+        interval = 0.1 if self._interactive else 10.0
+        if self.done == self.total or now - self._last_draw >= interval:
+            self._last_draw = now
+            self.draw(now)
+
+    def draw(self, now: float):
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0
+        filled = int(self.width * self.done / self.total) if self.total else self.width
+        line = (
+            f"[{'#' * filled}{'.' * (self.width - filled)}] {self.done}/{self.total}"
+            f" | {rate:.1f} files/s | {self.pages / elapsed:.1f} pages/s"
+            f" | {self.failed} failed | ETA {int(eta // 60)}m{int(eta % 60):02d}s"
+        )
+        if self._interactive:
+            self.stream.write("\r" + line + ("\n" if self.done == self.total else ""))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def run_batch(
+    paths: List[str],
+    output_dir: str,
+    output_format: str = "jsonl",
+    jobs: int = 1,
+    manifest_path: Optional[str] = None,
+    options: Optional[Dict] = None
+) -> int:
+    """Extract highlights from many PDFs in a process pool.
+    
+    Every finished file is appended to a JSON-lines manifest; a re-run skips
+    files already recorded with the same content hash, so an interrupted
+    backfill resumes where it stopped. With output_format "jsonl" results go
+    to highlights.jsonl in output_dir, otherwise to one file per PDF. A file
+    whose content was already extracted is not processed again; it gets a
+    line (and manifest entry) with duplicate_of naming the original.
+    
+    Returns the number of files that failed.
+    """
+    options = options or {}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, "manifest.jsonl")
+    jsonl_path = os.path.join(output_dir, "highlights.jsonl")
+    done = load_manifest(manifest_path)
+    if output_format == "jsonl":
+        _drop_unrecorded_lines(jsonl_path, done)
+    originals = {digest: entry for (_, digest), entry in done.items() if entry["status"] == "ok"}
+    
+    pending, duplicates, skipped = [], {}, 0
+    for path, name in collect_pdfs(paths):
+        digest = file_sha256(path)
+        if (path, digest) in done:
+            skipped += 1
+        elif digest in originals or digest in duplicates:
+            duplicates.setdefault(digest, []).append(path)
+        else:
+            # Later files with this content are recorded once this one is done
+            duplicates[digest] = []
+            pending.append((path, name, digest))
+    
+    print(
+        f"{len(pending)} PDFs to process, {skipped} already done, "
+        f"{sum(map(len, duplicates.values()))} duplicate", file=sys.stderr
+    )
+    
+    names = {path: name for path, name, _ in pending}
+    progress = BatchProgress(len(pending))
+    
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        def record_duplicates(digest: str, original: Dict):
+            for path in duplicates.pop(digest, []):
+                entry = {"sha256": digest, "path": path}
+                if original["status"] != "ok":
+                    manifest.write(json.dumps({
+                        **entry, "status": "error", "error": f"duplicate of {original['path']}: {original['error']}"
+                    }) + "\n")
+                    continue
+                if output_format == "jsonl":
+                    with open(jsonl_path, "a", encoding="utf-8") as out:
+                        out.write(json.dumps({**entry, "duplicate_of": original["path"]}) + "\n")
+                manifest.write(json.dumps({
+                    **entry, "status": "duplicate", "duplicate_of": original["path"], "output": original["output"]
+                }) + "\n")
+            manifest.flush()
+        
+        for digest, original in originals.items():
+            record_duplicates(digest, original)
+        if not pending:
+            return 0
+        
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker) as pool:
+            futures = [
+                pool.submit(_process_batch_file, path, digest, options, output_format)
+                for path, _, digest in pending
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    record = future.result()
+                    entry = {
+                        "sha256": record["sha256"],
+                        "path": record["path"],
+                        "status": record["status"],
+                        "seconds": record["seconds"],
+                    }
+                    if record["status"] == "ok":
+                        entry["highlights"] = len(record["highlights"])
+                        if output_format == "jsonl":
+                            line = {key: record[key] for key in ("path", "sha256", "pages", "highlights")}
+                            with open(jsonl_path, "a", encoding="utf-8") as out:
+                                out.write(json.dumps(line) + "\n")
+                            entry["output"] = jsonl_path
+                        else:
+                            stem = os.path.splitext(names[record["path"]])[0]
+                            entry["output"] = os.path.join(output_dir, stem + BATCH_OUTPUT_EXTENSIONS[output_format])
+                            _write_atomic(entry["output"], record["text"])
+                    else:
+                        entry["error"] = record["error"]
+                    # Written only once the output is on disk, so a crash never marks a file done early
+                    manifest.write(json.dumps(entry) + "\n")
+                    manifest.flush()
+                    record_duplicates(record["sha256"], entry)
+                    progress.update(record)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False, cancel_futures=True)
+                print(f"\nInterrupted; {progress.done} files recorded in {manifest_path}", file=sys.stderr)
+                raise
+    
+    return progress.failed
+
+
 def create_cli():
     """Create command-line interface."""
     parser = argparse.ArgumentParser(
         description="Extract highlighted text from PDF files while preserving formatting."
     )
     parser.add_argument(
-        "pdf_path", nargs="?", 
-        help="Path to the PDF file to process"
+        "pdf_path", nargs="*", 
+        help="PDF file to process; several files, directories or globs run in batch mode"
     )
     parser.add_argument(
         "-o", "--output", 
         help="Output file path (default: stdout)"
     )
     parser.add_argument(
-        "--format", choices=["markdown", "html"], default="markdown",
-        help="Output format - markdown or html (default: markdown)"
+        "--format", choices=["markdown", "html", "jsonl"], default="markdown",
+        help="Output format - markdown, html or jsonl (default: markdown)"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=2.0,
+        help="Render scale used to measure highlight bounds (default: 2.0)"
+    )
+    parser.add_argument(
+        "--coarse-scale", type=float, default=0.5,
+        help="Render scale of the candidate-finding pass; 0 disables it (default: 0.5)"
+    )
+    parser.add_argument(
+        "--colors", type=lambda value: value.split(","),
+        help=f"Comma-separated highlight colours to match in HSV space ({', '.join(HSV_HIGHLIGHT_RANGES)})"
+    )
+    parser.add_argument(
+        "--max-pixels", type=int, default=25_000_000,
+        help="Largest bitmap rendered in one piece before tiling; 0 disables tiling (default: 25000000)"
+    )
+    
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument(
+        "--output-dir",
+        help="Directory for batch results; setting it turns on batch mode"
+    )
+    batch.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="Worker processes (default: number of CPUs)"
+    )
+    batch.add_argument(
+        "--manifest",
+        help="Resume manifest path (default: OUTPUT_DIR/manifest.jsonl)"
     )
     
     return parser
@@ -397,16 +1198,49 @@ def main():
     if not args.pdf_path:
         parser.print_help()
         return
-        
-    if not os.path.exists(args.pdf_path):
-        print(f"Error: PDF file not found: {args.pdf_path}")
+    
+    options = {
+        "hsv_colors": args.colors,
+        "render_scale": args.scale,
+        "coarse_scale": args.coarse_scale or None,
+        "max_render_pixels": args.max_pixels or None,
+    }
+    
+    batch_mode = args.output_dir or len(args.pdf_path) > 1 or any(
+        os.path.isdir(path) or glob.has_magic(path) for path in args.pdf_path
+    )
+    if batch_mode:
+        if not args.output_dir:
+            parser.error("batch mode needs --output-dir")
+        try:
+            failed = run_batch(
+                args.pdf_path, args.output_dir, args.format, max(1, args.jobs), args.manifest, options
+            )
+        except KeyboardInterrupt:
+            sys.exit(130)
+        sys.exit(1 if failed else 0)
+    
+    pdf_path = args.pdf_path[0]
+    if not os.path.exists(pdf_path):
+        print(f"Error: PDF file not found: {pdf_path}")
         return
         
     try:
-        extractor = PDFHighlightExtractor(args.pdf_path)
-        print("extractor ",extractor)
-        formatted_text = extractor.extract_and_format(args.output, args.format)
-        print("formatted text", formatted_text)
+        with PDFHighlightExtractor(pdf_path, **options) as extractor:
+            if args.format == "jsonl":
+                # Keep stdout to the JSON line itself
+                with contextlib.redirect_stdout(sys.stderr):
+                    highlights = extractor.extract()
+                line = json.dumps({
+                    "path": pdf_path,
+                    "highlights": [highlight.to_dict() for highlight in highlights],
+                })
+                if args.output:
+                    _write_atomic(args.output, line + "\n")
+                else:
+                    print(line)
+                return
+            formatted_text = extractor.extract_and_format(args.output, args.format)
         
         if not args.output:
             print(f"\nExtracted and formatted text ({args.format}):")
@@ -421,4 +1255,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,207 @@
+"""
+Sampling profiler for individual requests.
+
+An admin adds "X-Profile: 1" (or ?profile=1) to a request; it runs while a
+background thread samples the Python stacks of every thread in the process,
+and the result is stored under PROFILING_DIR in folded-stack format, which
+flamegraph.pl and speedscope read directly. The response carries the
+artifact name in X-Profile-Id; download it from /api/admin/profiles.
+
+Sampling all threads covers async routes on the event loop, sync routes in
+the threadpool and extractions in their own pool alike. Each stack is rooted
+at its thread's name; requests served concurrently also show up, so profile
+on a quiet worker where possible. With PROFILING_SAMPLE_RATE set, that
+fraction of all requests is profiled the same way in the background.
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .auth import admin_email_from_token
+from .config import settings
+
+ARTIFACT_SUFFIX = ".folded"
+
+# Innermost frames of threads that are waiting for work rather than doing it
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+
+class Profile:
+    """Stack samples collected while one request runs."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stacks: Counter = Counter()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class StackSampler:
+    """One process-wide sampling thread feeding every active Profile."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: List[Profile] = []
+        self._labels: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: Profile):
+        with self._lock:
+            self._profiles.remove(profile)
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get("__name__", "?")
+            label = self._labels[code] = f"{module}.{getattr(code, 'co_qualname', code.co_name)}".replace(";", ":")
+        return label
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stack = ";".join(reversed(labels))
+            for profile in self._profiles:
+                profile.stacks[stack] += 1
+
+    def _run(self):
+        while True:
+            # Sampling under the lock means a stopped profile is never written to again
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                self._sample()
+            time.sleep(self.interval)
+
+
+sampler = StackSampler(settings.PROFILING_INTERVAL)
+
+
+def artifact_path(name: str) -> Optional[str]:
+    """Path of a stored profile, or None if the name is not one this module wrote."""
+    if not re.fullmatch(r"[\w.-]+" + re.escape(ARTIFACT_SUFFIX), name):
+        return None
+    return os.path.join(settings.PROFILING_DIR, name)
+
+
+def list_artifacts() -> List[Dict]:
+    """Stored profiles, newest first."""
+    try:
+        names = [name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(ARTIFACT_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    artifacts = []
+    for name in sorted(names, reverse=True):
+        try:
+            st = os.stat(os.path.join(settings.PROFILING_DIR, name))
+        except FileNotFoundError:
+            continue  # Pruned by another worker
+        artifacts.append({
+            "name": name,
+            "size": st.st_size,
+            "created_at": datetime.utcfromtimestamp(st.st_mtime).isoformat() + "Z"
+        })
+    return artifacts
+
+
+def save(profile: Profile):
+    """Write a profile atomically, then drop the oldest beyond PROFILING_MAX_ARTIFACTS."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILING_DIR, profile.name)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(profile.folded())
+    os.replace(path + ".tmp", path)
+
+    for artifact in list_artifacts()[settings.PROFILING_MAX_ARTIFACTS:]:
+        try:
+            os.remove(os.path.join(settings.PROFILING_DIR, artifact["name"]))
+        except FileNotFoundError:
+            pass
+
+
+def _profile_name(method: str, path: str, sampled: bool) -> str:
+    slug = re.sub(r"[^\w]+", "_", path).strip("_")[:80] or "root"
+    kind = "sampled" if sampled else "requested"
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}-{kind}-{method}-{slug}{ARTIFACT_SUFFIX}"
+
+
+def profiling_requested(scope) -> bool:
+    """True when the request asks to be profiled and carries an admin's token."""
+    headers = dict(scope["headers"])
+    flag = headers.get(b"x-profile", b"").decode("latin-1")
+    if not flag:
+        match = re.search(rb"(?:^|&)profile=([^&]*)", scope.get("query_string", b""))
+        flag = match.group(1).decode("latin-1") if match else ""
+    if flag.lower() not in ("1", "true", "yes"):
+        return False
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    return scheme.lower() == "bearer" and admin_email_from_token(token.strip()) is not None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requested and randomly sampled requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = bool(settings.ADMIN_EMAILS) and profiling_requested(scope)
+        sampled = not requested and random.random() < settings.PROFILING_SAMPLE_RATE
+        if not (requested or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(_profile_name(scope["method"], scope["path"], sampled))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start" and requested:
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.name.encode())]}
+            await send(message)
+
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(profile)
+            if requested or profile.stacks:
+                await run_in_threadpool(save, profile)
@@ -0,0 +1,142 @@
+"""
+Per-request SQL accounting.
+
+Every statement run through the engine is counted and timed against the
+QueryStats of the request it belongs to, and responses carry the totals in a
+Server-Timing header. Statements slower than DB_SLOW_QUERY_SECONDS are logged
+with their parameters. query_budget() fails a block that runs too many:
+
+    with query_budget(3):
+        client.get("/api/files/", headers=headers)   # raises if it ran more than 3 statements
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_LOGGED_PARAMETERS = 500  # characters of the parameter repr in slow-query logs
+
+
+class QueryStats:
+    """Statement count and database time accumulated for one unit of work."""
+
+    def __init__(self, record_statements: bool = False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Optional[List[str]] = [] if record_statements else None
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+# Holds a mutable QueryStats, so work in threadpool copies of the context adds to the same one
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+# query_budget blocks, which see statements from every thread
+_budgets: tuple = ()
+_budgets_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+    for budget in _budgets:
+        budget.add(statement, elapsed)
+    if settings.DB_SLOW_QUERY_SECONDS and elapsed >= settings.DB_SLOW_QUERY_SECONDS:
+        logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %.*s",
+            elapsed * 1000, " ".join(statement.split()), MAX_LOGGED_PARAMETERS, repr(parameters)
+        )
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not run for failed statements
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Count and time every statement the engine executes."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+@contextmanager
+def track_queries(record_statements: bool = False):
+    """Collect the statements run inside the block (and threads it hands work to) into a QueryStats."""
+    stats = QueryStats(record_statements)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """Fail if more than max_queries statements run during the block; the message lists them.
+
+    Counts statements from every thread, since test clients serve requests on
+    their own, so it is meant for code making one request at a time.
+    """
+    global _budgets
+    stats = QueryStats(record_statements=True)
+    with _budgets_lock:
+        _budgets = _budgets + (stats,)
+    try:
+        yield stats
+    finally:
+        with _budgets_lock:
+            _budgets = tuple(b for b in _budgets if b is not stats)
+    if stats.count > max_queries:
+        listing = "\n".join(f"  {i}. {' '.join(s.split())}" for i, s in enumerate(stats.statements, 1))
+        raise QueryBudgetExceeded(f"{stats.count} queries run, budget is {max_queries}:\n{listing}")
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware reporting each request's query count and database time.
+
+    Adds "Server-Timing: db;dur=<ms>;desc=\"<n> queries\"" to the response;
+    statements run after the response has started (streamed bodies,
+    background tasks) are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'.encode()
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing)]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
@@ -0,0 +1,21 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from ..models import User
+from ..auth import get_admin_user
+from .. import profiling
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/profiles")
+def list_profiles(admin: User = Depends(get_admin_user)):
+    """Stored request profiles, newest first."""
+    return {"profiles": profiling.list_artifacts()}
+
+@router.get("/profiles/{name}")
+def download_profile(name: str, admin: User = Depends(get_admin_user)):
+    """Download a profile in folded-stack format, for flamegraph.pl or speedscope."""
+    path = profiling.artifact_path(name)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
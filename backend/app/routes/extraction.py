@@ -1,20 +1,42 @@
+import asyncio
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from typing import Optional, Literal, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import User, File
-from ..schemas import ExtractionResponse
+from starlette.concurrency import run_in_threadpool
+from ..admission import extraction_admission
+from ..database import SessionLocal, get_db
+from ..models import User, File, ExtractionResult
+from ..schemas import ExtractionResponse, BatchExtractionRequest, HighlightPageResponse
 from ..auth import get_current_user
+from ..config import settings
+from ..extraction_jobs import get_stored_result, get_extraction_status, store_result
+from ..singleflight import single_flight
+from ..cancellation import CancellationToken, ExtractionCancelled, ExtractionTimeout, run_cancellable
 from ..extraction import (
     extract_image_metadata,
     extract_highlights_from_file,
-    is_image_file
+    extraction_key,
+    extraction_type_for,
+    get_extraction_executor,
+    is_image_file,
+    parse_hex_color,
+    render_highlights,
+    run_extraction,
+    summarize_highlights
 )
 
 router = APIRouter(prefix="/files", tags=["extraction"])
 
+UNSUPPORTED_DETAIL = {
+    "metadata": "Only image files are supported for metadata extraction.",
+    "highlights": "Only PDF files are supported for highlight extraction.",
+}
 
-@router.post("/{file_id}/extract/metadata", response_model=ExtractionResponse)
+
+@router.post("/{file_id}/extract/metadata", response_model=ExtractionResponse, dependencies=[Depends(extraction_admission)])
 def extract_file_metadata(
     file_id: int,
     current_user: User = Depends(get_current_user),
@@ -32,6 +54,10 @@ def extract_file_metadata(
     if not os.path.exists(file.file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
 
+    stored = get_stored_result(db, file_id, "metadata")
+    if stored and stored.status == "ready":
+        return ExtractionResponse(extraction_type="metadata", file_id=file_id, data=stored.data)
+
     if not is_image_file(file.file_path):
         raise HTTPException(
             status_code=400,
@@ -39,11 +65,15 @@ def extract_file_metadata(
         )
 
     try:
-        metadata = extract_image_metadata(file.file_path)
+        metadata = single_flight(
+            extraction_key(file.file_path, "metadata"),
+            lambda: extract_image_metadata(file.file_path)
+        )
+        stored = store_result(db, file_id, "metadata", data=metadata)
         return ExtractionResponse(
             extraction_type="metadata",
             file_id=file_id,
-            data=metadata
+            data=stored.data
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -51,16 +81,33 @@ def extract_file_metadata(
         raise HTTPException(status_code=500, detail="Failed to extract metadata")
 
 
-@router.post("/{file_id}/extract/highlights", response_model=ExtractionResponse)
-def extract_file_highlights(
-    file_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Extract highlights from PDF files only."""
+async def _extract_highlights_cancellable(request: Request, file_path: str, **options) -> dict:
+    """Run highlight extraction off the event loop, stopping it if the client
+    disconnects or EXTRACTION_TIMEOUT passes."""
+    def work(token):
+        return single_flight(
+            extraction_key(file_path, "highlights", **options),
+            lambda: extract_highlights_from_file(file_path, cancel_token=token, **options),
+            cancel_token=token
+        )
+
+    try:
+        return await run_cancellable(request, work, timeout=settings.EXTRACTION_TIMEOUT or None)
+    except ExtractionTimeout:
+        raise HTTPException(status_code=504, detail="Highlight extraction timed out")
+    except ExtractionCancelled:
+        # Client closed the request; nobody will read this response
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Highlight extraction cancelled")
+
+
+def _highlight_source(db: Session, file_id: int, owner_id: int, use_stored: bool = True) -> Tuple[str, str, Optional[dict]]:
+    """Look up the caller's file and its stored highlights; returns (path, content type, stored data or None).
+
+    Blocking, so the async highlight routes call it in the threadpool.
+    """
     file = db.query(File).filter(
         File.id == file_id,
-        File.owner_id == current_user.id
+        File.owner_id == owner_id
     ).first()
 
     if not file:
@@ -69,25 +116,114 @@ def extract_file_highlights(
     if not os.path.exists(file.file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    if file.content_type != "application/pdf":
+    stored = get_stored_result(db, file_id, "highlights") if use_stored else None
+    return file.file_path, file.content_type, stored.data if stored and stored.status == "ready" else None
+
+
+def _store_highlights(db: Session, file_id: int, data: dict) -> dict:
+    return store_result(db, file_id, "highlights", data=data).data
+
+
+@router.post("/{file_id}/extract/highlights", response_model=ExtractionResponse, dependencies=[Depends(extraction_admission)])
+async def extract_file_highlights(
+    request: Request,
+    file_id: int,
+    color: Optional[str] = Query(None, description="Highlight colour as #rrggbb"),
+    tolerance: Optional[int] = Query(None, ge=0, le=255),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Extract highlights from PDF files only.
+
+    Runs with a custom color or tolerance are not stored; they reuse cached
+    page renders and layouts and only redo the colour thresholding.
+    """
+    try:
+        highlight_color = parse_hex_color(color) if color else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    custom_run = highlight_color is not None or tolerance is not None
+
+    file_path, content_type, stored = await run_in_threadpool(
+        _highlight_source, db, file_id, current_user.id, use_stored=not custom_run
+    )
+    if stored is not None:
+        return ExtractionResponse(extraction_type="highlights", file_id=file_id, data=summarize_highlights(stored))
+
+    if content_type != "application/pdf":
         raise HTTPException(
             status_code=400,
             detail="Only PDF files are supported for highlight extraction."
         )
 
     try:
-        highlights_data = extract_highlights_from_file(file.file_path)
+        if custom_run:
+            highlights_data = await _extract_highlights_cancellable(
+                request, file_path, highlight_color=highlight_color, tolerance=tolerance
+            )
+        else:
+            highlights_data = await _extract_highlights_cancellable(request, file_path, include_text=True)
+            highlights_data = await run_in_threadpool(_store_highlights, db, file_id, highlights_data)
         return ExtractionResponse(
             extraction_type="highlights",
             file_id=file_id,
-            data=highlights_data
+            data=summarize_highlights(highlights_data)
         )
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to extract highlights")
 
 
+@router.get("/{file_id}/highlights", response_model=HighlightPageResponse)
+async def list_file_highlights(
+    request: Request,
+    file_id: int,
+    page: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    output_format: Optional[Literal["markdown", "html"]] = Query(None, alias="format"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Return structured highlights of a PDF, filtered by page and paginated by offset."""
+    file_path, content_type, stored = await run_in_threadpool(_highlight_source, db, file_id, current_user.id)
+
+    if content_type != "application/pdf":
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF files are supported for highlight extraction."
+        )
+
+    if not (stored and "highlights" in stored):
+        try:
+            highlights_data = await _extract_highlights_cancellable(request, file_path, include_text=True)
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception:
+            raise HTTPException(status_code=500, detail="Failed to extract highlights")
+        stored = await run_in_threadpool(_store_highlights, db, file_id, highlights_data)
+
+    all_highlights = stored["highlights"]
+    highlights = [h for h in all_highlights if h["page"] == page] if page else all_highlights
+    window = highlights[offset:offset + limit]
+
+    return HighlightPageResponse(
+        file_id=file_id,
+        total=len(highlights),
+        offset=offset,
+        limit=limit,
+        page=page,
+        pages=sorted({h["page"] for h in all_highlights}),
+        highlights=window,
+        rendered=render_highlights(window, output_format) if output_format else None
+    )
+
+
 @router.get("/{file_id}/extraction-info")
 def get_file_extraction_info(
     file_id: int,
@@ -118,5 +254,126 @@ def get_file_extraction_info(
         "supported_extraction_types": [
             "metadata" if supports_metadata else None,
             "highlights" if supports_highlights else None
-        ]
+        ],
+        "extraction_status": get_extraction_status(db, file_id)
     }
+
+
+def _extract_batch_item(
+    file_id: int,
+    file_path: str,
+    content_type: str,
+    extraction_type: str,
+    cancel_token: CancellationToken
+) -> dict:
+    """Run one batch extraction and store its result, reporting failures inline instead of raising."""
+    supported_type = extraction_type_for(content_type)
+    extraction_type = extraction_type or supported_type
+    result = {"file_id": file_id, "extraction_type": extraction_type}
+
+    if extraction_type is None:
+        result["error"] = f"Unsupported file type: {content_type}"
+    elif extraction_type != supported_type:
+        result["error"] = UNSUPPORTED_DETAIL[extraction_type]
+    elif not os.path.exists(file_path):
+        result["error"] = "File not found on disk"
+    else:
+        try:
+            # Same keys as the single-file routes, so their requests and the batch coalesce
+            params = {"include_text": True} if extraction_type == "highlights" else {}
+            data = single_flight(
+                extraction_key(file_path, extraction_type, **params),
+                lambda: run_extraction(file_path, extraction_type, cancel_token=cancel_token, **params),
+                cancel_token=cancel_token
+            )
+            db = SessionLocal()
+            try:
+                data = store_result(db, file_id, extraction_type, data=data).data
+            finally:
+                db.close()
+            result["data"] = summarize_highlights(data)
+        except ExtractionCancelled:
+            result["error"] = "Extraction cancelled"
+        except ValueError as e:
+            result["error"] = str(e)
+        except Exception:
+            result["error"] = f"Failed to extract {extraction_type}"
+    return result
+
+
+async def _stream_batch(request: Request, jobs, missing_ids, stored_lines, poll_interval: float = 0.25):
+    """Yield NDJSON lines as extractions complete, cancelling the rest if the client disconnects."""
+    for file_id in missing_ids:
+        yield json.dumps({"file_id": file_id, "error": "File not found"}) + "\n"
+    for line in stored_lines:
+        yield json.dumps(line) + "\n"
+
+    executor = get_extraction_executor()
+    token = CancellationToken()
+    pending = {asyncio.wrap_future(executor.submit(_extract_batch_item, *job, token)) for job in jobs}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield json.dumps(future.result(), default=str) + "\n"
+            if not done and await request.is_disconnected():
+                break
+    finally:
+        # Client went away (or the server cancelled the response): drop queued
+        # work and stop running extractions at the next page
+        token.cancel()
+        for future in pending:
+            future.cancel()
+
+
+@router.post("/extract/batch", dependencies=[Depends(extraction_admission)])
+def extract_files_batch(
+    request: BatchExtractionRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Extract from many files at once, streaming NDJSON results as they complete."""
+    if not request.file_ids and not request.content_type:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide file_ids or a content_type filter"
+        )
+
+    if request.file_ids and len(request.file_ids) > settings.BATCH_EXTRACTION_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_EXTRACTION_MAX_FILES} files can be extracted per batch"
+        )
+
+    query = db.query(File).filter(File.owner_id == current_user.id)
+    if request.file_ids:
+        query = query.filter(File.id.in_(request.file_ids))
+    if request.content_type:
+        query = query.filter(File.content_type.startswith(request.content_type, autoescape=True))
+    files = query.order_by(File.id).limit(settings.BATCH_EXTRACTION_MAX_FILES).all()
+
+    found_ids = {file.id for file in files}
+    missing_ids = [file_id for file_id in dict.fromkeys(request.file_ids or []) if file_id not in found_ids]
+
+    # Serve results already computed (eagerly or by earlier requests) straight from the DB
+    ready = db.query(ExtractionResult).filter(
+        ExtractionResult.file_id.in_(found_ids),
+        ExtractionResult.status == "ready"
+    ).all() if found_ids else []
+    ready_by_file = {(row.file_id, row.extraction_type): row.data for row in ready}
+
+    extraction_type = request.extraction_type.value if request.extraction_type else None
+    jobs, stored_lines = [], []
+    for file in files:
+        file_type = extraction_type or extraction_type_for(file.content_type)
+        if (file.id, file_type) in ready_by_file:
+            stored_lines.append({
+                "file_id": file.id,
+                "extraction_type": file_type,
+                "data": summarize_highlights(ready_by_file[(file.id, file_type)])
+            })
+        else:
+            jobs.append((file.id, file.file_path, file.content_type, extraction_type))
+
+    return StreamingResponse(_stream_batch(http_request, jobs, missing_ids, stored_lines), media_type="application/x-ndjson")
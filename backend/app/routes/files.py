@@ -1,18 +1,53 @@
+import hashlib
 import os
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File as FastAPIFile, Form
-from fastapi.responses import FileResponse as StreamingFileResponse
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File as FastAPIFile, Form
 from sqlalchemy.orm import Session
-from ..database import get_db
+from starlette.concurrency import run_in_threadpool
+from ..admission import upload_admission
+from ..database import SessionLocal, get_db
 from ..models import User, File
-from ..schemas import FileResponse, FileList, ShareLinkResponse, FileUploadResponse, ErrorResponse
+from ..schemas import (
+    FileResponse,
+    FileList,
+    ShareLinkResponse,
+    FileUploadResponse,
+    ErrorResponse,
+    UploadCheckRequest,
+    UploadCheckResponse,
+    UploadClaimRequest
+)
 from ..auth import get_current_user
 from ..config import settings
 from ..utils import generate_unique_filename, save_upload_file, is_allowed_file_type, format_file_size
+from ..extraction_jobs import enqueue_extraction
+from ..search import remove_file as remove_from_search_index
+from ..compression import accepts, compress_at_rest, decompress_stored, stored_file_response
+from ..dedup import (
+    InvalidChallenge,
+    delete_file_row,
+    find_stored,
+    issue_challenge,
+    proof_matches,
+    reference_stored,
+    verify_challenge
+)
+from ..share_cache import SharedFile, share_cache
+from ..signed_links import (
+    ExpiredLink,
+    InvalidLink,
+    SignedLink,
+    download_counter,
+    is_signed_token,
+    revocations,
+    sign_link,
+    verify_link
+)
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-@router.post("/upload", response_model=FileUploadResponse)
+@router.post("/upload", response_model=FileUploadResponse, dependencies=[Depends(upload_admission)])
 async def upload_file(
     file: UploadFile = FastAPIFile(...),
     current_user: User = Depends(get_current_user),
@@ -29,7 +64,8 @@ async def upload_file(
     file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
     
     try:
-        file_size = await save_upload_file(file, file_path)
+        digest = hashlib.sha256()
+        file_size = await save_upload_file(file, file_path, digest)
         
         if file_size > settings.MAX_FILE_SIZE:
             os.remove(file_path)
@@ -38,17 +74,37 @@ async def upload_file(
                 detail=f"File too large. Maximum size is {format_file_size(settings.MAX_FILE_SIZE)}"
             )
         
+        content_sha256 = digest.hexdigest()
+        stored = find_stored(db, content_sha256, file_size) if settings.UPLOAD_DEDUP else None
+        if stored is not None and not reference_stored(db, stored):
+            stored = None  # Deleted since it was found; keep this copy instead
+        if stored is None:
+            # Text types may be kept compressed; storage_encoding records whether they were
+            file_path, storage_encoding = await run_in_threadpool(compress_at_rest, file_path, file.content_type)
+        
         db_file = File(
             filename=unique_filename,
             original_filename=file.filename,
-            file_path=file_path,
+            file_path=stored.file_path if stored else file_path,
             file_size=file_size,
             content_type=file.content_type,
+            content_sha256=content_sha256,
+            storage_encoding=stored.storage_encoding if stored else storage_encoding,
             owner_id=current_user.id
         )
         db.add(db_file)
         db.commit()
         db.refresh(db_file)
+        if stored:
+            # Same bytes are already stored; keep that copy
+            os.remove(file_path)
+        
+        if settings.EAGER_EXTRACTION:
+            try:
+                enqueue_extraction(db, db_file.id, db_file.file_path, db_file.content_type)
+            except Exception:
+                # Extraction will still run on demand
+                db.rollback()
         
         return FileUploadResponse(
             message="File uploaded successfully",
@@ -63,6 +119,92 @@ async def upload_file(
             detail="Failed to upload file"
         )
 
+@router.post("/upload/check", response_model=UploadCheckResponse, dependencies=[Depends(upload_admission)])
+def check_upload(
+    request: UploadCheckRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Ask whether the server already has a file's bytes before uploading them."""
+    if not is_allowed_file_type(request.content_type):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type {request.content_type} is not allowed"
+        )
+    if request.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {format_file_size(settings.MAX_FILE_SIZE)}"
+        )
+    
+    stored = find_stored(db, request.sha256, request.size) if settings.UPLOAD_DEDUP else None
+    if stored is None:
+        return UploadCheckResponse(exists=False)
+    
+    token, challenge = issue_challenge(current_user.id, stored, request.filename, request.content_type)
+    return UploadCheckResponse(
+        exists=True,
+        challenge=token,
+        nonce=challenge.nonce.hex(),
+        offset=challenge.offset,
+        length=challenge.length
+    )
+
+@router.post("/upload/claim", response_model=FileUploadResponse, dependencies=[Depends(upload_admission)])
+def claim_upload(
+    request: UploadClaimRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Add a file whose bytes are already stored by answering the challenge from /upload/check."""
+    try:
+        challenge = verify_challenge(request.challenge, current_user.id)
+    except InvalidChallenge as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    source = db.get(File, challenge.source_file_id)
+    if source is None or source.content_sha256 != challenge.sha256 or source.file_size != challenge.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="File is no longer stored; upload it instead"
+        )
+    if not proof_matches(source, challenge, request.proof):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Proof of possession does not match"
+        )
+    if not reference_stored(db, source):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="File is no longer stored; upload it instead"
+        )
+    
+    db_file = File(
+        filename=generate_unique_filename(challenge.filename),
+        original_filename=challenge.filename,
+        file_path=source.file_path,
+        file_size=source.file_size,
+        content_type=challenge.content_type,
+        content_sha256=source.content_sha256,
+        storage_encoding=source.storage_encoding,
+        owner_id=current_user.id
+    )
+    db.add(db_file)
+    db.commit()
+    db.refresh(db_file)
+    
+    if settings.EAGER_EXTRACTION:
+        try:
+            enqueue_extraction(db, db_file.id, db_file.file_path, db_file.content_type)
+        except Exception:
+            # Extraction will still run on demand
+            db.rollback()
+    
+    return FileUploadResponse(
+        message="File uploaded successfully",
+        file=FileResponse.from_orm(db_file)
+    )
+
 @router.get("/", response_model=FileList)
 def list_files(
     skip: int = 0,
@@ -100,6 +242,7 @@ def get_file(
 @router.get("/{file_id}/download")
 def download_file(
     file_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -120,15 +263,15 @@ def download_file(
             detail="File not found on disk"
         )
     
-    return StreamingFileResponse(
-        path=file.file_path,
-        filename=file.original_filename,
-        media_type=file.content_type
-    )
+    return stored_file_response(request, file.file_path, file.original_filename, file.content_type, file.storage_encoding)
 
 @router.post("/{file_id}/share", response_model=ShareLinkResponse)
 def create_share_link(
     file_id: int,
+    expires_in: Optional[int] = Query(
+        None, ge=60, le=settings.SHARE_LINK_MAX_TTL, description="Signed links only: lifetime in seconds"
+    ),
+    max_downloads: Optional[int] = Query(None, ge=1, description="Signed links only: download limit"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -143,18 +286,70 @@ def create_share_link(
             detail="File not found"
         )
     
+    if settings.SHARE_SIGNED_LINKS:
+        token, link = sign_link(
+            file.id, file.file_path, file.original_filename, file.content_type,
+            expires_in=expires_in or min(settings.SHARE_LINK_TTL, settings.SHARE_LINK_MAX_TTL),
+            max_downloads=max_downloads,
+            storage_encoding=file.storage_encoding
+        )
+        return ShareLinkResponse(
+            share_url=f"/api/files/shared/{token}",
+            share_token=token,
+            expires_at=datetime.utcfromtimestamp(link.expires_at),
+            max_downloads=link.max_downloads
+        )
+    
     if not file.share_token:
         file.generate_share_token()
         db.commit()
         db.refresh(file)
     
-    share_url = f"/api/shared/{file.share_token}"
+    share_url = f"/api/files/shared/{file.share_token}"
     
     return ShareLinkResponse(
         share_url=share_url,
         share_token=file.share_token
     )
 
+@router.delete("/{file_id}/share")
+def revoke_share_link(
+    file_id: int,
+    token: Optional[str] = Query(None, description="Signed link to revoke; omit to revoke the stored link"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    file = db.query(File).filter(
+        File.id == file_id,
+        File.owner_id == current_user.id
+    ).first()
+    
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    if token:
+        try:
+            link = verify_link(token, check_expiry=False)
+        except InvalidLink:
+            link = None
+        if link is None or link.file_id != file.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Share link not found"
+            )
+        revocations.revoke(db, link)
+    elif file.share_token:
+        share_token = file.share_token
+        file.share_token = None
+        db.commit()
+        if share_cache is not None:
+            share_cache.invalidate(share_token)
+    
+    return {"message": "Share link revoked"}
+
 @router.delete("/{file_id}")
 def delete_file(
     file_id: int,
@@ -172,11 +367,14 @@ def delete_file(
             detail="File not found"
         )
     
-    if os.path.exists(file.file_path):
-        os.remove(file.file_path)
-    
-    db.delete(file)
-    db.commit()
+    share_token, file_path = file.share_token, file.file_path
+    remove_from_search_index(db, file.id)
+    delete_file_row(db, file)
+    if settings.SHARE_SIGNED_LINKS:
+        # Signed links name the stored bytes, which may outlive this file when deduplicated
+        revocations.revoke_file(db, file_id, file_path)
+    if share_cache is not None and share_token:
+        share_cache.invalidate(share_token)
     
     return {"message": "File deleted successfully"}
 
@@ -201,15 +399,18 @@ def rename_file(
     file.original_filename = new_name
     db.commit()
     db.refresh(file)
+    if share_cache is not None and file.share_token:
+        share_cache.invalidate(file.share_token)
     
     return {"message": "File renamed successfully", "file": FileResponse.from_orm(file)}
 
-@router.get("/shared/{share_token}")
-def download_shared_file(
-    share_token: str,
-    db: Session = Depends(get_db)
-):
-    file = db.query(File).filter(File.share_token == share_token).first()
+def resolve_share_token(share_token: str) -> SharedFile:
+    """Look a share token up in the database and stat its file."""
+    db = SessionLocal()
+    try:
+        file = db.query(File).filter(File.share_token == share_token).first()
+    finally:
+        db.close()
     
     if not file:
         raise HTTPException(
@@ -217,14 +418,107 @@ def download_shared_file(
             detail="Shared file not found"
         )
     
-    if not os.path.exists(file.file_path):
+    try:
+        stat_result = os.stat(file.file_path)
+    except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found on disk"
         )
     
-    return StreamingFileResponse(
-        path=file.file_path,
-        filename=file.original_filename,
-        media_type=file.content_type
+    shared = SharedFile(
+        file.id, file.file_path, file.original_filename, file.content_type, stat_result, file.storage_encoding
+    )
+    if share_cache is not None:
+        share_cache.put(share_token, shared)
+        share_cache.load_bytes(shared)
+    return shared
+
+def stat_signed_link(share_token: str, link: SignedLink) -> SharedFile:
+    """Stat a signed link's file directly in storage."""
+    try:
+        stat_result = os.stat(link.path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shared file not found"
+        )
+    shared = SharedFile(
+        link.file_id, link.path, link.filename, link.content_type, stat_result, link.storage_encoding
+    )
+    if share_cache is not None:
+        share_cache.put(share_token, shared)
+    return shared
+
+async def check_signed_link(share_token: str) -> SignedLink:
+    """Validate a signed link and check it has not been revoked."""
+    try:
+        link = verify_link(share_token)
+    except ExpiredLink as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    except InvalidLink:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shared file not found"
+        )
+    
+    if revocations.stale():
+        await run_in_threadpool(revocations.reload)
+    if revocations.revoked(link):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shared file not found"
+        )
+    return link
+
+async def count_download(link: SignedLink):
+    """Count a download against a limited link, raising 410 once the limit is used up."""
+    if not download_counter.fresh(link.link_id):
+        await run_in_threadpool(download_counter.load, link)
+    if download_counter.reaches_limit(link):
+        granted = await run_in_threadpool(download_counter.claim_last, link)
+    else:
+        granted = download_counter.claim(link)
+    if not granted:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Share link download limit reached")
+    if download_counter.flush_due():
+        await run_in_threadpool(download_counter.flush)
+
+@router.get("/shared/{share_token}")
+async def download_shared_file(share_token: str, request: Request):
+    # Async so cached links are served on the event loop; misses go to the threadpool
+    link = await check_signed_link(share_token) if is_signed_token(share_token) else None
+    shared = share_cache.get(share_token) if share_cache is not None else None
+    if shared is None:
+        if link is not None:
+            shared = await run_in_threadpool(stat_signed_link, share_token, link)
+        else:
+            shared = await run_in_threadpool(resolve_share_token, share_token)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and shared.etag in [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"etag": shared.etag})
+    
+    # Counted only once the file resolved and is about to be sent
+    if link is not None and link.max_downloads is not None:
+        await count_download(link)
+    
+    if share_cache is not None:
+        data = share_cache.cached_bytes(shared)
+        if data is None and shared.stat.st_size <= share_cache.max_file_bytes:
+            data = await run_in_threadpool(share_cache.load_bytes, shared)
+        if data is not None:
+            if shared.storage_encoding is None:
+                return Response(content=data, media_type=shared.content_type, headers=shared.headers)
+            headers = {**shared.headers, "vary": "Accept-Encoding"}
+            if accepts(request, shared.storage_encoding):
+                return Response(
+                    content=data,
+                    media_type=shared.content_type,
+                    headers={**headers, "content-encoding": shared.storage_encoding}
+                )
+            return Response(content=decompress_stored(data), media_type=shared.content_type, headers=headers)
+    
+    return stored_file_response(
+        request, shared.path, shared.filename, shared.content_type, shared.storage_encoding, shared.stat
     )
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import User
+from ..auth import get_current_user
+from .. import search as search_index
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("/")
+def search_files(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Search the text and highlights of the current user's extracted PDFs."""
+    if not search_index.search_available:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Full-text search is not available on this database"
+        )
+
+    results = search_index.search_files(db, current_user.id, q, limit)
+    return {"query": q, "results": results, "total": len(results)}
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 from enum import Enum
 
 
@@ -57,11 +57,32 @@ class FileList(BaseModel):
 class ShareLinkResponse(BaseModel):
     share_url: str
     share_token: str
+    expires_at: Optional[datetime] = None
+    max_downloads: Optional[int] = None
 
 class FileUploadResponse(BaseModel):
     message: str
     file: FileResponse
 
+class UploadCheckRequest(BaseModel):
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+    size: int = Field(ge=0)
+    filename: str
+    content_type: str
+
+class UploadCheckResponse(BaseModel):
+    exists: bool
+    # Present when exists: prove possession by sending
+    # sha256(bytes.fromhex(nonce) + file[offset:offset + length]) to /files/upload/claim
+    challenge: Optional[str] = None
+    nonce: Optional[str] = None
+    offset: Optional[int] = None
+    length: Optional[int] = None
+
+class UploadClaimRequest(BaseModel):
+    challenge: str
+    proof: str
+
 class ErrorResponse(BaseModel):
     detail: str
 
@@ -105,11 +126,39 @@ class HighlightsResponse(BaseModel):
     top_phrases: List[PhraseResponse]
     sample_highlights: List[str]
 
+class HighlightSpanResponse(BaseModel):
+    text: str
+    is_header: bool
+    is_bold: bool
+    is_italic: bool
+    header_level: int
+
+class HighlightItemResponse(BaseModel):
+    page: int
+    bbox: List[float]
+    color: Optional[str] = None
+    spans: List[HighlightSpanResponse]
+
+class HighlightPageResponse(BaseModel):
+    file_id: int
+    total: int
+    offset: int
+    limit: int
+    page: Optional[int] = None
+    pages: List[int]
+    highlights: List[HighlightItemResponse]
+    rendered: Optional[str] = None
+
 class ExtractionResponse(BaseModel):
     extraction_type: str
     file_id: int
     data: dict
 
+class BatchExtractionRequest(BaseModel):
+    file_ids: Optional[List[int]] = None
+    content_type: Optional[str] = None  # prefix filter, e.g. "image/"
+    extraction_type: Optional[ExtractionTypeEnum] = None  # None picks per file
+
 # Storage
 
 class StorageUsage(BaseModel):
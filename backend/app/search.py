@@ -0,0 +1,134 @@
+from typing import List, Dict, Any
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+# file_search holds one row per extracted PDF: its highlights and full text.
+# SQLite uses an FTS5 virtual table keyed by rowid = files.id; Postgres uses a
+# generated tsvector column with a GIN index. Owner filtering joins on files.
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS file_search
+       USING fts5(highlights, content, tokenize='porter unicode61')""",
+]
+
+POSTGRES_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS file_search (
+           file_id INTEGER PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+           highlights TEXT NOT NULL DEFAULT '',
+           content TEXT NOT NULL DEFAULT '',
+           document tsvector GENERATED ALWAYS AS (
+               setweight(to_tsvector('english', highlights), 'A') ||
+               setweight(to_tsvector('english', content), 'B')
+           ) STORED
+       )""",
+    "CREATE INDEX IF NOT EXISTS ix_file_search_document ON file_search USING GIN (document)",
+]
+
+SQLITE_SEARCH = text("""
+    SELECT file_search.rowid AS file_id,
+           files.original_filename AS filename,
+           -bm25(file_search, 2.0, 1.0) AS rank,
+           snippet(file_search, -1, '<mark>', '</mark>', '…', 16) AS snippet
+    FROM file_search
+    JOIN files ON files.id = file_search.rowid
+    WHERE file_search MATCH :query AND files.owner_id = :owner_id
+    ORDER BY rank DESC
+    LIMIT :limit
+""")
+
+POSTGRES_SEARCH = text("""
+    SELECT file_search.file_id AS file_id,
+           files.original_filename AS filename,
+           ts_rank(file_search.document, query) AS rank,
+           ts_headline('english', file_search.highlights || ' ' || file_search.content, query,
+                       'StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8') AS snippet
+    FROM file_search
+    JOIN files ON files.id = file_search.file_id,
+         websearch_to_tsquery('english', :query) AS query
+    WHERE file_search.document @@ query AND files.owner_id = :owner_id
+    ORDER BY rank DESC
+    LIMIT :limit
+""")
+
+search_available = True
+
+
+def _is_postgres(db_or_engine) -> bool:
+    bind = db_or_engine.get_bind() if isinstance(db_or_engine, Session) else db_or_engine
+    return bind.dialect.name == "postgresql"
+
+
+def ensure_search_index(engine: Engine):
+    """Create the full-text index table if it does not exist."""
+    global search_available
+    statements = POSTGRES_SCHEMA if _is_postgres(engine) else SQLITE_SCHEMA
+    try:
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+    except OperationalError:
+        # SQLite built without FTS5
+        search_available = False
+
+
+def check_search_index(engine: Engine):
+    """Enable search only if the migration step created the index table."""
+    global search_available
+    search_available = inspect(engine).has_table("file_search")
+
+
+def _fts5_query(query: str) -> str:
+    """Quote each term so user input cannot use FTS5 query syntax."""
+    terms = query.split()
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def index_file(db: Session, file_id: int, content: str, highlights: List[str]):
+    """Replace a file's entry in the full-text index. The caller commits."""
+    if not search_available:
+        return
+    params = {"file_id": file_id, "content": content or "", "highlights": "\n".join(highlights or [])}
+    if _is_postgres(db):
+        db.execute(text("""
+            INSERT INTO file_search (file_id, highlights, content)
+            VALUES (:file_id, :highlights, :content)
+            ON CONFLICT (file_id) DO UPDATE
+            SET highlights = EXCLUDED.highlights, content = EXCLUDED.content
+        """), params)
+    else:
+        db.execute(text("DELETE FROM file_search WHERE rowid = :file_id"), params)
+        db.execute(text("""
+            INSERT INTO file_search (rowid, highlights, content)
+            VALUES (:file_id, :highlights, :content)
+        """), params)
+
+
+def remove_file(db: Session, file_id: int):
+    """Drop a file from the full-text index. The caller commits."""
+    if not search_available:
+        return
+    column = "file_id" if _is_postgres(db) else "rowid"
+    db.execute(text(f"DELETE FROM file_search WHERE {column} = :file_id"), {"file_id": file_id})
+
+
+def search_files(db: Session, owner_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Return the owner's files matching query, best match first, with snippets."""
+    if _is_postgres(db):
+        statement, query_param = POSTGRES_SEARCH, query
+    else:
+        statement, query_param = SQLITE_SEARCH, _fts5_query(query)
+    if not query_param.strip():
+        return []
+
+    rows = db.execute(statement, {"query": query_param, "owner_id": owner_id, "limit": limit})
+    return [
+        {
+            "file_id": row.file_id,
+            "filename": row.filename,
+            "rank": float(row.rank),
+            "snippet": row.snippet,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,136 @@
+"""
+Production server runner.
+
+    python create_db.py        # one-shot schema migration
+    python -m app.server       # gunicorn master with uvicorn workers
+
+Runs WEB_WORKERS uvicorn worker processes (one per core by default) under a
+gunicorn master. The app is imported once in the master and forked, so
+workers start quickly and share its memory pages. Workers are replaced after
+WEB_MAX_REQUESTS requests (with jitter, so they do not all restart together)
+or once their RSS passes WEB_MAX_RSS, containing slow leaks in native
+extraction libraries.
+
+Signals to the master (see WEB_PIDFILE):
+    HUP   start a fresh set of workers, then gracefully stop the old ones
+    USR2  start a new master running the code now on disk; send QUIT to the
+          old master once the new one is serving
+    TERM  graceful shutdown, waiting up to WEB_GRACEFUL_TIMEOUT for requests
+
+Workers write metrics to METRICS_MULTIPROC_DIR, and /metrics on any of them
+(admins only) reports the totals across all workers. With METRICS_BIND set,
+the master also serves them without auth on that address for scrapers.
+"""
+
+import os
+import signal
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from .config import settings
+from .memory import current_rss_bytes
+
+
+class RecyclingUvicornWorker(UvicornWorker):
+    """Uvicorn worker that shuts itself down gracefully once RSS exceeds WEB_MAX_RSS.
+
+    The check runs on each heartbeat (every WEB_TIMEOUT seconds); the master
+    then forks a replacement.
+    """
+
+    _recycling = False
+
+    async def callback_notify(self) -> None:
+        await super().callback_notify()
+        if self._recycling or not settings.WEB_MAX_RSS:
+            return
+        rss = current_rss_bytes()
+        if rss > settings.WEB_MAX_RSS:
+            self._recycling = True
+            self.log.info(
+                "Worker %s RSS %.0f MB is over WEB_MAX_RSS; recycling",
+                self.pid, rss / (1024 * 1024)
+            )
+            # Uvicorn treats SIGTERM as a graceful shutdown: stop accepting, drain, exit
+            os.kill(os.getpid(), signal.SIGTERM)
+
+
+def prepare_metrics_dir():
+    """Start each server run with an empty multi-process metrics directory.
+
+    Must run before prometheus_client is imported, which reads the variable.
+    """
+    directory = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.METRICS_MULTIPROC_DIR)
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (requests in progress, pool occupancy)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    if settings.METRICS_ENABLED and settings.METRICS_BIND:
+        from .metrics import start_metrics_server
+        try:
+            start_metrics_server(settings.METRICS_BIND)
+        except OSError as e:
+            # e.g. the old master still holds the port during a USR2 upgrade
+            server.log.warning("Metrics not served on %s: %s", settings.METRICS_BIND, e)
+        else:
+            server.log.info("Serving metrics on http://%s/metrics", settings.METRICS_BIND)
+
+
+def post_fork(server, worker):
+    # Connections must not be shared across processes; let each worker open its own
+    from .database import engine
+    engine.dispose(close=False)
+
+
+class ServerApplication(BaseApplication):
+    """Gunicorn application configured from Settings rather than a config file."""
+
+    def __init__(self, app_uri: str = "app.main:app"):
+        self.app_uri = app_uri
+        super().__init__()
+
+    def load_config(self):
+        options = {
+            "bind": settings.WEB_BIND,
+            "workers": settings.WEB_WORKERS,
+            "worker_class": "app.server.RecyclingUvicornWorker",
+            "preload_app": settings.WEB_PRELOAD,
+            "max_requests": settings.WEB_MAX_REQUESTS,
+            "max_requests_jitter": settings.WEB_MAX_REQUESTS_JITTER,
+            "graceful_timeout": settings.WEB_GRACEFUL_TIMEOUT,
+            "timeout": settings.WEB_TIMEOUT,
+            "keepalive": settings.WEB_KEEPALIVE,
+            "forwarded_allow_ips": settings.WEB_FORWARDED_ALLOW_IPS,
+            "pidfile": settings.WEB_PIDFILE or None,
+            "when_ready": when_ready,
+            "post_fork": post_fork,
+            "child_exit": child_exit,
+            "accesslog": "-",
+        }
+        for key, value in options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from gunicorn.util import import_app
+        return import_app(self.app_uri)
+
+
+def main():
+    if settings.METRICS_ENABLED:
+        prepare_metrics_dir()
+    ServerApplication().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+In-process caches for the public share-link route.
+
+Resolved links (token -> path, name, type, size, etag) are kept for
+SHARE_CACHE_TTL seconds, and the bytes of files up to
+SHARE_CACHE_MAX_FILE_BYTES are kept in an LRU of SHARE_CACHE_MAX_BYTES, so a
+popular link is served without a database query or, for small files, any
+file I/O.
+
+Deleting or renaming a shared file invalidates its link in this worker and
+bumps the mtime of SHARE_CACHE_GENERATION_FILE; every worker checks that
+file (one stat) per lookup and drops its resolved links when it changes.
+Signed-link revocations use the same signal (share_changes).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from functools import cached_property
+from typing import Dict, Optional
+
+from .config import settings
+from .page_cache import PageCache
+from .utils import content_disposition
+
+
+@dataclass(frozen=True)
+class SharedFile:
+    file_id: int
+    path: str
+    filename: str
+    content_type: Optional[str]
+    stat: os.stat_result = field(repr=False)
+    storage_encoding: Optional[str] = None
+
+    @cached_property
+    def etag(self) -> str:
+        # Same value as Starlette's FileResponse, so clients revalidate either way
+        return hashlib.md5(f"{self.stat.st_mtime}-{self.stat.st_size}".encode(), usedforsecurity=False).hexdigest()
+
+    @cached_property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "content-disposition": content_disposition(self.filename),
+            "last-modified": formatdate(self.stat.st_mtime, usegmt=True),
+            "etag": self.etag,
+        }
+
+
+class ChangeSignal:
+    """Cross-process "something changed" flag: the mtime of a file, bumped by any worker."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def version(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self):
+        try:
+            with open(self.path, "a"):
+                pass
+            now = time.time_ns()
+            os.utime(self.path, ns=(now, now))
+        except OSError:
+            pass  # Readers fall back to their TTLs
+
+
+share_changes = ChangeSignal(settings.SHARE_CACHE_GENERATION_FILE)
+
+
+class ShareCache:
+    """TTL-bounded LRU of resolved share tokens plus a byte cache of small files."""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_file_bytes: int,
+        max_bytes: int,
+        changes: ChangeSignal
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_file_bytes = max_file_bytes
+        self.contents = PageCache(max_bytes) if max_bytes > 0 and max_file_bytes > 0 else None
+        self.changes = changes
+        self._generation = changes.version()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[SharedFile]:
+        generation = self.changes.version()
+        with self._lock:
+            if generation != self._generation:
+                # Another worker changed a shared file
+                self._entries.clear()
+                self._generation = generation
+                return None
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            shared, expires = entry
+            if time.monotonic() > expires:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return shared
+
+    def put(self, token: str, shared: SharedFile):
+        with self._lock:
+            self._entries[token] = (shared, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str]):
+        """Forget a token here and tell the other workers to drop their resolved links."""
+        if token:
+            with self._lock:
+                self._entries.pop(token, None)
+        self.changes.bump()
+
+    def _content_key(self, shared: SharedFile) -> Optional[tuple]:
+        if self.contents is None or shared.stat.st_size > self.max_file_bytes:
+            return None
+        # Keyed by content identity, so a replaced file never matches a stale entry
+        return (shared.path, shared.stat.st_ino, shared.stat.st_size, shared.stat.st_mtime_ns)
+
+    def cached_bytes(self, shared: SharedFile) -> Optional[bytes]:
+        """The file's bytes if they are in memory."""
+        key = self._content_key(shared)
+        return self.contents.get(key) if key is not None else None
+
+    def load_bytes(self, shared: SharedFile) -> Optional[bytes]:
+        """Read a small file into the byte cache; None if it is too big or changed on disk."""
+        key = self._content_key(shared)
+        if key is None:
+            return None
+        try:
+            with open(shared.path, "rb") as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return None
+        if len(data) != shared.stat.st_size:
+            return None
+        self.contents.put(key, data, len(data))
+        return data
+
+share_cache = ShareCache(
+    ttl=settings.SHARE_CACHE_TTL,
+    max_entries=settings.SHARE_CACHE_MAX_ENTRIES,
+    max_file_bytes=settings.SHARE_CACHE_MAX_FILE_BYTES,
+    max_bytes=settings.SHARE_CACHE_MAX_BYTES,
+    changes=share_changes
+) if settings.SHARE_CACHE_TTL > 0 else None
@@ -0,0 +1,356 @@
+"""
+Signed share links.
+
+With SHARE_SIGNED_LINKS, sharing a file returns a token of the form
+<payload>.<signature>: the payload names the file (id, storage key and
+encoding, name and type), the expiry, the permitted action and an optional download limit, and
+the signature is an HMAC over it with a key derived from SECRET_KEY and
+SHARE_KEY_VERSION. /files/shared/{token} checks all of that without the
+database and serves the file straight from UPLOAD_DIR.
+
+Revoking:
+    one link     DELETE /files/{id}/share?token=...; link ids are recorded in
+                 share_revocations and every worker keeps them as an
+                 in-memory set, reloaded when share_changes is bumped
+    one file     deleting the file records its id and storage key the same
+                 way, revoking every link to it, even when other files still
+                 share its bytes
+    every link   increment SHARE_KEY_VERSION
+
+Links live at most SHARE_LINK_MAX_TTL seconds (longer ones are rejected), so
+a file's revocation is kept only that long.
+
+Download limits are counted in memory and added to share_link_downloads in
+batches every SHARE_DOWNLOAD_FLUSH_SECONDS; each worker re-reads a link's
+stored count once its copy is older than that. The download that reaches a
+link's limit is counted directly in the database, so no two workers both
+grant it and single-use links are exact; larger limits can still overshoot
+by the downloads other workers have not flushed yet. Only downloads that are
+actually served count: 304s and missing files do not.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .database import SessionLocal
+from .models import ShareLinkDownloads, ShareRevocation
+from .share_cache import ChangeSignal, share_changes
+
+ACTION_DOWNLOAD = "download"
+SIGNATURE_BYTES = 16
+
+
+class InvalidLink(Exception):
+    """The token is malformed, forged or signed with a retired key."""
+
+
+class ExpiredLink(InvalidLink):
+    pass
+
+
+@dataclass(frozen=True)
+class SignedLink:
+    link_id: str
+    file_id: int
+    storage_key: str
+    filename: str
+    content_type: Optional[str]
+    expires_at: int  # Unix time
+    action: str
+    max_downloads: Optional[int]
+    storage_encoding: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.UPLOAD_DIR, self.storage_key)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+@lru_cache(maxsize=4)
+def _signing_key(version: int) -> bytes:
+    return hmac.new(settings.SECRET_KEY.encode(), f"share-link:{version}".encode(), hashlib.sha256).digest()
+
+
+def _signature(payload: str, version: int) -> bytes:
+    return hmac.new(_signing_key(version), payload.encode("ascii"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def sign_link(
+    file_id: int,
+    file_path: str,
+    filename: str,
+    content_type: Optional[str],
+    expires_in: int,
+    max_downloads: Optional[int] = None,
+    action: str = ACTION_DOWNLOAD,
+    storage_encoding: Optional[str] = None
+) -> Tuple[str, SignedLink]:
+    """Create a signed token for a stored file; returns the token and what it grants."""
+    link = SignedLink(
+        link_id=_b64encode(secrets.token_bytes(9)),
+        file_id=file_id,
+        storage_key=os.path.basename(file_path),
+        filename=filename,
+        content_type=content_type,
+        expires_at=int(time.time()) + expires_in,
+        action=action,
+        max_downloads=max_downloads,
+        storage_encoding=storage_encoding
+    )
+    fields = [settings.SHARE_KEY_VERSION, link.link_id, link.file_id, link.storage_key, link.filename,
+              link.content_type, link.expires_at, link.action, link.max_downloads, link.storage_encoding]
+    payload = _b64encode(json.dumps(fields, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_signature(payload, settings.SHARE_KEY_VERSION))}", link
+
+
+def is_signed_token(token: str) -> bool:
+    return "." in token
+
+
+def verify_link(token: str, action: str = ACTION_DOWNLOAD, check_expiry: bool = True) -> SignedLink:
+    """Check a token's signature, key version, action and expiry; raises InvalidLink."""
+    payload, _, signature = token.partition(".")
+    try:
+        fields = json.loads(_b64decode(payload))
+        (version, link_id, file_id, storage_key, filename, content_type, expires_at, link_action, max_downloads,
+         storage_encoding) = fields
+        given = _b64decode(signature)
+    except (ValueError, TypeError):
+        raise InvalidLink("Malformed share link")
+    if version != settings.SHARE_KEY_VERSION or not hmac.compare_digest(given, _signature(payload, version)):
+        raise InvalidLink("Invalid share link")
+    if link_action != action:
+        raise InvalidLink("Share link does not permit this action")
+    if storage_key != os.path.basename(storage_key) or storage_key in ("", ".", ".."):
+        raise InvalidLink("Invalid share link")
+    if check_expiry and time.time() > expires_at:
+        raise ExpiredLink("Share link has expired")
+    if expires_at - time.time() > settings.SHARE_LINK_MAX_TTL:
+        # File revocations are only kept this long
+        raise InvalidLink("Invalid share link")
+    return SignedLink(
+        link_id, file_id, storage_key, filename, content_type, expires_at, link_action, max_downloads, storage_encoding
+    )
+
+
+class RevocationSet:
+    """Revoked link ids, reloaded from the database whenever a worker signals a change."""
+
+    def __init__(self, changes: ChangeSignal):
+        self.changes = changes
+        self._revoked = frozenset()
+        self._loaded_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def stale(self) -> bool:
+        return self.changes.version() != self._loaded_version
+
+    def reload(self):
+        version = self.changes.version()
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.query(ShareRevocation).filter(ShareRevocation.expires_at < now).delete()
+            db.commit()
+            revoked = frozenset(link_id for (link_id,) in db.query(ShareRevocation.link_id))
+        finally:
+            db.close()
+        with self._lock:
+            self._revoked = revoked
+            self._loaded_version = version
+
+    def __contains__(self, link_id: str) -> bool:
+        return link_id in self._revoked
+
+    def revoked(self, link: SignedLink) -> bool:
+        """Whether the link itself or the file it points to has been revoked."""
+        return link.link_id in self._revoked or _file_revocation_id(link.file_id, link.storage_key) in self._revoked
+
+    def revoke(self, db, link: SignedLink):
+        self._add(db, link.link_id, datetime.utcfromtimestamp(link.expires_at))
+
+    def revoke_file(self, db, file_id: int, file_path: str):
+        """Revoke every link issued for a file, e.g. because it was deleted."""
+        expires_at = datetime.utcfromtimestamp(time.time() + settings.SHARE_LINK_MAX_TTL)
+        self._add(db, _file_revocation_id(file_id, os.path.basename(file_path)), expires_at)
+
+    def _add(self, db, revocation_id: str, expires_at: datetime):
+        if db.get(ShareRevocation, revocation_id) is None:
+            db.add(ShareRevocation(link_id=revocation_id, expires_at=expires_at))
+            db.commit()
+        self.changes.bump()
+
+
+def _file_revocation_id(file_id: int, storage_key: str) -> str:
+    # Link ids are base64, so this never collides with one; the storage key
+    # keeps a later file that reuses the id from inheriting the revocation
+    return f"file:{file_id}:{storage_key}"
+
+
+class DownloadCounter:
+    """Per-link download counts for limited links, flushed to the database in batches."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._synced: Dict[str, int] = {}  # Database count as of the last load or flush
+        self._synced_at: Dict[str, float] = {}
+        self._pending: Counter = Counter()
+        self._expiry: Dict[str, datetime] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def fresh(self, link_id: str) -> bool:
+        """Whether this worker read the link's stored count within the flush interval."""
+        synced_at = self._synced_at.get(link_id)
+        return synced_at is not None and time.monotonic() - synced_at < self.flush_interval
+
+    def load(self, link: SignedLink):
+        """Re-read a link's stored count, which includes other workers' flushed downloads."""
+        # Serialised with flush, so a count read before a flush never replaces the one after it
+        with self._flush_lock:
+            db = SessionLocal()
+            try:
+                row = db.get(ShareLinkDownloads, link.link_id)
+            finally:
+                db.close()
+            self._set_synced(link, row.downloads if row else 0)
+
+    def _set_synced(self, link: SignedLink, downloads: int):
+        with self._lock:
+            self._synced[link.link_id] = downloads
+            self._synced_at[link.link_id] = time.monotonic()
+            self._expiry[link.link_id] = datetime.utcfromtimestamp(link.expires_at)
+
+    def _used(self, link_id: str) -> int:
+        return self._synced.get(link_id, 0) + self._pending[link_id]
+
+    def reaches_limit(self, link: SignedLink) -> bool:
+        """Whether one more download would use up the link, so it must be claimed with claim_last."""
+        with self._lock:
+            return self._used(link.link_id) + 1 >= link.max_downloads
+
+    def claim(self, link: SignedLink) -> bool:
+        """Count one download if the link is under its limit."""
+        with self._lock:
+            if self._used(link.link_id) >= link.max_downloads:
+                return False
+            self._pending[link.link_id] += 1
+            self._expiry[link.link_id] = datetime.utcfromtimestamp(link.expires_at)
+            return True
+
+    def claim_last(self, link: SignedLink) -> bool:
+        """Count a download that may reach the limit with a conditional update in the database."""
+        with self._lock:
+            if self._used(link.link_id) >= link.max_downloads:
+                return False
+        # Pending downloads go in first so the condition sees them
+        self.flush()
+        with self._flush_lock:
+            db = SessionLocal()
+            try:
+                granted = self._increment_below(db, link)
+                if not granted and db.get(ShareLinkDownloads, link.link_id) is None:
+                    try:
+                        with db.begin_nested():
+                            db.add(ShareLinkDownloads(
+                                link_id=link.link_id, downloads=1, expires_at=datetime.utcfromtimestamp(link.expires_at)
+                            ))
+                        granted = True
+                    except IntegrityError:
+                        # Another worker inserted it first
+                        granted = self._increment_below(db, link)
+                db.commit()
+                downloads = db.query(ShareLinkDownloads.downloads).filter(
+                    ShareLinkDownloads.link_id == link.link_id
+                ).scalar()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            self._set_synced(link, downloads or 0)
+        return granted
+
+    @staticmethod
+    def _increment_below(db, link: SignedLink) -> bool:
+        return bool(
+            db.query(ShareLinkDownloads)
+            .filter(ShareLinkDownloads.link_id == link.link_id, ShareLinkDownloads.downloads < link.max_downloads)
+            .update({ShareLinkDownloads.downloads: ShareLinkDownloads.downloads + 1}, synchronize_session=False)
+        )
+
+    def flush_due(self) -> bool:
+        return bool(self._pending) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """Add pending counts to the database and pick up other workers' totals."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._last_flush = time.monotonic()
+            if not pending:
+                return
+            db = SessionLocal()
+            try:
+                for link_id, delta in pending.items():
+                    updated = db.query(ShareLinkDownloads).filter(ShareLinkDownloads.link_id == link_id).update(
+                        {ShareLinkDownloads.downloads: ShareLinkDownloads.downloads + delta},
+                        synchronize_session=False
+                    )
+                    if not updated:
+                        try:
+                            with db.begin_nested():
+                                db.add(ShareLinkDownloads(link_id=link_id, downloads=delta, expires_at=self._expiry[link_id]))
+                        except IntegrityError:
+                            # Another worker inserted it first
+                            db.query(ShareLinkDownloads).filter(ShareLinkDownloads.link_id == link_id).update(
+                                {ShareLinkDownloads.downloads: ShareLinkDownloads.downloads + delta},
+                                synchronize_session=False
+                            )
+                db.query(ShareLinkDownloads).filter(ShareLinkDownloads.expires_at < datetime.utcnow()).delete()
+                db.commit()
+                totals = dict(
+                    db.query(ShareLinkDownloads.link_id, ShareLinkDownloads.downloads)
+                    .filter(ShareLinkDownloads.link_id.in_(list(pending)))
+                )
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    self._pending.update(pending)  # Retry with the next flush
+                raise
+            finally:
+                db.close()
+            now, synced_at = datetime.utcnow(), time.monotonic()
+            with self._lock:
+                self._synced.update(totals)
+                self._synced_at.update(dict.fromkeys(totals, synced_at))
+                for link_id in [link_id for link_id, expiry in self._expiry.items() if expiry < now]:
+                    self._synced.pop(link_id, None)
+                    self._synced_at.pop(link_id, None)
+                    del self._expiry[link_id]
+
+
+revocations = RevocationSet(share_changes)
+download_counter = DownloadCounter(settings.SHARE_DOWNLOAD_FLUSH_SECONDS)
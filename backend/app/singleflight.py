@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+from .cancellation import CancellationToken, ExtractionCancelled
+from .config import settings
+
+POLL_INTERVAL = 0.05  # Seconds between a waiter's checks of its own cancel token
+MAX_ATTEMPTS = 3  # Leaders a caller waits on before computing without coalescing
+
+_in_flight: Dict[Hashable, Future] = {}
+_lock = threading.Lock()
+
+
+def file_identity(file_path: str) -> tuple:
+    """Cheap identity of a file's on-disk content (device, inode, size, mtime)."""
+    st = os.stat(file_path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _key_digest(key: Hashable) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+_directory_ready = False
+
+
+def _private_directory() -> str:
+    """SINGLEFLIGHT_DIR, created and kept readable by this user only."""
+    global _directory_ready
+    directory = settings.SINGLEFLIGHT_DIR
+    if not _directory_ready:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        if st.st_uid != os.getuid():
+            raise RuntimeError(f"{directory} is owned by another user")
+        if st.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+        _directory_ready = True
+    return directory
+
+
+def _holds_current(lock_file, lock_path: str) -> bool:
+    """Whether lock_file is still the file at lock_path, i.e. its last holder has not unlinked it."""
+    try:
+        st = os.stat(lock_path)
+    except FileNotFoundError:
+        return False
+    held = os.fstat(lock_file.fileno())
+    return (st.st_dev, st.st_ino) == (held.st_dev, held.st_ino)
+
+
+def _read_result(path: str):
+    """A result another worker shared, unless it is missing or older than SINGLEFLIGHT_RESULT_TTL."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > settings.SINGLEFLIGHT_RESULT_TTL:
+                return None
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_result(path: str, payload: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _sweep(directory: str):
+    """Remove lock files whose result has expired or was never written, unless a worker holds them."""
+    for name in os.listdir(directory):
+        if not name.endswith(".lock"):
+            continue
+        lock_path = os.path.join(directory, name)
+        result_path = lock_path[:-len(".lock")] + ".json"
+        if _read_result(result_path) is not None:
+            continue
+        try:
+            fd = os.open(lock_path, os.O_RDWR)
+        except FileNotFoundError:
+            continue
+        with os.fdopen(fd, 'r+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            if _holds_current(lock_file, lock_path) and _read_result(result_path) is None:
+                _remove(result_path)
+                _remove(lock_path)
+
+
+def _plain(result: Any) -> Any:
+    return json.loads(json.dumps(result, default=str))
+
+
+def _wait_shared(lock_file, cancel_token: Optional[CancellationToken]):
+    """Take lock_file shared once its leader lets go, giving up when cancel_token says so."""
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if cancel_token is not None:
+                cancel_token.check()
+            time.sleep(POLL_INTERVAL)
+
+
+def _run_across_processes(key: Hashable, fn: Callable[[], Any], cancel_token: Optional[CancellationToken]) -> Any:
+    """Run fn under a per-key file lock, sharing its JSON result with workers waiting on it.
+
+    The leader holds the lock exclusively while it computes and writes the
+    result before letting go, so the workers queued for a shared lock all find
+    it. Results stay readable for SINGLEFLIGHT_RESULT_TTL seconds, which also
+    serves callers arriving just after the leader finished; each leader then
+    sweeps out expired results and their lock files. A lock file is only
+    unlinked by a process holding it exclusively; the others notice and start
+    over on a new one. After MAX_ATTEMPTS leaders fail, fn runs here alone.
+    """
+    if fcntl is None:
+        return _plain(fn())
+
+    directory = _private_directory()
+    digest = _key_digest(key)
+    lock_path = os.path.join(directory, f"{digest}.lock")
+    result_path = os.path.join(directory, f"{digest}.json")
+
+    for _ in range(MAX_ATTEMPTS):
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'r+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is computing this key; its result is written before it lets go
+                _wait_shared(lock_file, cancel_token)
+                if _holds_current(lock_file, lock_path):
+                    result = _read_result(result_path)
+                    if result is not None:
+                        return result
+                # The leader failed or its lock file was swept: try to lead
+                continue
+            if not _holds_current(lock_file, lock_path):
+                continue
+            result = _read_result(result_path)
+            if result is not None:
+                return result
+            payload = json.dumps(fn(), default=str)
+            _write_result(result_path, payload)
+        _sweep(directory)
+        return json.loads(payload)
+    return _plain(fn())
+
+
+def _wait(future: Future, cancel_token: Optional[CancellationToken]) -> Any:
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except FutureTimeout:
+            if cancel_token is not None:
+                cancel_token.check()
+
+
+def _forget(key: Hashable):
+    with _lock:
+        _in_flight.pop(key, None)
+
+
+def single_flight(key: Hashable, fn: Callable[[], Any], cancel_token: Optional[CancellationToken] = None) -> Any:
+    """Run fn once for concurrent callers with the same key; all get its result.
+
+    Threads in this process wait on the leader's future. Other uvicorn worker
+    processes coalesce through a lock and result file in SINGLEFLIGHT_DIR,
+    kept for SINGLEFLIGHT_RESULT_TTL seconds after the leader finishes.
+    Waiting callers still honour their own cancel_token, and stop waiting on
+    leaders after MAX_ATTEMPTS of them were cancelled.
+    Results are returned as plain JSON-compatible data.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        with _lock:
+            future = _in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = _in_flight[key] = Future()
+        if leader:
+            break
+        try:
+            return _wait(future, cancel_token)
+        except ExtractionCancelled:
+            # The leader's client went away; this caller still wants the result unless it has gone too
+            if cancel_token is not None:
+                cancel_token.check()
+    else:
+        return _plain(fn())
+
+    try:
+        result = _run_across_processes(key, fn, cancel_token)
+    except BaseException as e:
+        # Forgotten first, so waiters retrying after a cancelled leader do not find it again
+        _forget(key)
+        future.set_exception(e)
+        raise
+    _forget(key)
+    future.set_result(result)
+    return result
@@ -1,6 +1,7 @@
 import os
 import uuid
 from typing import Optional
+from urllib.parse import quote
 from fastapi import UploadFile
 from .config import settings
 import aiofiles
@@ -11,15 +12,24 @@ def generate_unique_filename(original_filename: str) -> str:
     unique_id = str(uuid.uuid4())[:8]
     return f"{unique_id}_{name}{ext}"
 
-async def save_upload_file(upload_file: UploadFile, destination: str) -> int:
-    """Save uploaded file and return file size."""
+async def save_upload_file(upload_file: UploadFile, destination: str, digest=None) -> int:
+    """Save uploaded file and return file size, feeding the bytes to digest if given."""
     size = 0
     async with aiofiles.open(destination, 'wb') as f:
         while chunk := await upload_file.read(1024):
             size += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
             await f.write(chunk)
     return size
 
+def content_disposition(filename: str) -> str:
+    """Content-Disposition value for downloading a file under its original name."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
 def is_allowed_file_type(content_type: str) -> bool:
     """Check if the file type is allowed."""
     # For now, we'll allow most common file types
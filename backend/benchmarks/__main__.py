@@ -0,0 +1,66 @@
+"""
+Offline benchmark suite.
+
+    python -m benchmarks -o results.json
+    python -m benchmarks --compare baseline.json -o results.json
+
+Runs against a throwaway SQLite database and upload directory, so it never
+touches the configured database. Results are written as JSON (medians,
+percentiles, ops/s per benchmark, plus commit and machine details) so runs
+from two commits can be compared.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+
+from .harness import isolate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--suite", choices=["micro", "e2e", "all"], default="all")
+    parser.add_argument("--rounds", type=int, default=20, help="Timed rounds per benchmark (default: 20)")
+    parser.add_argument("--quick", action="store_true", help="Few rounds, for a smoke check")
+    parser.add_argument("-o", "--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative median slowdown reported as a regression (default: 0.10)")
+    args = parser.parse_args()
+    rounds = 3 if args.quick else args.rounds
+
+    with tempfile.TemporaryDirectory(prefix="sharedrop-bench-") as workdir:
+        isolate(workdir)
+        from . import e2e, micro
+        from .harness import compare, environment, write_results
+
+        results = {}
+        if args.suite in ("micro", "all"):
+            results.update(micro.run(workdir, rounds))
+        if args.suite in ("e2e", "all"):
+            results.update(e2e.run(rounds))
+
+    width = max(len(name) for name in results)
+    for name, stats in results.items():
+        print(f"{name:<{width}}  {stats['median_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms")
+
+    current = {"meta": environment(), "results": results}
+    if args.output:
+        write_results(args.output, results, current["meta"])
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = 0
+        print(f"\nAgainst {baseline['meta'].get('commit') or args.compare}:")
+        for name, before, after, change, regressed in compare(baseline, current, args.threshold):
+            regressions += regressed
+            marker = "  REGRESSION" if regressed else ""
+            print(f"{name:<{width}}  {before:>10.3f} -> {after:>10.3f} ms  {change:+7.1%}{marker}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
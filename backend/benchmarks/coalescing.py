@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing across worker processes.
+
+    python -m benchmarks.coalescing
+
+Starts several processes on a barrier, all asking single_flight for the
+same key, and fails (exit 1) unless the computation ran exactly once per
+round and every process got its result. Also checks that a caller waiting
+on a slow leader, in another thread or another process, gives up at its
+own deadline.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from .harness import isolate
+
+PROCESSES = 4
+ROUNDS = 10
+LEADER_SECONDS = 2.0
+WAITER_TIMEOUT = 0.3
+
+
+def _caller(barrier, key, calls_path, results):
+    from app.singleflight import single_flight
+
+    def compute():
+        with open(calls_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.2)
+        return {"key": key}
+
+    barrier.wait()
+    results.put(single_flight(key, compute))
+
+
+def _slow_leader(started, key):
+    from app.singleflight import single_flight
+
+    def compute():
+        started.set()
+        time.sleep(LEADER_SECONDS)
+        return {}
+
+    single_flight(key, compute)
+
+
+def _waiter_gives_up(key) -> float:
+    """Seconds until a waiter with a WAITER_TIMEOUT deadline stopped waiting on key, or None if it did not."""
+    from app.cancellation import CancellationToken, ExtractionTimeout
+    from app.singleflight import single_flight
+
+    started = time.monotonic()
+    try:
+        single_flight(key, lambda: {}, cancel_token=CancellationToken(WAITER_TIMEOUT))
+    except ExtractionTimeout:
+        return time.monotonic() - started
+    return None
+
+
+def check_deadlines(context) -> int:
+    failures = 0
+    leaders = {
+        "thread": lambda started, key: threading.Thread(target=_slow_leader, args=(started, key)),
+        "process": lambda started, key: context.Process(target=_slow_leader, args=(started, key)),
+    }
+    for name, make_leader in leaders.items():
+        key = ("deadline", name)
+        started = threading.Event() if name == "thread" else context.Event()
+        leader = make_leader(started, key)
+        leader.start()
+        started.wait(10)
+        waited = _waiter_gives_up(key)
+        leader.join()
+        ok = waited is not None and waited < LEADER_SECONDS / 2
+        failures += not ok
+        outcome = f"gave up after {waited:.2f}s" if waited is not None else "waited for the leader"
+        print(f"waiter on a {name} leader  {outcome}  {'ok' if ok else 'FAILED'}")
+    return failures
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="sharedrop-coalescing-") as workdir:
+        isolate(workdir)
+        import app.singleflight  # noqa: F401  Loaded once here so the children fork with it
+        context = multiprocessing.get_context("fork")
+        failures = 0
+        for round_ in range(ROUNDS):
+            key = ("coalescing", round_)
+            calls_path = os.path.join(workdir, f"calls-{round_}")
+            barrier = context.Barrier(PROCESSES)
+            results = context.Queue()
+            processes = [
+                context.Process(target=_caller, args=(barrier, key, calls_path, results))
+                for _ in range(PROCESSES)
+            ]
+            for process in processes:
+                process.start()
+            returned = [results.get(timeout=30) for _ in processes]
+            for process in processes:
+                process.join()
+            with open(calls_path) as f:
+                calls = len(f.readlines())
+            ok = calls == 1 and returned == [{"key": list(key)}] * PROCESSES
+            failures += not ok
+            print(f"round {round_ + 1:>2}  {calls} computation(s)  {'ok' if ok else 'FAILED'}")
+        failures += check_deadlines(context)
+    if failures:
+        print(f"{failures} check(s) failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
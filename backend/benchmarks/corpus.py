@@ -0,0 +1,151 @@
+"""
+Synthetic inputs for the benchmarks: PDFs with highlighted text and images
+with EXIF metadata. Everything is generated from a seed so runs are
+reproducible offline.
+"""
+
+import os
+import random
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+WORDS = (
+    "archive budget contract delivery estimate forecast governance handover invoice "
+    "journal ledger milestone network operations payment quarterly revenue schedule "
+    "storage transfer upload vendor workflow account analysis approval backlog capacity "
+    "compliance customer deadline document evidence finance incident inventory license"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def make_pdf(
+    path: str,
+    pages: int = 10,
+    highlights_per_page: int = 8,
+    mode: str = "painted",
+    seed: int = 0,
+    poster: bool = False
+) -> str:
+    """Write a PDF of text lines, some of them highlighted.
+
+    Args:
+        pages: Letter-size pages of 20 text lines each
+        highlights_per_page: Lines per page marked as highlighted
+        mode: "painted" draws yellow rectangles under the text, as scanned or
+            flattened highlights look; "annotations" adds highlight annotations
+        poster: Append a 2400x3400 pt page, large enough to force tiled rendering
+    """
+    if mode not in ("painted", "annotations"):
+        raise ValueError(f"Unknown highlight mode: {mode}")
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=612, height=792)
+        highlighted = set(rng.sample(range(20), min(highlights_per_page, 20)))
+        for line in range(20):
+            y = 60 + line * 34
+            text = _sentence(rng, rng.randint(6, 10))
+            if line in highlighted:
+                width = fitz.get_text_length(text, fontsize=11)
+                rect = fitz.Rect(50, y - 12, 58 + width, y + 4)
+                if mode == "painted":
+                    page.draw_rect(rect, color=None, fill=(1, 1, 0))
+            page.insert_text((54, y), text, fontsize=11)
+            if line in highlighted and mode == "annotations":
+                page.add_highlight_annot(rect)
+    if poster:
+        page = doc.new_page(width=2400, height=3400)
+        for line in range(40):
+            y = 100 + line * 80
+            page.draw_rect(fitz.Rect(100, y - 30, 1800, y + 10), color=None, fill=(1, 1, 0))
+            page.insert_text((110, y), _sentence(rng, 8), fontsize=28)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_clustered_pdf(path: str, seed: int = 0) -> str:
+    """Write a page of highlights packed closely enough that their padded regions chain together.
+
+    Each block has two short highlights on one line and a long one on the
+    next, which spans both: merging the long one's region into the first
+    makes it overlap the second only after that has been placed.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    for block in range(8):
+        y = 60 + block * 80
+        boxes = [(100, y, 200, y + 12), (300, y, 400, y + 12), (100, y + 16, 500, y + 28)]
+        for x0, y0, x1, y1 in boxes:
+            page.draw_rect(fitz.Rect(x0, y0, x1, y1), color=None, fill=(1, 1, 0))
+            page.insert_text((x0 + 2, y1 - 2), _sentence(rng, 3), fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_text(words: int, seed: int = 0) -> str:
+    """Plain prose of roughly the given word count."""
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 16))
+        sentences.append(_sentence(rng, length))
+        words -= length
+    return " ".join(sentences)
+
+
+def make_image(
+    path: str,
+    image_format: str = "JPEG",
+    size: Tuple[int, int] = (1024, 768),
+    exif: bool = True,
+    seed: int = 0
+) -> str:
+    """Write a noisy gradient image, with camera and GPS EXIF tags where the format allows."""
+    from PIL import Image
+    from PIL.ExifTags import IFD
+
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    image = Image.blend(image, Image.effect_noise(size, 64).convert("RGB"), 0.3)
+
+    options = {}
+    if exif and image_format in ("JPEG", "PNG", "WEBP"):
+        data = Image.Exif()
+        data[0x010F] = "BenchCam"  # Make
+        data[0x0110] = f"Model {rng.randint(1, 9)}"  # Model
+        data[0x0132] = "2024:01:02 03:04:05"  # DateTime
+        data.get_ifd(IFD.Exif)[0x829A] = 1 / 125  # ExposureTime
+        gps = data.get_ifd(IFD.GPSInfo)
+        gps[1] = "N"
+        gps[2] = (52.0, 22.0, 12.5)
+        gps[3] = "E"
+        gps[4] = (4.0, 53.0, 30.1)
+        options["exif"] = data.tobytes()
+    image.save(path, image_format, **options)
+    return path
+
+
+def make_image_corpus(
+    directory: str,
+    count: int = 12,
+    formats: Tuple[str, ...] = ("JPEG", "PNG", "WEBP", "GIF"),
+    size: Tuple[int, int] = (1024, 768)
+) -> List[str]:
+    """Write count images cycling through formats; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    extensions = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif", "BMP": ".bmp"}
+    paths = []
+    for i in range(count):
+        image_format = formats[i % len(formats)]
+        path = os.path.join(directory, f"image-{i:04d}{extensions[image_format]}")
+        paths.append(make_image(path, image_format, size=size, seed=i))
+    return paths
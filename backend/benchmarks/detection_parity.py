@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Coarse-to-fine highlight detection against the single full-page pass.
+
+    python -m benchmarks.detection_parity
+
+Detects highlights in generated PDFs with the default coarse_scale (without
+a page cache, then cold and warm through one, and warm again with another
+tolerance) and with coarse_scale=None, and fails (exit 1) when any run
+disagrees with the single pass, listing the rectangles only one of them
+found. Covers evenly spaced highlights, closely packed ones whose candidate
+regions merge in chains, and a page large enough to be tiled.
+
+Also fails unless re-runs served from the page cache, with the other
+tolerance, take at most RERUN_MAX_RATIO of the time of cold runs that fill
+it. Pages over the pixel budget are never cached, so documents with such a
+page are not timed.
+"""
+
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from .harness import isolate
+
+RERUN_TOLERANCE = 40
+RERUN_MAX_RATIO = 0.75
+TIMING_ROUNDS = 5
+
+
+def timed_detect(path: str, **options):
+    """Highlights found, as a Counter of (page, rect), and the seconds detection took."""
+    from app.pdf_extractor import PDFHighlightExtractor
+
+    # The extractor reports progress on stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with PDFHighlightExtractor(path, **options) as extractor:
+            started = time.perf_counter()
+            extractor.detect_highlights()
+            seconds = time.perf_counter() - started
+            return Counter(
+                (h.page_number, tuple(round(v, 1) for v in h.rect)) for h in extractor.highlights
+            ), seconds
+
+
+def detect(path: str, **options) -> Counter:
+    return timed_detect(path, **options)[0]
+
+
+def cache_timings(path: str):
+    """Median seconds of cold runs filling a fresh page cache and of re-runs with
+    RERUN_TOLERANCE served from it, or None when not every page was cached."""
+    import fitz
+    from app.page_cache import PageCache
+
+    with fitz.open(path) as doc:
+        pages = len(doc)
+    cold, rerun = [], []
+    for _ in range(TIMING_ROUNDS):
+        cache = PageCache(256 * 1024 * 1024)
+        cold.append(timed_detect(path, page_cache=cache)[1])
+        if cache.stats()["entries"] < pages:
+            return None
+        rerun.append(timed_detect(path, page_cache=cache, tolerance=RERUN_TOLERANCE)[1])
+    return statistics.median(cold), statistics.median(rerun)
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="sharedrop-parity-") as workdir:
+        isolate(workdir)
+        from app.page_cache import PageCache
+        from . import corpus
+
+        documents = {
+            "painted": corpus.make_pdf(os.path.join(workdir, "painted.pdf"), pages=4, highlights_per_page=8),
+            "dense": corpus.make_pdf(os.path.join(workdir, "dense.pdf"), pages=4, highlights_per_page=20, seed=1),
+            "clustered": corpus.make_clustered_pdf(os.path.join(workdir, "clustered.pdf")),
+            "poster": corpus.make_pdf(os.path.join(workdir, "poster.pdf"), pages=1, poster=True),
+        }
+        failures = 0
+        for name, path in documents.items():
+            full = detect(path, coarse_scale=None)
+            cache = PageCache(64 * 1024 * 1024)
+            runs = {
+                "coarse-to-fine": (detect(path), full),
+                "page cache cold": (detect(path, page_cache=cache), full),
+                "page cache warm": (detect(path, page_cache=cache), full),
+                f"page cache tolerance {RERUN_TOLERANCE}": (
+                    detect(path, page_cache=cache, tolerance=RERUN_TOLERANCE),
+                    detect(path, coarse_scale=None, tolerance=RERUN_TOLERANCE)
+                ),
+            }
+            mismatched = {run: (found, expected) for run, (found, expected) in runs.items() if found != expected}
+            timings = cache_timings(path)
+            if timings is None:
+                faster, timing = True, "not timed, a page is too large to cache"
+            else:
+                cold, rerun = timings
+                faster = rerun <= cold * RERUN_MAX_RATIO
+                timing = f"cold {cold * 1000:.1f} ms, re-run {rerun * 1000:.1f} ms"
+            if not mismatched and faster:
+                print(f"{name:<10} {sum(full.values()):>4} highlights  {timing}  ok")
+                continue
+            failures += 1
+            print(f"{name:<10} {'MISMATCH' if mismatched else 'RE-RUN NOT FASTER'}  {timing}")
+            for run, (found, expected) in mismatched.items():
+                for label, extra in ((f"{run} only", found - expected), ("single pass only", expected - found)):
+                    for (page, rect), count in sorted(extra.items()):
+                        print(f"  {label}: page {page + 1} {rect} x{count}")
+    if failures:
+        print(f"{failures} document(s) differ from single-pass detection or re-run slowly", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
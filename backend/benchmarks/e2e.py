@@ -0,0 +1,86 @@
+"""
+End-to-end benchmarks through the ASGI app in-process (no network): upload,
+download and file listing, including auth and database work.
+"""
+
+import os
+from typing import Any, Dict
+
+from .harness import measure_async
+
+FILES_FOR_LISTING = 250
+
+
+async def _run(rounds: int) -> Dict[str, Any]:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.models import Base, User
+    from app.search import ensure_search_index
+
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+
+    # The account is created directly: password hashing is deliberately slow
+    # and is not what these benchmarks measure
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == "bench@example.com").first()
+        if user is None:
+            db.add(User(email="bench@example.com", username="bench", hashed_password="!"))
+            db.commit()
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench@example.com'})}"}
+
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+
+        async def upload(payload: bytes, name: str = "payload.zip"):
+            response = await client.post(
+                "/api/files/upload",
+                files={"file": (name, payload, "application/zip")},
+                headers=headers
+            )
+            response.raise_for_status()
+            return response.json()["file"]["id"]
+
+        sizes = (("64KB", 64 * 1024), ("1MB", 1024 * 1024), ("16MB", 16 * 1024 * 1024))
+        download_ids = {}
+        for label, size in sizes:
+            payload = os.urandom(size)
+            download_ids[label] = await upload(payload)
+            results[f"files.upload.{label}"] = await measure_async(
+                lambda: upload(payload), rounds=max(3, rounds // (4 if size > 4 << 20 else 1))
+            )
+
+        for label, size in sizes:
+            url = f"/api/files/{download_ids[label]}/download"
+
+            async def download():
+                response = await client.get(url, headers=headers)
+                response.raise_for_status()
+
+            results[f"files.download.{label}"] = await measure_async(
+                download, rounds=max(3, rounds // (4 if size > 4 << 20 else 1))
+            )
+
+        # Listing is measured against a fixed-size library
+        response = await client.get("/api/files/", params={"limit": 1}, headers=headers)
+        for i in range(FILES_FOR_LISTING - response.json()["total"]):
+            await upload(b"x" * 128, f"small-{i}.zip")
+
+        for limit in (20, 100):
+            async def list_files():
+                response = await client.get("/api/files/", params={"limit": limit}, headers=headers)
+                response.raise_for_status()
+
+            results[f"files.list.{FILES_FOR_LISTING}_files.limit_{limit}"] = await measure_async(list_files, rounds)
+
+    return {f"e2e.{name}": stats for name, stats in results.items()}
+
+
+def run(rounds: int = 20) -> Dict[str, Any]:
+    import asyncio
+    return asyncio.run(_run(rounds))
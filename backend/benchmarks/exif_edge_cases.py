@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Image metadata from malformed EXIF.
+
+    python -m benchmarks.exif_edge_cases
+
+Writes a JPEG whose EXIF holds 0/0 rationals (in IFD0 and in the GPS IFD)
+and an oversized binary GPS tag, extracts its metadata in every
+binary-tag mode, and fails (exit 1) unless the result encodes as strict JSON
+(as JSONResponse does, without NaN), the 0/0 tags are left out and no GPS
+tag is None. Non-finite floats are checked directly too, since older
+Pillow versions turn 0/0 rationals into NaN rather than raising.
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+
+from .harness import isolate
+
+
+def make_malformed_jpeg(path: str) -> str:
+    from PIL import Image
+    from PIL.ExifTags import IFD
+    from PIL.TiffImagePlugin import IFDRational
+
+    exif = Image.Exif()
+    exif[0x011A] = IFDRational(0, 0)  # XResolution
+    exif[0x011B] = IFDRational(72, 1)  # YResolution
+    exif[IFD.GPSInfo] = {
+        0x0006: IFDRational(0, 0),  # GPSAltitude
+        0x001B: b"ASCII\x00\x00\x00" + b"x" * 200,  # GPSProcessingMethod
+        0x0012: "WGS-84",  # GPSMapDatum
+    }
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, "JPEG", exif=exif)
+    with open(path, "wb") as f:
+        f.write(buffer.getvalue())
+    return path
+
+
+def problems(metadata: dict, binary_tags: str):
+    try:
+        json.dumps(metadata, allow_nan=False)
+    except ValueError as e:
+        yield f"not strict JSON: {e}"
+    exif = metadata["exif"]
+    gps = exif.get("GPSInfo", {})
+    if "XResolution" in exif or "GPSAltitude" in gps:
+        yield "0/0 rational kept"
+    if exif.get("YResolution") != 72.0 or gps.get("GPSMapDatum") != "WGS-84":
+        yield "valid tags lost"
+    if any(value is None for value in gps.values()):
+        yield "None left in GPSInfo"
+    if binary_tags == "skip" and "GPSProcessingMethod" in gps:
+        yield "oversized binary tag not skipped"
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="sharedrop-exif-") as workdir:
+        isolate(workdir)
+        from app.image_metadata import BINARY_TAG_MODES, _jsonable, extract_image_metadata_fast
+
+        path = make_malformed_jpeg(os.path.join(workdir, "malformed.jpg"))
+        failures = 0
+        for binary_tags in BINARY_TAG_MODES:
+            found = list(problems(extract_image_metadata_fast(path, binary_tags=binary_tags), binary_tags))
+            failures += bool(found)
+            print(f"{binary_tags:<9} {'; '.join(found) or 'ok'}")
+        kept = [value for value in (float("nan"), float("inf")) if _jsonable(value, "truncate", 64) is not None]
+        failures += bool(kept)
+        print(f"{'floats':<9} {f'kept {kept}' if kept else 'ok'}")
+    if failures:
+        print(f"{failures} binary-tag mode(s) produced bad metadata", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
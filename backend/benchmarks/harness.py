@@ -0,0 +1,104 @@
+"""
+Timing, environment capture and result comparison shared by the suites.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def isolate(workdir: str):
+    """Point the app at scratch storage; must run before app.config is imported."""
+    os.environ["SECRET_KEY"] = os.environ.get("SECRET_KEY", "benchmark-secret")
+    os.environ["DB_ENGINE"] = "sqlite"
+    os.environ["DB_NAME"] = os.path.join(workdir, "bench.db")
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["EAGER_EXTRACTION"] = "false"
+    os.environ["EXTRACTION_PRELOAD"] = "false"
+    # Every virtual user shares one account; export ADMISSION_ENABLED=true to measure with the limits
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+
+def summarize(samples_ms) -> Dict[str, Any]:
+    """Statistics over per-call timings in milliseconds."""
+    ordered = sorted(samples_ms)
+    median = statistics.median(ordered)
+    return {
+        "rounds": len(ordered),
+        "min_ms": round(ordered[0], 4),
+        "median_ms": round(median, 4),
+        "mean_ms": round(statistics.fmean(ordered), 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "stdev_ms": round(statistics.stdev(ordered), 4) if len(ordered) > 1 else 0.0,
+        "ops_per_sec": round(1000 / median, 2) if median else None,
+    }
+
+
+def measure(fn: Callable[[], Any], rounds: int = 20, warmup: int = 2) -> Dict[str, Any]:
+    """Time fn() rounds times after warmup calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], rounds: int = 20, warmup: int = 2) -> Dict[str, Any]:
+    """Time await fn() rounds times after warmup calls."""
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def run_async(fn: Callable[[], Awaitable[Any]], rounds: int = 20, warmup: int = 2) -> Dict[str, Any]:
+    return asyncio.run(measure_async(fn, rounds, warmup))
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the machine and commit the results were produced on."""
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, timeout=10,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(path: str, results: Dict[str, Dict[str, Any]], meta: Optional[Dict[str, Any]] = None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta or environment(), "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10):
+    """Yield (name, baseline median, current median, relative change, regressed) per shared benchmark."""
+    old, new = baseline["results"], current["results"]
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name]["median_ms"], new[name]["median_ms"]
+        change = (after - before) / before if before else 0.0
+        yield name, before, after, change, change > threshold
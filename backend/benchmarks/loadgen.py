@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Load generator for capacity planning.
+
+    python -m benchmarks.loadgen --users 50 --duration 60
+    python -m benchmarks.loadgen --url http://127.0.0.1:8000 --token $TOKEN --scenario browse
+
+Each virtual user runs a scenario loop against the API: either the app
+in-process on scratch storage (the default), or a running server given by
+--url. Reports throughput and p50/p95/p99 latency per route.
+
+Scenarios pick weighted actions per iteration:
+    mixed    upload, list, download, share-link fetch and extraction
+    browse   list and download heavy, few uploads
+    upload   upload mix only
+    extract  PDF highlight and image metadata extraction
+    auth     register then log in, once per iteration
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from .harness import environment, isolate
+
+SCENARIOS = {
+    "mixed": {"upload": 2, "list": 4, "download": 4, "share": 1, "extract": 1},
+    "browse": {"upload": 1, "list": 6, "download": 8, "share": 2},
+    "upload": {"upload": 1},
+    "extract": {"upload": 1, "extract": 6},
+    "auth": {"auth": 1},
+}
+
+# (weight, size in bytes, kind) of the payloads an upload action picks from
+UPLOAD_MIX = [
+    (70, 16 * 1024, "zip"),
+    (15, 512 * 1024, "zip"),
+    (8, 0, "pdf"),
+    (5, 0, "jpeg"),
+    (2, 8 * 1024 * 1024, "zip"),
+]
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class Recorder:
+    """Latency samples and status codes per route."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async def request(self, client, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, type(e).__name__
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        self.statuses[route][status] += 1
+        return response
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        for route in sorted(self.latencies):
+            ordered = sorted(self.latencies[route])
+            statuses = self.statuses[route]
+            errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+            routes[route] = {
+                "requests": len(ordered),
+                "errors": errors,
+                "rps": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 0.50), 2),
+                "p95_ms": round(percentile(ordered, 0.95), 2),
+                "p99_ms": round(percentile(ordered, 0.99), 2),
+                "max_ms": round(ordered[-1], 2),
+                "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            }
+        total = sum(route["requests"] for route in routes.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(route["errors"] for route in routes.values()),
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+class Payloads:
+    """Upload bodies generated once and reused, so generation is not measured."""
+
+    def __init__(self, workdir: str, seed: int = 0):
+        from .corpus import make_image, make_pdf
+
+        rng = random.Random(seed)
+        self.bodies = {}
+        for _, size, kind in UPLOAD_MIX:
+            if kind == "pdf":
+                path = make_pdf(os.path.join(workdir, "load.pdf"), pages=4, highlights_per_page=6, seed=seed)
+                with open(path, "rb") as f:
+                    self.bodies[(kind, size)] = (f.read(), "application/pdf", "report.pdf")
+            elif kind == "jpeg":
+                path = make_image(os.path.join(workdir, "load.jpg"), "JPEG", size=(1600, 1200), seed=seed)
+                with open(path, "rb") as f:
+                    self.bodies[(kind, size)] = (f.read(), "image/jpeg", "photo.jpg")
+            else:
+                self.bodies[(kind, size)] = (rng.randbytes(size), "application/zip", f"archive-{size}.zip")
+        self.weights = [weight for weight, _, _ in UPLOAD_MIX]
+        self.keys = [(kind, size) for _, size, kind in UPLOAD_MIX]
+
+    def pick(self, rng: random.Random):
+        return self.bodies[rng.choices(self.keys, self.weights)[0]]
+
+
+class VirtualUser:
+    def __init__(self, client, recorder: Recorder, payloads: Payloads, headers: Dict, seed: int):
+        self.client = client
+        self.recorder = recorder
+        self.payloads = payloads
+        self.headers = headers
+        self.rng = random.Random(seed)
+        self.files: List[Dict] = []  # {"id", "content_type"} of files this user uploaded
+
+    async def call(self, route, method, url, **kwargs):
+        return await self.recorder.request(self.client, route, method, url, **kwargs)
+
+    async def upload(self):
+        body, content_type, name = self.payloads.pick(self.rng)
+        response = await self.call(
+            "POST /api/files/upload", "POST", "/api/files/upload",
+            files={"file": (name, body, content_type)}, headers=self.headers
+        )
+        if response is not None and response.status_code == 200:
+            data = response.json()["file"]
+            self.files.append({"id": data["id"], "content_type": content_type})
+
+    async def list(self):
+        await self.call("GET /api/files/", "GET", "/api/files/", params={"limit": 50}, headers=self.headers)
+
+    async def download(self):
+        if not self.files:
+            return await self.upload()
+        file = self.rng.choice(self.files)
+        await self.call(
+            "GET /api/files/{id}/download", "GET", f"/api/files/{file['id']}/download", headers=self.headers
+        )
+
+    async def share(self):
+        if not self.files:
+            return await self.upload()
+        file = self.rng.choice(self.files)
+        response = await self.call(
+            "POST /api/files/{id}/share", "POST", f"/api/files/{file['id']}/share", headers=self.headers
+        )
+        if response is not None and response.status_code == 200:
+            token = response.json()["share_token"]
+            await self.call("GET /api/files/shared/{token}", "GET", f"/api/files/shared/{token}")
+
+    async def extract(self):
+        candidates = [f for f in self.files if f["content_type"] in ("application/pdf", "image/jpeg")]
+        if not candidates:
+            body, content_type, name = self.payloads.bodies[("pdf", 0)]
+            response = await self.call(
+                "POST /api/files/upload", "POST", "/api/files/upload",
+                files={"file": (name, body, content_type)}, headers=self.headers
+            )
+            if response is None or response.status_code != 200:
+                return
+            candidates = [{"id": response.json()["file"]["id"], "content_type": content_type}]
+            self.files.extend(candidates)
+        file = self.rng.choice(candidates)
+        kind = "highlights" if file["content_type"] == "application/pdf" else "metadata"
+        await self.call(
+            f"POST /api/files/{{id}}/extract/{kind}", "POST", f"/api/files/{file['id']}/extract/{kind}",
+            headers=self.headers
+        )
+
+    async def auth(self):
+        name = f"load-{uuid.uuid4().hex[:12]}"
+        account = {"email": f"{name}@example.com", "username": name, "password": "load-test-password"}
+        await self.call("POST /api/auth/register", "POST", "/api/auth/register", json=account)
+        await self.call(
+            "POST /api/auth/login", "POST", "/api/auth/login",
+            json={"email": account["email"], "password": account["password"]}
+        )
+
+    async def run(self, scenario: Dict[str, int], deadline: float, iterations: Optional[int]):
+        actions, weights = list(scenario), list(scenario.values())
+        done = 0
+        while time.monotonic() < deadline and (iterations is None or done < iterations):
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+            done += 1
+
+
+async def login_or_register(client, email: str, password: str) -> Dict:
+    """Bearer headers for a load-test account, creating it on first use."""
+    username = email.split("@")[0]
+    await client.post("/api/auth/register", json={"email": email, "username": username, "password": password})
+    response = await client.post("/api/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def seed_account(email: str) -> Dict:
+    """Create the load-test account in the scratch database and mint its token.
+
+    Password hashing is deliberately slow and would dominate start-up; the
+    auth scenario still exercises it through the API.
+    """
+    from app.auth import create_access_token
+    from app.database import SessionLocal, engine
+    from app.models import Base, User
+    from app.search import ensure_search_index
+
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    db = SessionLocal()
+    try:
+        if db.query(User).filter(User.email == email).first() is None:
+            db.add(User(email=email, username=email.split("@")[0], hashed_password="!"))
+            db.commit()
+    finally:
+        db.close()
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+
+async def run_load(args, workdir: str) -> Dict:
+    import httpx
+
+    if args.url:
+        client_options = {"base_url": args.url.rstrip("/")}
+    else:
+        from app.main import app
+        client_options = {"app": app, "base_url": "http://loadgen"}
+        seeded = seed_account(args.email)
+
+    payloads = Payloads(workdir, args.seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout, **client_options) as client:
+        if args.token:
+            headers = {"Authorization": f"Bearer {args.token}"}
+        elif args.url:
+            headers = await login_or_register(client, args.email, args.password)
+        else:
+            headers = seeded
+
+        users = [
+            VirtualUser(client, recorder, payloads, headers, seed=args.seed + i)
+            for i in range(args.users)
+        ]
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        async def start(i, user):
+            # Spread user start-up over the ramp-up period
+            await asyncio.sleep(args.ramp_up * i / max(1, args.users))
+            await user.run(SCENARIOS[args.scenario], deadline, args.iterations)
+
+        await asyncio.gather(*(start(i, user) for i, user in enumerate(users)))
+        elapsed = time.monotonic() - started
+
+    report = recorder.report(elapsed)
+    report["scenario"] = args.scenario
+    report["users"] = args.users
+    report["target"] = args.url or "in-process"
+    if not args.url:
+        from app.config import settings
+        report["settings"] = {
+            "EXTRACTION_WORKERS": settings.EXTRACTION_WORKERS,
+            "EXTRACTION_TIMEOUT": settings.EXTRACTION_TIMEOUT,
+            "PAGE_CACHE_MAX_BYTES": settings.PAGE_CACHE_MAX_BYTES,
+            "DATABASE": settings.DATABASE_URL.split(":", 1)[0],
+        }
+    return report
+
+
+def print_report(report: Dict):
+    print(f"{report['scenario']} with {report['users']} users against {report['target']}: "
+          f"{report['requests']} requests in {report['elapsed_seconds']} s, "
+          f"{report['rps']} req/s, {report['errors']} errors")
+    if "settings" in report:
+        print("settings: " + ", ".join(f"{key}={value}" for key, value in report["settings"].items()))
+    width = max([len(route) for route in report["routes"]] + [5])
+    print(f"\n{'route':<{width}}  {'reqs':>6}  {'err':>4}  {'req/s':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'max ms':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<{width}}  {stats['requests']:>6}  {stats['errors']:>4}  {stats['rps']:>7.1f}  "
+              f"{stats['p50_ms']:>8.1f}  {stats['p95_ms']:>8.1f}  {stats['p99_ms']:>8.1f}  {stats['max_ms']:>8.1f}")
+        failures = {status: n for status, n in stats["statuses"].items() if not (status.isdigit() and int(status) < 400)}
+        if failures:
+            print(f"{'':<{width}}  failures: {failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the API with concurrent scripted users.")
+    parser.add_argument("--url", help="Base URL of a running server; default runs the app in-process")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("-u", "--users", type=int, default=20, help="Concurrent virtual users (default: 20)")
+    parser.add_argument("-d", "--duration", type=float, default=30, help="Seconds to run (default: 30)")
+    parser.add_argument("--iterations", type=int, help="Stop each user after this many actions")
+    parser.add_argument("--ramp-up", type=float, default=0, help="Seconds over which users start")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--token", help="Bearer token to use instead of registering a load-test account")
+    parser.add_argument("--email", default="loadgen@example.com")
+    parser.add_argument("--password", default="loadgen-password")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="sharedrop-load-") as workdir:
+        quiet = contextlib.nullcontext()
+        if not args.url:
+            isolate(workdir)
+            # The in-process extractor reports progress on stdout
+            quiet = contextlib.redirect_stdout(open(os.devnull, "w"))
+        with quiet:
+            report = asyncio.run(run_load(args, workdir))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": environment(), **report}, f, indent=2)
+            f.write("\n")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Microbenchmarks for the extraction and upload hot paths.
+"""
+
+import contextlib
+import os
+import tempfile
+from typing import Any, Dict
+
+from . import corpus
+from .harness import measure, run_async
+
+
+@contextlib.contextmanager
+def _quiet():
+    # The extractor reports progress on stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def bench_keywords(results: Dict[str, Any], rounds: int):
+    from app.extraction import extract_keywords_and_highlights
+
+    for words in (1_000, 20_000):
+        text = corpus.make_text(words)
+        results[f"keywords.extract_keywords_and_highlights.{words}_words"] = measure(
+            lambda: extract_keywords_and_highlights(text), rounds
+        )
+
+
+def bench_pdf_stages(results: Dict[str, Any], workdir: str, rounds: int):
+    from app.page_cache import PageCache
+    from app.pdf_extractor import PDFHighlightExtractor
+
+    painted = corpus.make_pdf(os.path.join(workdir, "painted.pdf"), pages=10, highlights_per_page=8)
+    annotated = corpus.make_pdf(
+        os.path.join(workdir, "annotated.pdf"), pages=10, highlights_per_page=8, mode="annotations"
+    )
+    rounds = max(3, rounds // 4)
+
+    def detect(path, **options):
+        def run():
+            with _quiet(), PDFHighlightExtractor(path, **options) as extractor:
+                extractor.detect_highlights()
+        return run
+
+    results["pdf.detect_highlights.painted_10_pages"] = measure(detect(painted), rounds)
+    results["pdf.detect_highlights.painted_10_pages.single_pass"] = measure(detect(painted, coarse_scale=None), rounds)
+    results["pdf.detect_highlights.annotations_10_pages"] = measure(detect(annotated), rounds)
+    cache = PageCache(256 * 1024 * 1024)
+    results["pdf.detect_highlights.painted_10_pages.page_cache_warm"] = measure(
+        detect(painted, page_cache=cache), rounds
+    )
+
+    with _quiet(), PDFHighlightExtractor(painted) as extractor:
+        extractor.detect_highlights()
+        detected = list(extractor.highlights)
+
+        def extract_text(layout):
+            def run():
+                for highlight in detected:
+                    highlight.blocks = []
+                with _quiet():
+                    extractor.extract_text_from_highlights(layout=layout)
+            return run
+
+        results["pdf.extract_text.page_layout"] = measure(extract_text("page"), rounds)
+        results["pdf.extract_text.clip"] = measure(extract_text("clip"), rounds)
+        results["pdf.format_output.markdown"] = measure(lambda: extractor.format_output("markdown"), rounds)
+        results["pdf.format_output.html"] = measure(lambda: extractor.format_output("html"), rounds)
+
+
+def bench_image_metadata(results: Dict[str, Any], workdir: str, rounds: int):
+    from app.extraction import extract_image_metadata
+
+    formats = ("JPEG", "PNG", "WEBP", "GIF")
+    paths = corpus.make_image_corpus(os.path.join(workdir, "images"), count=len(formats), formats=formats)
+    for image_format, path in zip(formats, paths):
+        results[f"image.extract_image_metadata.{image_format.lower()}"] = measure(
+            lambda: extract_image_metadata(path), rounds
+        )
+
+
+def bench_save_upload(results: Dict[str, Any], workdir: str, rounds: int):
+    from fastapi import UploadFile
+    from app.utils import save_upload_file
+
+    destination = os.path.join(workdir, "upload.bin")
+    for label, size in (("64KB", 64 * 1024), ("1MB", 1024 * 1024), ("16MB", 16 * 1024 * 1024)):
+        spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spooled.write(os.urandom(size))
+        upload = UploadFile(file=spooled, filename="upload.bin")
+
+        async def save():
+            await upload.seek(0)
+            await save_upload_file(upload, destination)
+
+        results[f"upload.save_upload_file.{label}"] = run_async(save, rounds=max(3, rounds // (4 if size > 4 << 20 else 1)))
+        spooled.close()
+    os.remove(destination)
+
+
+def run(workdir: str, rounds: int = 20) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    bench_keywords(results, rounds)
+    bench_pdf_stages(results, workdir, rounds)
+    bench_image_metadata(results, workdir, rounds)
+    bench_save_upload(results, workdir, rounds)
+    return {f"micro.{name}": stats for name, stats in results.items()}
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+SQL query budgets per route.
+
+    python -m benchmarks.query_budget
+
+Runs each route once in-process against scratch storage and fails (exit 1)
+when it issues more statements than its budget, listing the statements, so
+an added lazy load or per-row query is caught before it ships. When a change
+legitimately needs another query, raise the budget here in the same commit.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+
+from .harness import isolate
+
+# (method, path, budget); {file}, {pdf}, {image} and {token} are filled in from the fixtures
+BUDGETS = [
+    ("GET", "/api/auth/me", 1),
+    ("GET", "/api/files/", 3),
+    ("GET", "/api/files/{file}", 2),
+    ("GET", "/api/files/{file}/download", 2),
+    ("PUT", "/api/files/{file}/rename", 4),
+    ("POST", "/api/files/{pdf}/share", 4),
+    ("GET", "/api/files/shared/{token}", 1),
+    ("GET", "/api/me/storage", 2),
+    ("GET", "/api/search/?q=budget", 2),
+    ("POST", "/api/files/{image}/extract/metadata", 6),
+    ("POST", "/api/files/{image}/extract/metadata", 3),  # stored result
+    ("POST", "/api/files/{pdf}/extract/highlights", 8),
+    ("POST", "/api/files/{pdf}/extract/highlights", 3),  # stored result
+    ("GET", "/api/files/{pdf}/highlights", 3),
+    ("GET", "/api/files/{pdf}/extraction-info", 3),
+    ("POST", "/api/files/upload/check", 2),
+    ("POST", "/api/files/upload", 4),
+    ("DELETE", "/api/files/{file}", 6),
+]
+
+# Request bodies for the routes that need one
+BODIES = {
+    "/api/files/{file}/rename": {"data": {"new_name": "renamed.zip"}},
+    "/api/files/upload/check": {"json": {"sha256": "0" * 64, "size": 128, "filename": "small.zip", "content_type": "application/zip"}},
+    "/api/files/upload": {"files": {"file": ("small.zip", b"x" * 128, "application/zip")}},
+}
+
+
+async def run(workdir: str) -> int:
+    import httpx
+    from app.main import app
+    from app.query_stats import QueryBudgetExceeded, query_budget
+    from . import corpus
+    from .loadgen import seed_account
+
+    headers = seed_account("budget@example.com")
+    pdf = corpus.make_pdf(os.path.join(workdir, "budget.pdf"), pages=2, highlights_per_page=4)
+    image = corpus.make_image(os.path.join(workdir, "budget.jpg"))
+
+    async with httpx.AsyncClient(app=app, base_url="http://budget") as client:
+        async def upload(path, content_type):
+            with open(path, "rb") as f:
+                response = await client.post(
+                    "/api/files/upload",
+                    files={"file": (os.path.basename(path), f.read(), content_type)},
+                    headers=headers
+                )
+            response.raise_for_status()
+            return response.json()["file"]["id"]
+
+        fixtures = {
+            "file": await upload(pdf, "application/zip"),
+            "pdf": await upload(pdf, "application/pdf"),
+            "image": await upload(image, "image/jpeg"),
+        }
+        response = await client.post(f"/api/files/{fixtures['file']}/share", headers=headers)
+        fixtures["token"] = response.json()["share_token"]
+
+        failures = 0
+        for method, path, budget in BUDGETS:
+            url = path.format(**fixtures)
+            try:
+                # The extractor reports progress on stdout
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), query_budget(budget) as stats:
+                    response = await client.request(method, url, headers=headers, **BODIES.get(path, {}))
+                outcome = "ok"
+            except QueryBudgetExceeded as e:
+                outcome, failures = f"OVER BUDGET\n{e}", failures + 1
+            if response.status_code >= 400:
+                outcome, failures = f"HTTP {response.status_code}: {response.text[:200]}", failures + 1
+            print(f"{method:<6} {path:<45} {stats.count:>3} / {budget:<3} {outcome}")
+    return failures
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="sharedrop-budget-") as workdir:
+        isolate(workdir)
+        failures = asyncio.run(run(workdir))
+    if failures:
+        print(f"{failures} route(s) over budget or failing", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
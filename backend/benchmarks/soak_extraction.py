@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Extraction soak benchmark.
+Runs highlight extraction over a synthetic PDF thousands of times and checks
+that worker memory stays flat.
+
+    python -m benchmarks.soak_extraction --iterations 5000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from app.page_cache import PageCache
+from app.memory import current_rss_bytes
+from app.pdf_extractor import PDFHighlightExtractor
+
+from .corpus import make_pdf
+
+MB = 1024 * 1024
+
+
+def slope_per_thousand(samples):
+    """Least-squares RSS growth in MB per 1000 iterations."""
+    xs = [i for i, _ in samples]
+    ys = [rss / MB for _, rss in samples]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if not var_x:
+        return 0.0
+    return 1000 * sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def soak(pdf_path: str, iterations: int, sample_every: int, page_cache_mb: int, max_render_pixels: int):
+    cache = PageCache(page_cache_mb * MB) if page_cache_mb else None
+    samples = []
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        for i in range(1, iterations + 1):
+            # Vary the tolerance so cached renders are re-thresholded, as colour re-runs are
+            with contextlib.redirect_stdout(devnull), PDFHighlightExtractor(
+                pdf_path,
+                tolerance=40 + i % 3 * 10,
+                page_cache=cache,
+                max_render_pixels=max_render_pixels or None
+            ) as extractor:
+                extractor.extract()
+            if i % sample_every == 0:
+                samples.append((i, current_rss_bytes()))
+    elapsed = time.perf_counter() - started
+    return samples, elapsed, cache.stats() if cache else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that repeated highlight extraction keeps RSS flat.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--sample-every", type=int, default=50)
+    parser.add_argument("--warmup", type=float, default=0.1, help="Fraction of iterations ignored while caches fill")
+    parser.add_argument("--page-cache-mb", type=int, default=64, help="Page cache budget; 0 disables it")
+    parser.add_argument("--max-pixels", type=int, default=4_000_000, help="Tiling budget; 0 disables tiling")
+    parser.add_argument("--max-growth-mb", type=float, default=16.0, help="Allowed RSS growth after warm-up")
+    parser.add_argument("--pdf", help="PDF to extract instead of the synthetic one")
+    parser.add_argument("-o", "--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    if not current_rss_bytes():
+        print("RSS is not readable on this platform (needs /proc)", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(tmp, "soak.pdf")
+            # The poster page is large enough to exercise tiled rendering
+            make_pdf(pdf_path, pages=6, highlights_per_page=7, poster=True)
+        samples, elapsed, cache_stats = soak(
+            pdf_path, args.iterations, args.sample_every, args.page_cache_mb, args.max_pixels
+        )
+
+    steady = [s for s in samples if s[0] > args.iterations * args.warmup] or samples
+    growth = (steady[-1][1] - steady[0][1]) / MB
+    report = {
+        "iterations": args.iterations,
+        "seconds": round(elapsed, 2),
+        "extractions_per_second": round(args.iterations / elapsed, 2),
+        "rss_start_mb": round(steady[0][1] / MB, 1),
+        "rss_end_mb": round(steady[-1][1] / MB, 1),
+        "rss_peak_mb": round(max(rss for _, rss in samples) / MB, 1),
+        "rss_growth_mb": round(growth, 1),
+        "rss_slope_mb_per_1000": round(slope_per_thousand(steady), 2),
+        "page_cache": cache_stats,
+        "passed": growth <= args.max_growth_mb,
+    }
+
+    payload = json.dumps(report, indent=2)
+    print(payload)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
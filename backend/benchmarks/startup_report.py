@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+API startup report.
+Imports app.main in fresh interpreters and reports import time, resident
+memory, the slowest modules, and what loading the extraction backends adds.
+
+    python -m benchmarks.startup_report --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MB = 1024 * 1024
+
+# Runs in a child interpreter so every measurement starts cold
+PROBE = r"""
+import json, os, sys, time
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+baseline = rss()
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+app_rss = rss()
+heavy = sorted(m for m in ("magic", "PIL", "PyPDF2", "fitz", "pypdfium2", "numpy", "cv2") if m in sys.modules)
+
+from app.extraction import preload_extraction_backends
+preload_started = time.perf_counter()
+preload_extraction_backends()
+preloaded = time.perf_counter()
+
+print(json.dumps({
+    "interpreter_rss": baseline,
+    "import_seconds": imported - started,
+    "app_rss": app_rss,
+    "heavy_modules_at_startup": heavy,
+    "preload_seconds": preloaded - preload_started,
+    "preloaded_rss": rss(),
+}))
+"""
+
+
+def parse_importtime(stderr: str):
+    """Yield (module, self microseconds, cumulative microseconds) from -X importtime output."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        yield name.strip(), int(self_us), int(cumulative_us)
+
+
+def probe_once(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1]), list(parse_importtime(result.stderr))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report API import time and memory at startup.")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts to measure; medians are reported")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list by self time")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/statm"):
+        print("RSS is not readable on this platform (needs /proc)", file=sys.stderr)
+        return 2
+
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    runs, modules = [], {}
+    for _ in range(args.runs):
+        run, timings = probe_once(env)
+        runs.append(run)
+        for name, self_us, cumulative_us in timings:
+            modules.setdefault(name, []).append((self_us, cumulative_us))
+
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    slowest = sorted(
+        ((name, statistics.median(t[0] for t in times), statistics.median(t[1] for t in times))
+         for name, times in modules.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    report = {
+        "runs": args.runs,
+        "import_ms": round(median("import_seconds") * 1000, 1),
+        "rss_after_import_mb": round(median("app_rss") / MB, 1),
+        "rss_added_by_app_mb": round((median("app_rss") - median("interpreter_rss")) / MB, 1),
+        "heavy_modules_at_startup": runs[-1]["heavy_modules_at_startup"],
+        "extraction_preload_ms": round(median("preload_seconds") * 1000, 1),
+        "rss_after_preload_mb": round(median("preloaded_rss") / MB, 1),
+        "slowest_modules": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for name, self_us, cumulative_us in slowest
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"Cold starts measured:        {report['runs']}")
+    print(f"import app.main:             {report['import_ms']} ms")
+    print(f"RSS after import:            {report['rss_after_import_mb']} MB "
+          f"(+{report['rss_added_by_app_mb']} MB over the bare interpreter)")
+    print(f"Extraction libs at startup:  {', '.join(report['heavy_modules_at_startup']) or 'none'}")
+    print(f"Loading extraction backends: +{report['extraction_preload_ms']} ms, "
+          f"RSS {report['rss_after_preload_mb']} MB")
+    print("\nSlowest modules by self time (app import and backend preload):")
+    for module in report["slowest_modules"]:
+        print(f"  {module['self_ms']:>8.1f} ms  {module['cumulative_ms']:>8.1f} ms cumulative  {module['module']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,14 +4,20 @@ Database initialization script.
 Run this to create the database tables.
 """
 
+from app.compression import ensure_storage_encoding_column
 from app.database import engine
 from app.models import Base
+from app.dedup import ensure_content_hash_column
+from app.search import ensure_search_index
 import os
 
 def create_database():
     """Create all database tables."""
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    ensure_content_hash_column(engine)
+    ensure_storage_encoding_column(engine)
+    ensure_search_index(engine)
     print("Database tables created successfully!")
     
     # Create uploads directory
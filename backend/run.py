@@ -2,12 +2,14 @@
 """
 Development server runner.
 Use this to start the FastAPI development server.
+For production use `python -m app.server` (see app/server.py).
 """
 
 import uvicorn
-from app.main import app
+from create_db import create_database
 
 if __name__ == "__main__":
+    create_database()
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",